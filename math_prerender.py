@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Build-Time Math Pre-Rendering
+Converts every \\( … \\), \\[ … \\], $…$ and $$…$$ expression in the chapter
+pages and MCQ text to static MathML, memoised by expression hash, so pages
+and quiz bundles whose maths all rendered can drop MathJax
+"""
+
+import os
+import re
+import sys
+import json
+import html
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from mcq_latex import normalise_text
+
+try:
+    from latex2mathml.converter import convert as latex2mathml_convert
+    from importlib.metadata import version as package_version
+    RENDERER = f"latex2mathml-{package_version('latex2mathml')}"
+except ImportError:
+    latex2mathml_convert = None  # Nothing is pre-rendered; pip install latex2mathml
+    RENDERER = None
+
+# Blocks that are never typeset, then display and inline maths in MathJax's order.
+# A $ escaped as \$ is text, as MathJax's processEscapes treats it
+MATH = re.compile(
+    r'(<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->)'
+    r'|\$\$(.+?)\$\$|\\\[(.+?)\\\]|\\\((.+?)\\\)|(?<![\\$])\$([^$]+?)(?<!\\)\$',
+    re.S | re.I
+)
+
+HTML_TAG = re.compile(r'<[A-Za-z/!]')
+
+# The MathJax config and loader, dropped from pages with nothing left to typeset
+MATHJAX_TAGS = re.compile(
+    r'[ \t]*(?:<!--[^>]*MathJax[^>]*-->|<script>\s*window\.MathJax\s*=.*?</script>'
+    r'|<script[^>]*id="MathJax-script"[^>]*></script>)[ \t]*\n?',
+    re.S
+)
+
+
+class MathRenderer:
+    """TeX → MathML with a persistent memo keyed by a hash of the expression.
+
+    Failures are memoised too (as ''), so an expression latex2mathml can't
+    take, or that comes back with a command it doesn't know (\\ce{...}),
+    costs one attempt per renderer version and is left as TeX for MathJax."""
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.expressions: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+                if cache.get('renderer') == RENDERER:
+                    self.expressions = cache.get('expressions', {})
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def expression_key(tex: str, display: bool) -> str:
+        return hashlib.sha256(f"{'block' if display else 'inline'}\0{tex}".encode('utf-8')).hexdigest()[:20]
+
+    def render(self, tex: str, display: bool = False) -> Optional[str]:
+        """MathML for one expression, or None if it can't be pre-rendered"""
+        if latex2mathml_convert is None:
+            return None
+        key = self.expression_key(tex, display)
+        with self._lock:
+            mathml = self.expressions.get(key)
+        if mathml is not None:
+            self.hits += 1
+            return mathml or None
+
+        self.misses += 1
+        try:
+            mathml = latex2mathml_convert(tex.strip(), display='block' if display else 'inline')
+        except Exception:
+            mathml = ''
+        if '\\' in mathml:
+            mathml = ''  # An unsupported command came through verbatim
+        if not mathml:
+            self.failures += 1
+
+        with self._lock:
+            self.expressions[key] = mathml
+            self.dirty = True
+        return mathml or None
+
+    def render_text(self, text: str, escaped: bool = False) -> Tuple[str, int, int]:
+        """Replace every expression in text with MathML; returns (text, rendered, left as TeX).
+        escaped: the text is HTML, so entities in TeX are decoded first and tags mean it isn't maths"""
+        counts = [0, 0]
+
+        def replace(match) -> str:
+            skipped, display_dollars, display_brackets, inline_parens, inline_dollar = match.groups()
+            if skipped:
+                return skipped
+            tex = display_dollars or display_brackets or inline_parens or inline_dollar
+            if escaped:
+                if HTML_TAG.search(tex):
+                    counts[1] += 1
+                    return match.group(0)
+                tex = html.unescape(tex)
+
+            mathml = self.render(tex, display=bool(display_dollars or display_brackets))
+            counts[0 if mathml else 1] += 1
+            return mathml or match.group(0)
+
+        if '$' not in text and '\\' not in text:
+            return text, 0, 0
+        return MATH.sub(replace, text), counts[0], counts[1]
+
+    def render_mcq(self, mcq: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """A copy of an MCQ with its question, options and explanation pre-rendered
+        (LaTeX damaged by JSON decoding is repaired first), and how many
+        expressions were left as TeX"""
+        rendered = dict(mcq)
+        left = 0
+        for field in ('question', 'explanation'):
+            if isinstance(mcq.get(field), str):
+                rendered[field], _, failed = self.render_text(normalise_text(mcq[field]))
+                left += failed
+        if isinstance(mcq.get('options'), dict):
+            rendered['options'] = {}
+            for label, value in mcq['options'].items():
+                if isinstance(value, str):
+                    value, _, failed = self.render_text(normalise_text(value))
+                    left += failed
+                rendered['options'][label] = value
+        return rendered, left
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'renderer': RENDERER, 'expressions': self.expressions}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+
+
+def prerender_page(renderer: MathRenderer, source: Path, target: Path) -> Tuple[int, int]:
+    """Write source to target with its maths pre-rendered; MathJax is dropped
+    if nothing is left to typeset. Returns (rendered, left as TeX)"""
+    content = source.read_text(encoding='utf-8')
+    content, rendered, left = renderer.render_text(content, escaped=True)
+    if left == 0:
+        content = MATHJAX_TAGS.sub('', content)
+
+    if not target.exists() or target.read_text(encoding='utf-8') != content:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + '.tmp')
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, target)
+    return rendered, left
+
+
+def main():
+    # math_prerender.py [site_root] [out_dir]; out_dir defaults to <site_root>/dist, which Vercel serves.
+    # npm run build runs this after vite build, which empties dist
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else '.').resolve()
+    out_dir = Path(sys.argv[2]).resolve() if len(sys.argv) > 2 else root / 'dist'
+
+    print("🧮 Math Pre-Rendering")
+    print("=" * 40)
+    if latex2mathml_convert is None:
+        # The pages are still copied, so the served site has them, with MathJax
+        print("⚠️ latex2mathml not installed, copying pages as TeX. Run: pip install latex2mathml")
+
+    started = time.time()
+    renderer = MathRenderer(str(root / '.mcq_cache' / 'mathml.json'))
+    pages = sorted(page for book_dir in root.glob('*books') if book_dir.is_dir()
+                   for page in book_dir.glob('*.html'))
+
+    static_pages = 0
+    total_rendered = 0
+    for page in pages:
+        relative = page.relative_to(root)
+        rendered, left = prerender_page(renderer, page, out_dir / relative)
+        total_rendered += rendered
+        if left:
+            print(f"• {relative}: {rendered} rendered, {left} left for MathJax")
+        else:
+            static_pages += 1
+    renderer.save()
+
+    print(f"\n📊 {len(pages)} pages: {static_pages} without MathJax, {total_rendered} expressions rendered "
+          f"({renderer.hits} cached, {renderer.misses} converted, {renderer.failures} unsupported) "
+          f"in {time.time() - started:.2f}s")
+    print(f"💾 Pages: {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Preprocessed PDF Artifact Cache
+Keeps compressed and split chapter PDFs in one cache directory, keyed by the
+source PDF's hash and the processing parameters, with a JSON manifest for
+invalidation and size-capped LRU eviction
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from mcq_upload_registry import file_sha256
+
+# Derivatives older runs wrote next to the source books; never chapters themselves
+DERIVATIVE_PDF = re.compile(r'_(?:compressed|chunk\d+)\.pdf$')
+
+
+def is_derivative_pdf(filename: str) -> bool:
+    return bool(DERIVATIVE_PDF.search(filename))
+
+
+class ArtifactCache:
+    """Manifest-indexed store of files derived from a source PDF.
+
+    An entry is valid while its files exist with the recorded sizes. Storing
+    a new entry drops older ones for the same source path and parameters
+    (the source changed), then evicts least recently used entries until
+    the cache fits max_bytes."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 4 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._hashes: Dict[Tuple[str, float, int], str] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the manifest from disk"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def save(self):
+        """Atomically write the manifest to disk"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def source_hash(self, source_path: str) -> str:
+        """Content hash of a source PDF, memoised on (path, mtime, size)"""
+        stat = os.stat(source_path)
+        cache_key = (os.path.abspath(source_path), stat.st_mtime, stat.st_size)
+        if cache_key not in self._hashes:
+            self._hashes[cache_key] = file_sha256(source_path)
+        return self._hashes[cache_key]
+
+    def entry_key(self, source_path: str, params: Dict[str, Any]) -> str:
+        payload = json.dumps({'source': self.source_hash(source_path), 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def work_dir(self, source_path: str, params: Dict[str, Any]) -> str:
+        """Empty directory to write an entry's files into before store()"""
+        path = os.path.join(self.cache_dir, self.entry_key(source_path, params))
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+    def lookup(self, source_path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The cached entry for a source and parameters, or None if missing or damaged"""
+        key = self.entry_key(source_path, params)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            entry_dir = os.path.join(self.cache_dir, key)
+            for name, size in entry['files'].items():
+                path = os.path.join(entry_dir, name)
+                if not os.path.exists(path) or os.path.getsize(path) != size:
+                    self.drop(key)
+                    self.save()
+                    return None
+
+            entry['last_access'] = time.time()
+            self.save()
+            return dict(entry, dir=entry_dir)
+
+    def path(self, entry: Dict[str, Any], name: str) -> str:
+        return os.path.join(entry['dir'], name)
+
+    def store(self, source_path: str, params: Dict[str, Any], meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the files now in work_dir() as the entry for this source and parameters"""
+        key = self.entry_key(source_path, params)
+        entry_dir = os.path.join(self.cache_dir, key)
+        files = {name: os.path.getsize(os.path.join(entry_dir, name)) for name in sorted(os.listdir(entry_dir))}
+        source = os.path.abspath(source_path)
+
+        with self._lock:
+            stale = [k for k, e in self.entries.items()
+                     if k != key and e['source'] == source and e['params'] == params]
+            for stale_key in stale:
+                self.drop(stale_key)
+
+            now = time.time()
+            self.entries[key] = {
+                'source': source,
+                'source_hash': self.source_hash(source_path),
+                'params': params,
+                'files': files,
+                'size': sum(files.values()),
+                'meta': meta,
+                'created': now,
+                'last_access': now,
+            }
+            self.evict(keep=key)
+            self.save()
+            return dict(self.entries[key], dir=entry_dir)
+
+    def drop(self, key: str):
+        """Remove an entry and its files (caller holds the lock and saves)"""
+        self.entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def evict(self, keep: str = None):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        total = sum(e['size'] for e in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entry['size']
+            self.drop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': sum(e['size'] for e in self.entries.values()),
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Adaptive Batch Sizing for MCQ Requests
+Learns per subject how many MCQs fit in one response from observed output
+tokens, truncations and parse success, and grows or shrinks the request size
+to get the most valid MCQs per API call without hitting max_output_tokens
+"""
+
+import os
+import json
+import math
+import threading
+from typing import Dict, Any, Optional
+
+# Gemini 1.5 Flash's default output cap when generation_config doesn't set one
+DEFAULT_OUTPUT_TOKEN_LIMIT = 8192
+
+
+class BatchSizeController:
+    """Per-subject request size, adjusted after every live API call.
+
+    Clean responses grow the size by half (capped by the token budget the
+    learned tokens-per-MCQ allows); a truncated response drops it to what
+    actually fitted, and poor parse success shrinks it. A larger size is only
+    tried again if it didn't previously yield fewer valid MCQs per second."""
+
+    def __init__(self, state_path: str, output_token_limit: int = DEFAULT_OUTPUT_TOKEN_LIMIT,
+                 initial_size: int = 5, min_size: int = 3, max_size: int = 50,
+                 headroom: float = 0.85, smoothing: float = 0.3):
+        self.state_path = state_path
+        self.output_token_limit = output_token_limit
+        self.initial_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.headroom = headroom      # Fraction of the output limit a batch may plan to use
+        self.smoothing = smoothing    # Weight of the newest observation in moving averages
+
+        self.subjects: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load learned sizes from disk"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.subjects = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.subjects = {}
+
+    def save(self):
+        """Atomically write learned sizes to disk"""
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.subjects, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def state(self, subject: str) -> Dict[str, Any]:
+        return self.subjects.setdefault(subject.lower(), {
+            'size': self.initial_size,
+            'tokens_per_mcq': None,
+            'parse_rate': 1.0,
+            'mcqs_per_second': {},  # Request size -> moving average of valid MCQs/s
+            'requests': 0,
+            'truncations': 0,
+            'salvages': 0,
+        })
+
+    def average(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.smoothing * (new - old)
+
+    def capacity(self, state: Dict[str, Any]) -> int:
+        """Largest request the learned tokens-per-MCQ says will fit"""
+        if not state['tokens_per_mcq']:
+            return self.max_size
+        fit = int(self.output_token_limit * self.headroom / state['tokens_per_mcq'])
+        return max(self.min_size, min(self.max_size, fit))
+
+    def request_size(self, subject: str, remaining: int) -> int:
+        """MCQs to ask for in the next request of a chapter"""
+        with self._lock:
+            size = self.state(subject)['size']
+        return max(1, min(size, remaining))
+
+    def request_budget(self, subject: str, target: int) -> int:
+        """Most requests a chapter may spend reaching its target: twice the expected number"""
+        with self._lock:
+            state = self.state(subject)
+            expected_per_call = max(1.0, state['size'] * state['parse_rate'])
+        return max(3, 2 * math.ceil(target / expected_per_call))
+
+    def observe(self, subject: str, requested: int, parsed: int, output_tokens: Optional[int],
+                truncated: bool, salvaged: bool, seconds: float):
+        """Record the outcome of one live request and adapt the subject's size"""
+        with self._lock:
+            state = self.state(subject)
+            state['requests'] += 1
+            state['parse_rate'] = self.average(state['parse_rate'], min(1.0, parsed / max(1, requested)))
+
+            if output_tokens and parsed:
+                # A truncated response also spent tokens on the object it was cut off in
+                per_mcq = output_tokens / (parsed + 1 if truncated else parsed)
+                state['tokens_per_mcq'] = self.average(state['tokens_per_mcq'], per_mcq)
+            elif truncated and parsed:
+                state['tokens_per_mcq'] = self.average(state['tokens_per_mcq'],
+                                                       self.output_token_limit / (parsed + 1))
+
+            rates = state['mcqs_per_second']
+            if seconds > 0:
+                rates[str(requested)] = self.average(rates.get(str(requested)), parsed / seconds)
+
+            size = state['size']
+            reason = 'clean'
+            if truncated:
+                reason = 'truncated'
+                state['truncations'] += 1
+                size = min(size, parsed) if parsed else size // 2
+            elif salvaged or state['parse_rate'] < 0.8:
+                reason = 'salvaged' if salvaged else 'low parse rate'
+                state['salvages'] += int(salvaged)
+                size = int(size * 0.8)
+            elif requested >= size:
+                grown = min(self.capacity(state), size + max(1, size // 2))
+                known_rate = rates.get(str(grown))
+                current_rate = rates.get(str(size))
+                if known_rate is None or current_rate is None or known_rate >= 0.9 * current_rate:
+                    size = grown
+
+            size = max(self.min_size, min(self.max_size, self.capacity(state), size))
+            if size != state['size']:
+                print(f"📐 {subject}: batch size {state['size']} → {size} ({reason})")
+                state['size'] = size
+
+            self.save()
+
+    def stats(self, subject: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.state(subject))
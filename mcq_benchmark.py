@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""
+Offline MCQ Throughput Benchmark
+Runs the full concurrent corpus pipeline against a local stand-in for the
+Gemini upload, get-file and generateContent endpoints, with configurable
+latency, PROCESSING delays, 429s and damaged responses, and reports MCQs per
+minute, batch latency percentiles, wasted requests and parse failures
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import datetime
+import tempfile
+import threading
+import contextlib
+from collections import deque
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional
+
+try:
+    import fitz
+except ImportError:
+    print("❌ PyMuPDF not installed. Run: pip install PyMuPDF")
+    exit(1)
+
+from mcq_stream_parser import IncrementalMCQParser
+
+# Simulated seconds unless noted; time_scale maps them onto wall-clock time
+DEFAULT_SCENARIO = {
+    'seed': 1234,
+    'time_scale': 0.01,          # Wall seconds per simulated second
+    'ingest_mode': 'upload',     # Or 'text'
+    'keys': 6,
+    'invalid_keys': 1,           # Leading keys the server rejects as invalid
+    'chapters_per_subject': 10,
+    'pages_per_chapter': 6,
+    'target_mcqs_per_chapter': 50,
+    'upload_latency': 2.0,
+    'processing_delay': 8.0,     # Time an upload stays PROCESSING
+    'first_token_latency': 1.5,
+    'tokens_per_second': 180,
+    'latency_jitter': 0.25,      # ± fraction applied to every latency
+    'tokens_per_mcq': 190,
+    'max_output_tokens': 8192,
+    'server_rpm': 15,            # Per-key limit; calls over it get a 429
+    'rate_limit_rate': 0.02,     # Extra 429s injected at random
+    'truncate_rate': 0.03,       # Responses cut off early with MAX_TOKENS
+    'malformed_rate': 0.05,      # Responses with one unparseable MCQ object
+    'invalid_rate': 0.02,        # MCQs that parse but fail validation (answer not among the options)
+    'payload': None,             # Chapter JSON file of canned MCQs; synthetic if None
+}
+
+# The production corpus layout, named as simple_mcq_generator.main() names it
+BENCHMARK_SUBJECTS = [
+    ('chemistry', 'chemistry_chapters', 'XI'),
+    ('physics', 'physics_chapters', 'XI'),
+    ('biology', 'biology_chapters', 'XI'),
+    ('mathematics', 'math_chapters', 'XI'),
+    ('chemistry', 'chemistryXII_chapters', 'XII'),
+    ('physics', 'physicsXII_chapters', 'XII'),
+    ('biology', 'biologyXII_chapters', 'XII'),
+    ('mathematics', 'mathsXII_chapters', 'XII'),
+]
+
+VOCABULARY = """
+acid base salt ion atom bond orbital electron proton neutron isotope mole
+molarity enthalpy entropy equilibrium catalyst oxidation reduction polymer
+alkane alkene benzene velocity acceleration momentum force torque inertia
+friction energy power wave frequency amplitude resonance charge field current
+voltage resistance capacitor magnet flux photon lens mirror refraction cell
+tissue enzyme protein lipid membrane nucleus mitosis meiosis gene allele
+chromosome photosynthesis respiration hormone neuron kidney digestion
+ecosystem species vector matrix determinant limit derivative integral series
+sequence function domain range parabola ellipse hyperbola tangent normal slope
+gradient probability permutation combination logarithm exponent polynomial
+root theorem identity angle triangle circle sphere volume area temperature
+pressure gas liquid solid crystal lattice solution solvent solute rate order
+""".split()
+
+REQUESTED_COUNT = re.compile(r'EXACTLY (\d+)')
+
+
+class ResourceExhausted(Exception):
+    """429 from the local server (named like the google.api_core error)"""
+
+
+class InvalidArgument(Exception):
+    """400 from the local server"""
+
+
+class NotFound(Exception):
+    """404 from the local server"""
+
+
+class FailedPrecondition(Exception):
+    """400 for a file that isn't ACTIVE"""
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def synthetic_mcq(rng: random.Random) -> Dict[str, Any]:
+    """A plausible, unique MCQ; distinct word choices keep dedup from merging them"""
+    words = rng.sample(VOCABULARY, 12)
+    options = {letter: f"The {words[4 + i]} of the {words[8 + i]}" for i, letter in enumerate('ABCD')}
+    return {
+        'question': f"Which statement relates the {words[0]} and {words[1]} of a {words[2]} "
+                    f"when the {words[3]} is $x^{{{rng.randint(2, 9)}}}$?",
+        'options': options,
+        'correct_answer': rng.choice('ABCD'),
+        'explanation': f"The {words[0]} depends on the {words[1]} through the {words[2]}.",
+        'difficulty': rng.choice(('easy', 'medium', 'hard')),
+        'topic': words[0],
+        'subtopic': words[1],
+    }
+
+
+class LocalGeminiServer:
+    """In-process stand-in for the Gemini file and generation endpoints.
+
+    Every response is shaped like the SDK's (file handles with state and
+    expiration_time; streamed chunks with text, the last carrying
+    usage_metadata and finish_reason), so the generators run unmodified.
+    Each call's outcome is recorded for the report."""
+
+    def __init__(self, scenario: Dict[str, Any], invalid_keys: List[str] = ()):
+        self.scenario = scenario
+        self.time_scale = scenario['time_scale']
+        self.invalid_keys = set(invalid_keys)
+        self.rng = random.Random(scenario['seed'])  # Faults; drawn in arrival order
+        self.payload = None
+        if scenario.get('payload'):
+            with open(scenario['payload'], 'r', encoding='utf-8') as f:
+                self.payload = [mcq for mcq in json.load(f) if isinstance(mcq, dict)]
+
+        self.started = time.monotonic()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.recent: Dict[str, deque] = {}  # Per-key generate timestamps in the last minute
+        self.calls: List[Dict[str, Any]] = []
+        self.repeats: Dict[str, int] = {}
+        self.counters = {'uploads': 0, 'file_polls': 0, 'deletes': 0}
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Simulated seconds since the server started"""
+        return (time.monotonic() - self.started) / self.time_scale
+
+    def sleep(self, seconds: float):
+        jitter = self.scenario['latency_jitter']
+        with self._lock:
+            seconds *= 1 + self.rng.uniform(-jitter, jitter)
+        time.sleep(max(0.0, seconds) * self.time_scale)
+
+    def client(self, api_key: str, key_index: int, model_name: str = 'gemini-1.5-flash',
+               generation_config: Optional[Dict[str, Any]] = None) -> 'LocalGeminiClient':
+        """KeyPool client_factory"""
+        return LocalGeminiClient(self, api_key, key_index)
+
+    def check_key(self, api_key: str):
+        if api_key in self.invalid_keys:
+            raise InvalidArgument('400 API key not valid. Please pass a valid API key. [reason: "API_KEY_INVALID"]')
+
+    def file_handle(self, name: str) -> SimpleNamespace:
+        entry = self.files[name]
+        state = 'ACTIVE' if self.now() >= entry['ready_at'] else 'PROCESSING'
+        return SimpleNamespace(
+            name=name,
+            display_name=entry['display_name'],
+            state=SimpleNamespace(name=state),
+            expiration_time=entry['expiration_time'],
+            uri=f"local://{name}",
+        )
+
+    def upload_file(self, api_key: str, path: str) -> SimpleNamespace:
+        self.check_key(api_key)
+        with open(path, 'rb') as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        self.sleep(self.scenario['upload_latency'])
+
+        with self._lock:
+            self._ids += 1
+            name = f"files/local-{self._ids:06d}"
+            self.files[name] = {
+                'key': api_key,
+                'display_name': os.path.basename(path),
+                'content_hash': content_hash,
+                'ready_at': self.now() + self.scenario['processing_delay'],
+                'expiration_time': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48),
+            }
+            self.counters['uploads'] += 1
+        return self.file_handle(name)
+
+    def get_file(self, api_key: str, name: str) -> SimpleNamespace:
+        self.check_key(api_key)
+        with self._lock:
+            self.counters['file_polls'] += 1
+            if name not in self.files or self.files[name]['key'] != api_key:
+                raise NotFound(f"404 File {name} not found")
+            return self.file_handle(name)
+
+    def delete_file(self, api_key: str, name: str):
+        self.check_key(api_key)
+        with self._lock:
+            if name not in self.files or self.files[name]['key'] != api_key:
+                raise NotFound(f"404 File {name} not found")
+            del self.files[name]
+            self.counters['deletes'] += 1
+
+    def list_files(self, api_key: str) -> List[SimpleNamespace]:
+        self.check_key(api_key)
+        with self._lock:
+            return [self.file_handle(name) for name, entry in self.files.items() if entry['key'] == api_key]
+
+    def admit(self, api_key: str):
+        """Apply the per-key rate limit and random 429 injection to one generate call"""
+        with self._lock:
+            now = self.now()
+            window = self.recent.setdefault(api_key, deque())
+            while window and window[0] <= now - 60:
+                window.popleft()
+            if len(window) >= self.scenario['server_rpm'] or self.rng.random() < self.scenario['rate_limit_rate']:
+                raise ResourceExhausted('429 Resource has been exhausted (e.g. check quota).')
+            window.append(now)
+
+    def plan_response(self, contents: List[Any]) -> Dict[str, Any]:
+        """Decide the text, token count and finish reason of one generation"""
+        prompt = next((part for part in reversed(contents) if isinstance(part, str)), '')
+        seed_material = [str(self.scenario['seed']), prompt]
+        for part in contents:
+            name = getattr(part, 'name', None)
+            if name is not None:
+                with self._lock:
+                    entry = self.files.get(name)
+                if entry is None or self.now() < entry['ready_at']:
+                    raise FailedPrecondition(f"400 File {name} is not in an ACTIVE state")
+                seed_material.append(entry['content_hash'])
+
+        # MCQ content depends only on the request and how often it was repeated (concurrent
+        # batches can share a prompt, and a sampled model answers each differently), so
+        # reruns serve the same questions
+        request_hash = hashlib.sha256('\0'.join(seed_material).encode('utf-8')).hexdigest()
+        with self._lock:
+            repeat = self.repeats[request_hash] = self.repeats.get(request_hash, -1) + 1
+        rng = random.Random(f"{request_hash}:{repeat}")
+        match = REQUESTED_COUNT.search(prompt)
+        requested = int(match.group(1)) if match else 10
+
+        if self.payload:
+            mcqs = [{k: v for k, v in rng.choice(self.payload).items() if k != 'id'} for _ in range(requested)]
+        else:
+            mcqs = [synthetic_mcq(rng) for _ in range(requested)]
+        for mcq in mcqs:
+            if rng.random() < self.scenario['invalid_rate']:
+                mcq['correct_answer'] = 'E'
+        objects = [json.dumps(mcq, ensure_ascii=False) for mcq in mcqs]
+
+        with self._lock:
+            malformed = self.rng.random() < self.scenario['malformed_rate']
+            cut_short = self.rng.random() < self.scenario['truncate_rate']
+            cut_at = self.rng.uniform(0.3, 0.95)
+        if malformed and objects:
+            bad = rng.randrange(len(objects))
+            objects[bad] = objects[bad].replace('"options":', '"options"', 1)
+
+        text = '[\n' + ',\n'.join(objects) + '\n]'
+        full_tokens = requested * self.scenario['tokens_per_mcq']
+        finish_reason = 'STOP'
+        fraction = 1.0
+        if full_tokens > self.scenario['max_output_tokens']:
+            fraction = self.scenario['max_output_tokens'] / full_tokens
+        if cut_short:
+            fraction = min(fraction, cut_at)
+        if fraction < 1.0:
+            text = text[:int(len(text) * fraction)]
+            finish_reason = 'MAX_TOKENS'
+
+        # Roughly 4 characters per token, and 258 tokens per attached PDF page
+        input_tokens = len(prompt) // 4
+        if len(contents) > 1:
+            input_tokens += 258 * self.scenario['pages_per_chapter']
+
+        return {
+            'text': text,
+            'input_tokens': input_tokens,
+            'tokens': int(full_tokens * fraction),
+            'finish_reason': finish_reason,
+            'requested': requested,
+            'malformed': malformed,
+        }
+
+    def generate_content(self, api_key: str, key_index: int, contents: List[Any], stream: bool = False):
+        started = time.monotonic()
+        call = {'key': key_index, 'outcome': 'ok', 'requested': 0, 'parsed': 0, 'skipped': 0,
+                'tokens': 0, 'latency': None, 'truncated': False, 'malformed': False}
+        try:
+            self.check_key(api_key)
+            self.admit(api_key)
+            plan = self.plan_response(contents)
+        except Exception as e:
+            call['outcome'] = type(e).__name__
+            self.record(call)
+            raise
+
+        parser = IncrementalMCQParser()
+        parser.parse_all(plan['text'])
+        call.update(requested=plan['requested'], parsed=parser.parsed, skipped=parser.skipped,
+                    tokens=plan['tokens'], truncated=plan['finish_reason'] == 'MAX_TOKENS',
+                    malformed=plan['malformed'])
+
+        chunks = self.stream_chunks(plan, started, call)
+        if stream:
+            return chunks
+        *_, last = chunks
+        return SimpleNamespace(text=plan['text'], usage_metadata=last.usage_metadata, candidates=last.candidates)
+
+    def stream_chunks(self, plan: Dict[str, Any], started: float, call: Dict[str, Any]):
+        """Yield the response in ~20 chunks paced at tokens_per_second after the first-token delay"""
+        text = plan['text']
+        size = max(1, len(text) // 20)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        self.sleep(self.scenario['first_token_latency'])
+
+        for i, piece in enumerate(pieces):
+            if i:
+                self.sleep(plan['tokens'] / len(pieces) / self.scenario['tokens_per_second'])
+            chunk = SimpleNamespace(text=piece, usage_metadata=None, candidates=[])
+            if i == len(pieces) - 1:
+                chunk.usage_metadata = SimpleNamespace(prompt_token_count=plan['input_tokens'],
+                                                       candidates_token_count=plan['tokens'])
+                chunk.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name=plan['finish_reason']))]
+                call['latency'] = (time.monotonic() - started) / self.time_scale
+                self.record(call)
+            yield chunk
+
+    def record(self, call: Dict[str, Any]):
+        with self._lock:
+            self.calls.append(call)
+
+
+class LocalGeminiClient:
+    """GeminiKeyClient's interface, served by a LocalGeminiServer"""
+
+    def __init__(self, server: LocalGeminiServer, api_key: str, key_index: int):
+        self.server = server
+        self.api_key = api_key
+        self.key_index = key_index
+
+    def upload_file(self, path: str):
+        return self.server.upload_file(self.api_key, path)
+
+    def get_file(self, name: str):
+        return self.server.get_file(self.api_key, name)
+
+    def delete_file(self, name: str):
+        self.server.delete_file(self.api_key, name)
+
+    def list_files(self, page_size: int = 100):
+        return self.server.list_files(self.api_key)
+
+    def generate_content(self, contents, **kwargs):
+        return self.server.generate_content(self.api_key, self.key_index, contents, stream=kwargs.get('stream', False))
+
+
+def build_corpus(books_dir: str, scenario: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Write small text PDFs for every benchmark subject; returns a subjects_config"""
+    subjects_config = []
+    for name, dir_name, grade in BENCHMARK_SUBJECTS:
+        pdf_dir = os.path.join(books_dir, dir_name)
+        os.makedirs(pdf_dir, exist_ok=True)
+        for number in range(1, scenario['chapters_per_subject'] + 1):
+            doc = fitz.open()
+            rng = random.Random(f"{scenario['seed']}:{name}:{number}")
+            for page_number in range(scenario['pages_per_chapter']):
+                page = doc.new_page()
+                lines = [f"{name} {grade} chapter {number}, page {page_number + 1}"]
+                lines += [' '.join(rng.sample(VOCABULARY, 10)) for _ in range(30)]
+                page.insert_text((50, 60), '\n'.join(lines), fontsize=9)
+            doc.save(os.path.join(pdf_dir, f"ch{number}.pdf"))
+            doc.close()
+        subjects_config.append({'name': name, 'pdf_dir': pdf_dir, 'grade': grade})
+    return subjects_config
+
+
+def summarise(server: LocalGeminiServer, counts: Dict[str, int], simulated_seconds: float,
+              wall_seconds: float) -> Dict[str, Any]:
+    """Throughput, latency, waste and parse-failure figures for one run"""
+    calls = list(server.calls)
+    answered = [c for c in calls if c['outcome'] == 'ok']
+    latencies = [c['latency'] for c in answered if c['latency'] is not None]
+    objects = sum(c['parsed'] + c['skipped'] for c in answered)
+    skipped = sum(c['skipped'] for c in answered)
+    # A request is wasted if it was refused or its response yielded no MCQ at all
+    wasted = sum(1 for c in calls if c['outcome'] != 'ok' or c['parsed'] == 0)
+    total_mcqs = sum(counts.values())
+
+    outcomes: Dict[str, int] = {}
+    for c in calls:
+        outcomes[c['outcome']] = outcomes.get(c['outcome'], 0) + 1
+
+    return {
+        'mcqs': total_mcqs,
+        'subjects': counts,
+        'simulated_minutes': round(simulated_seconds / 60, 2),
+        'wall_seconds': round(wall_seconds, 2),
+        'mcqs_per_minute': round(total_mcqs / max(simulated_seconds / 60, 1e-9), 1),
+        'generate_requests': len(calls),
+        'outcomes': outcomes,
+        'batch_latency_p50': percentile(latencies, 50),
+        'batch_latency_p95': percentile(latencies, 95),
+        'wasted_requests': wasted,
+        'wasted_rate': round(wasted / max(1, len(calls)), 4),
+        'truncated_responses': sum(1 for c in answered if c['truncated']),
+        'malformed_responses': sum(1 for c in answered if c['malformed']),
+        'parse_failure_rate': round(skipped / max(1, objects), 4),
+        'parsed_not_kept': sum(c['parsed'] for c in answered) - total_mcqs,  # Validation and dedup rejects, overshoot
+        'output_tokens': sum(c['tokens'] for c in answered),
+        **server.counters,
+    }
+
+
+def run_benchmark(scenario: Dict[str, Any], work_dir: str, log_path: Optional[str] = None) -> Dict[str, Any]:
+    """Generate the whole synthetic corpus against a local server and summarise the run"""
+    from simple_mcq_generator import SimpleMCQGenerator
+
+    books_dir = os.path.join(work_dir, 'books')
+    output_dir = os.path.join(work_dir, 'mcq_output')
+    subjects_config = build_corpus(books_dir, scenario)
+
+    keys_file = os.path.join(work_dir, 'apikeys')
+    api_keys = [f"AIzaSy{hashlib.sha256(f'bench-{i}'.encode()).hexdigest()[:33]}" for i in range(scenario['keys'])]
+    with open(keys_file, 'w') as f:
+        f.write('\n'.join(api_keys) + '\n')
+
+    server = LocalGeminiServer(scenario, invalid_keys=api_keys[:scenario['invalid_keys']])
+    log = open(log_path or os.devnull, 'w', encoding='utf-8')
+    with log, contextlib.redirect_stdout(log):
+        generator = SimpleMCQGenerator(keys_file, cache_dir=os.path.join(work_dir, '.mcq_cache'))
+        generator.ingest_mode = scenario['ingest_mode']
+        generator.target_mcqs_per_chapter = scenario['target_mcqs_per_chapter']
+
+        # Every client-side wait runs on the same scaled clock as the server
+        scale = scenario['time_scale']
+        generator.requests_per_minute = generator.requests_per_minute / scale
+        generator.file_waiter.initial_delay *= scale
+        generator.file_waiter.max_delay *= scale
+        generator.file_waiter.timeout *= scale
+        generator.key_pool.client_factory = server.client
+        generator.key_pool.base_cooldown *= scale
+        generator.key_pool.max_cooldown *= scale
+
+        started_wall = time.monotonic()
+        started = server.now()
+        counts = generator.generate_corpus(subjects_config, output_dir)
+        simulated_seconds = server.now() - started
+        wall_seconds = time.monotonic() - started_wall
+
+    report = summarise(server, counts, simulated_seconds, wall_seconds)
+    # Phase seconds are wall time; divide by time_scale for simulated time
+    report['phases'] = generator.metrics.summary()
+    report['scenario'] = scenario
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "n/a"
+
+    print(f"📊 {report['mcqs']} MCQs from {len(report['subjects'])} subjects "
+          f"in {report['simulated_minutes']} simulated min ({report['wall_seconds']}s wall)")
+    print(f"⚡ Throughput: {report['mcqs_per_minute']} MCQs/min")
+    print(f"⏱️ Batch latency: p50 {seconds(report['batch_latency_p50'])}, "
+          f"p95 {seconds(report['batch_latency_p95'])}")
+    print(f"🎯 Requests: {report['generate_requests']} generate ({report['outcomes']}), "
+          f"{report['uploads']} uploads, {report['file_polls']} file polls")
+    print(f"🗑️ Wasted requests: {report['wasted_requests']} ({report['wasted_rate']:.1%})")
+    print(f"🧩 Parse failures: {report['parse_failure_rate']:.1%} of MCQ objects; "
+          f"{report['truncated_responses']} truncated, {report['malformed_responses']} malformed responses")
+    print(f"♻️ Parsed but not kept: {report['parsed_not_kept']}")
+    for subject, count in report['subjects'].items():
+        print(f"• {subject}: {count} MCQs")
+
+
+def main():
+    scenario = dict(DEFAULT_SCENARIO)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if args:
+        # Scenario overrides, e.g. {"rate_limit_rate": 0.1, "time_scale": 0.005}
+        with open(args[0], 'r', encoding='utf-8') as f:
+            scenario.update(json.load(f))
+    if '--text' in sys.argv:
+        scenario['ingest_mode'] = 'text'
+
+    work_dir = tempfile.mkdtemp(prefix='mcq_benchmark_')
+    log_path = os.path.join(work_dir, 'generator.log')
+
+    print("🏎️ Offline MCQ Throughput Benchmark")
+    print("=" * 40)
+    print(f"📁 Work directory: {work_dir}")
+
+    report = run_benchmark(scenario, work_dir, log_path)
+
+    report_path = os.path.join(work_dir, 'benchmark_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"💾 Report: {report_path} (generator log: {log_path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+MCQ Bundle Builder
+Compacts the pretty-printed chapter files in mcq_output into minified,
+content-hashed shards per chapter and per subject, with precompressed .gz
+and .br siblings and a manifest of counts and hashes, so the quiz front end
+fetches small payloads it can cache as immutable; maths is pre-rendered to
+MathML when latex2mathml is installed
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+from typing import List, Dict, Any, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # .br siblings are skipped; pip install brotli to build them
+
+from mcq_dedup import chapter_files, load_chapter_file
+from math_prerender import MathRenderer, latex2mathml_convert
+
+BUNDLE_DIR_NAME = 'bundles'
+MANIFEST_VERSION = 1
+HASH_LENGTH = 12
+
+
+def minify(mcqs: List[Dict[str, Any]]) -> bytes:
+    return json.dumps(mcqs, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class MCQBundleBuilder:
+    """Writes shards as <name>.<hash>.json under bundles/<subject dir>/.
+
+    A shard's name changes whenever its content does, so existing shards
+    are never rewritten or recompressed, and shards no longer in the
+    manifest are deleted after it is written. With a math_renderer, an
+    entry's math is 'mathml' when every expression in it was pre-rendered,
+    so the quiz can skip MathJax, and 'tex' otherwise."""
+
+    def __init__(self, output_dir: str, bundle_dir: str = None, math_renderer: MathRenderer = None):
+        self.output_dir = output_dir
+        self.bundle_dir = bundle_dir or os.path.join(output_dir, BUNDLE_DIR_NAME)
+        self.math_renderer = math_renderer
+        self.manifest_path = os.path.join(self.bundle_dir, 'manifest.json')
+        self.written = 0
+        self.reused = 0
+
+    def chapters_by_subject(self) -> Dict[str, List[Tuple[str, str]]]:
+        """{'chemistry': [(chapter, path), ...]} keyed like QuizSystem's subjectDir"""
+        subjects: Dict[str, List[Tuple[str, str]]] = {}
+        for filepath in chapter_files(self.output_dir):
+            if os.path.abspath(filepath).startswith(os.path.abspath(self.bundle_dir) + os.sep):
+                continue
+            dir_name = os.path.basename(os.path.dirname(filepath))
+            if not dir_name.endswith('_chapters'):
+                continue
+            chapter = os.path.basename(filepath)[:-len('_mcqs.json')]
+            subjects.setdefault(dir_name[:-len('_chapters')], []).append((chapter, filepath))
+        return subjects
+
+    def write_shard(self, subject_dir: str, name: str, mcqs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Write one minified shard and its compressed siblings; returns its manifest entry"""
+        data = minify(mcqs)
+        digest = content_hash(data)
+        relative = f"{subject_dir}/{name}.{digest}.json"
+        path = os.path.join(self.bundle_dir, subject_dir, f"{name}.{digest}.json")
+
+        if os.path.exists(path) and os.path.exists(f"{path}.gz") and (brotli is None or os.path.exists(f"{path}.br")):
+            self.reused += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+            write_atomic(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write_atomic(f"{path}.br", brotli.compress(data, quality=11))
+            self.written += 1
+
+        entry = {
+            'file': relative,
+            'count': len(mcqs),
+            'hash': digest,
+            'bytes': len(data),
+            'gzip_bytes': os.path.getsize(f"{path}.gz"),
+        }
+        if os.path.exists(f"{path}.br"):
+            entry['br_bytes'] = os.path.getsize(f"{path}.br")
+        return entry
+
+    def build(self) -> Dict[str, Any]:
+        """Write every shard and the manifest, then prune stale shards"""
+        subjects = {}
+        for subject_dir, chapters in sorted(self.chapters_by_subject().items()):
+            chapter_entries = {}
+            subject_mcqs = []
+            for chapter, filepath in chapters:
+                mcqs = [mcq for mcq in load_chapter_file(filepath) if isinstance(mcq, dict)]
+                if not mcqs:
+                    print(f"⚠️ {os.path.relpath(filepath, self.output_dir)}: no MCQs, skipping")
+                    continue
+                mcqs, math = self.prerender(mcqs)
+                chapter_entries[chapter] = self.write_shard(subject_dir, chapter, mcqs)
+                if math:
+                    chapter_entries[chapter]['math'] = math
+                subject_mcqs.extend(mcqs)
+
+            if chapter_entries:
+                subjects[subject_dir] = dict(self.write_shard(subject_dir, 'all', subject_mcqs),
+                                             chapters=chapter_entries)
+                if self.math_renderer is not None:
+                    all_mathml = all(entry['math'] == 'mathml' for entry in chapter_entries.values())
+                    subjects[subject_dir]['math'] = 'mathml' if all_mathml else 'tex'
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'subjects': subjects,
+        }
+        os.makedirs(self.bundle_dir, exist_ok=True)
+        if self.math_renderer is not None:
+            self.math_renderer.save()
+        write_atomic(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+        self.prune(manifest)
+        return manifest
+
+    def prerender(self, mcqs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], str]:
+        """MCQs with their maths pre-rendered, and 'mathml' or 'tex' (None without a renderer)"""
+        if self.math_renderer is None:
+            return mcqs, None
+        rendered, left = [], 0
+        for mcq in mcqs:
+            mcq, failed = self.math_renderer.render_mcq(mcq)
+            rendered.append(mcq)
+            left += failed
+        return rendered, 'tex' if left else 'mathml'
+
+    def prune(self, manifest: Dict[str, Any]) -> int:
+        """Delete shards (and siblings) the manifest no longer references"""
+        live = set()
+        for subject in manifest['subjects'].values():
+            live.add(subject['file'])
+            live.update(chapter['file'] for chapter in subject['chapters'].values())
+
+        removed = 0
+        for root, dirs, names in os.walk(self.bundle_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.bundle_dir).replace(os.sep, '/')
+                shard = relative[:-3] if relative.endswith(('.gz', '.br')) else relative
+                if relative != 'manifest.json' and shard not in live:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+def main():
+    # mcq_bundle.py [output_dir] [bundle_dir]; bundle_dir defaults to <output_dir>/bundles
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else '/home/yaseen/ourbooks/mcq_output'
+    bundle_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print("📦 MCQ Bundle Builder")
+    print("=" * 40)
+    if brotli is None:
+        print("⚠️ brotli not installed, skipping .br files. Run: pip install brotli")
+
+    math_renderer = None
+    if latex2mathml_convert is None:
+        print("⚠️ latex2mathml not installed, shipping TeX for MathJax. Run: pip install latex2mathml")
+    else:
+        # Shares its expression cache with math_prerender.py's pages
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(output_dir)), '.mcq_cache')
+        math_renderer = MathRenderer(os.path.join(cache_dir, 'mathml.json'))
+
+    started = time.time()
+    builder = MCQBundleBuilder(output_dir, bundle_dir, math_renderer=math_renderer)
+    manifest = builder.build()
+
+    source_bytes = sum(os.path.getsize(path) for path in chapter_files(output_dir)
+                       if not os.path.abspath(path).startswith(os.path.abspath(builder.bundle_dir)))
+    shards = [chapter for subject in manifest['subjects'].values() for chapter in subject['chapters'].values()]
+    for subject_dir, subject in manifest['subjects'].items():
+        print(f"• {subject_dir}: {subject['count']} MCQs in {len(subject['chapters'])} chapters "
+              f"({subject['bytes'] / 1024:.0f} KB, {subject['gzip_bytes'] / 1024:.0f} KB gzipped)")
+
+    minified = sum(shard['bytes'] for shard in shards)
+    gzipped = sum(shard['gzip_bytes'] for shard in shards)
+    print(f"\n📊 {len(shards)} chapter shards: {source_bytes / 1024:.0f} KB → {minified / 1024:.0f} KB minified, "
+          f"{gzipped / 1024:.0f} KB gzipped ({builder.written} written, {builder.reused} unchanged) "
+          f"in {time.time() - started:.2f}s")
+    if math_renderer is not None:
+        static = sum(1 for shard in shards if shard.get('math') == 'mathml')
+        print(f"🧮 Maths: {static}/{len(shards)} chapters fully pre-rendered ({math_renderer.hits} cached, "
+              f"{math_renderer.misses} converted, {math_renderer.failures} left for MathJax)")
+    print(f"💾 Manifest: {builder.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Append-Only Combined MCQ Output
+Appends each finished chapter to a subject's JSONL segment log as one line,
+so nothing is rewritten while a subject runs and chapters can be dropped
+from memory; compaction streams the latest segment of every chapter into
+the combined <subject>_all_mcqs.json once, at the end
+"""
+
+import os
+import json
+import time
+import threading
+from typing import List, Dict, Any, Tuple
+
+
+class CombinedMCQLog:
+    """Segment log for one subject's combined output.
+
+    Each line is {"chapter", "time", "mcqs"}; a chapter appended again
+    (regenerated, or resumed on a later run) supersedes its earlier lines.
+    Compaction reads one segment at a time, writes the combined file
+    atomically and rewrites the log to just the live segments."""
+
+    def __init__(self, subject_dir: str, subject: str):
+        self.subject = subject
+        self.log_path = os.path.join(subject_dir, f"{subject}_all_mcqs.jsonl")
+        self.combined_path = os.path.join(subject_dir, f"{subject}_all_mcqs.json")
+        self._lock = threading.Lock()
+        os.makedirs(subject_dir, exist_ok=True)
+
+    def append(self, chapter: str, mcqs: List[Dict[str, Any]]):
+        """Durably append one chapter's MCQs as a single line"""
+        line = json.dumps({'chapter': chapter, 'time': time.time(), 'mcqs': mcqs}, ensure_ascii=False)
+        with self._lock:
+            with open(self.log_path, 'a+', encoding='utf-8') as f:
+                if f.tell() and not self.ends_with_newline():
+                    line = '\n' + line  # Keep a torn line from a crash from swallowing this one
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def ends_with_newline(self) -> bool:
+        with open(self.log_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def live_segments(self) -> Dict[str, Tuple[int, int]]:
+        """{chapter: (byte offset, MCQ count)} of each chapter's latest segment, in first-seen order.
+        A torn last line (crash mid-append) is ignored."""
+        segments: Dict[str, Tuple[int, int]] = {}
+        if not os.path.exists(self.log_path):
+            return segments
+
+        with open(self.log_path, 'rb') as f:
+            offset = 0
+            for raw in f:
+                try:
+                    segment = json.loads(raw)
+                    segments[segment['chapter']] = (offset, len(segment['mcqs']))
+                except (ValueError, KeyError, TypeError):
+                    pass
+                offset += len(raw)
+        return segments
+
+    def compact(self) -> Tuple[int, int]:
+        """Write the combined file from the live segments; returns (MCQs, chapters)"""
+        with self._lock:
+            segments = self.live_segments()
+            if not segments:
+                return 0, 0
+            total = sum(count for _, count in segments.values())
+
+            tmp_combined = f"{self.combined_path}.tmp"
+            tmp_log = f"{self.log_path}.tmp"
+            with open(self.log_path, 'rb') as log, \
+                    open(tmp_combined, 'w', encoding='utf-8') as combined, \
+                    open(tmp_log, 'wb') as compacted:
+                combined.write(json.dumps({
+                    'subject': self.subject,
+                    'total_mcqs': total,
+                    'chapters_included': len(segments),
+                }, ensure_ascii=False)[:-1] + ', "mcqs": [')
+
+                first = True
+                for offset, _ in segments.values():
+                    log.seek(offset)
+                    raw = log.readline()
+                    compacted.write(raw)
+                    for mcq in json.loads(raw)['mcqs']:
+                        combined.write(('\n' if first else ',\n') + json.dumps(mcq, ensure_ascii=False))
+                        first = False
+                combined.write('\n]}\n')
+
+            os.replace(tmp_combined, self.combined_path)
+            os.replace(tmp_log, self.log_path)
+            return total, len(segments)
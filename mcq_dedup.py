@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate MCQ Index
+MinHash signatures over shingled, normalised question + options text, bucketed
+with LSH so new batches can be checked against a chapter and the whole
+mcq_output corpus in constant time per question
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from mcq_stream_parser import IncrementalMCQParser
+
+MAX_HASH = (1 << 64) - 1
+EMPTY_BIN = MAX_HASH + 1
+DENSIFY_OFFSET = 0x9E3779B97F4A7C15  # Golden-ratio constant, spreads borrowed values
+
+LATEX_COMMAND = re.compile(r'\\([a-zA-Z]+)')
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalise_mcq_text(mcq: Dict[str, Any]) -> str:
+    """Lowercased question plus options (order-insensitive), LaTeX markup stripped"""
+    options = mcq.get('options') or {}
+    if isinstance(options, dict):
+        option_texts = sorted(str(v) for v in options.values())
+    else:
+        option_texts = sorted(str(v) for v in options)
+
+    text = ' '.join([str(mcq.get('question', ''))] + option_texts)
+    text = LATEX_COMMAND.sub(r' \1 ', text).lower()
+    return NON_WORD.sub(' ', text).strip()
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word shingles; short texts fall back to their individual words"""
+    words = text.split()
+    if len(words) < size:
+        return set(words)
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MCQDedupIndex:
+    """MinHash/LSH index of MCQs, labelled by the chapter file they belong to.
+
+    Signatures use Python's built-in str hash, so they are only comparable
+    within one process; the index is cheap to rebuild from mcq_output."""
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 32, bands: int = 8):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        self.buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(bands)]
+        self.entries: List[Optional[Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def signature(self, shingle_set: Set[str]) -> List[int]:
+        """One-permutation MinHash: each shingle hash lands in one of num_perm bins
+        and each bin keeps its minimum, so the cost is O(shingles), not
+        O(shingles * num_perm). Empty bins borrow from the next filled bin."""
+        num_perm = self.num_perm
+        bins = [EMPTY_BIN] * num_perm
+        for s in shingle_set:
+            h = hash(s) & MAX_HASH
+            b = h % num_perm
+            if h < bins[b]:
+                bins[b] = h
+
+        if EMPTY_BIN in bins:
+            if min(bins) == EMPTY_BIN:
+                return [0] * num_perm
+            # Rotation densification: an empty bin copies the next filled bin
+            # (wrapping around), offset by the distance so copies stay distinct
+            filled = bins[:]
+            next_filled = max(i for i in range(num_perm) if filled[i] != EMPTY_BIN) - num_perm
+            for i in range(num_perm - 1, -1, -1):
+                if filled[i] != EMPTY_BIN:
+                    next_filled = i
+                else:
+                    bins[i] = (filled[next_filled] + (next_filled - i) * DENSIFY_OFFSET) & MAX_HASH
+        return bins
+
+    def band_keys(self, signature: List[int]):
+        rows = self.rows
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def query(self, mcq: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the entry a question near-duplicates, or None"""
+        shingle_set = shingles(normalise_mcq_text(mcq))
+        with self._lock:
+            return self.match(shingle_set, self.band_keys(self.signature(shingle_set)))
+
+    def match(self, shingle_set: Set[str], keys) -> Optional[Dict[str, Any]]:
+        seen = set()
+        for band, key in enumerate(keys):
+            for entry_id in self.buckets[band].get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+
+                entry = self.entries[entry_id]
+                if entry is None:
+                    continue
+                union = len(shingle_set | entry['shingles'])
+                if union and len(shingle_set & entry['shingles']) / union >= self.threshold:
+                    return entry
+        return None
+
+    def add(self, mcq: Dict[str, Any], label: str) -> Optional[Dict[str, Any]]:
+        """Insert a question unless it near-duplicates one already indexed.
+
+        Returns the existing entry it duplicates (and does not insert), or
+        None if the question was new and has been added."""
+        shingle_set = shingles(normalise_mcq_text(mcq))
+        signature = self.signature(shingle_set)
+        keys = self.band_keys(signature)
+
+        with self._lock:
+            duplicate = self.match(shingle_set, keys)
+            if duplicate is not None:
+                return duplicate
+
+            entry_id = len(self.entries)
+            self.entries.append({
+                'label': label,
+                'question': mcq.get('question', ''),
+                'shingles': shingle_set,
+            })
+            for band, key in enumerate(keys):
+                self.buckets[band].setdefault(key, []).append(entry_id)
+        return None
+
+    def remove(self, label: str) -> int:
+        """Forget every question from a label, e.g. a chapter about to be regenerated"""
+        removed = 0
+        with self._lock:
+            for entry_id, entry in enumerate(self.entries):
+                if entry is not None and entry['label'] == label:
+                    self.entries[entry_id] = None
+                    removed += 1
+        return removed
+
+    def filter_new(self, mcqs: List[Dict[str, Any]], label: str):
+        """Split a batch into (accepted, rejected duplicates), indexing the accepted ones"""
+        accepted, rejected = [], []
+        for mcq in mcqs:
+            if self.add(mcq, label) is None:
+                accepted.append(mcq)
+            else:
+                rejected.append(mcq)
+        return accepted, rejected
+
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry is not None)
+
+
+def load_chapter_file(filepath: str) -> List[Dict[str, Any]]:
+    """Load a chapter's MCQs, recovering what it can from files with bad escapes"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return IncrementalMCQParser().parse_all(content)
+
+    return data if isinstance(data, list) else []
+
+
+def chapter_files(output_dir: str) -> List[str]:
+    """Every per-chapter MCQ file under mcq_output (combined subject files excluded)"""
+    files = []
+    for root, dirs, names in os.walk(output_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith('_mcqs.json') and not name.endswith('_all_mcqs.json'):
+                files.append(os.path.join(root, name))
+    return files
+
+
+def index_corpus(index: MCQDedupIndex, output_dir: str) -> List[Dict[str, Any]]:
+    """Bulk-load every chapter file; returns the near-duplicates found on the way"""
+    duplicates = []
+    for filepath in chapter_files(output_dir):
+        label = os.path.relpath(filepath, output_dir)
+        for mcq in load_chapter_file(filepath):
+            if not isinstance(mcq, dict):
+                continue
+            existing = index.add(mcq, label)
+            if existing is not None:
+                duplicates.append({
+                    'label': label,
+                    'question': mcq.get('question', ''),
+                    'duplicate_of': existing['label'],
+                    'original_question': existing['question'],
+                })
+    return duplicates
+
+
+def main():
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else '/home/yaseen/ourbooks/mcq_output'
+
+    print("🔍 MCQ Near-Duplicate Scan")
+    print("=" * 40)
+
+    started = time.time()
+    index = MCQDedupIndex()
+    duplicates = index_corpus(index, output_dir)
+    elapsed = time.time() - started
+
+    for dup in duplicates:
+        print(f"• {dup['label']}: {dup['question'][:70]}")
+        print(f"  ↳ duplicates {dup['duplicate_of']}: {dup['original_question'][:70]}")
+
+    print(f"\n📊 Indexed {len(index)} unique MCQs, found {len(duplicates)} near-duplicates in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Concurrent MCQ Generation Engine
+Runs chapter batches as asyncio tasks across all API keys, with a token-bucket
+rate limiter per key and a global cap on in-flight requests
+"""
+
+import os
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+try:
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+    from google.generativeai import protos
+    from google.generativeai.types import file_types
+except ImportError:
+    print("❌ google-generativeai not installed. Run: pip install google-generativeai")
+    exit(1)
+
+
+# genai.configure() swaps process-global state, so it is only ever called
+# under this lock while a GeminiKeyClient grabs its own service clients.
+_configure_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Thread-safe token bucket usable from both threads and asyncio tasks"""
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token if one is available, otherwise return the wait in seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block the calling thread until a token is available"""
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a token is available"""
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class GeminiKeyClient:
+    """Generative and file service clients bound to a single API key"""
+
+    def __init__(self, api_key: str, key_index: int, model_name: str = 'gemini-1.5-flash',
+                 generation_config: Optional[Dict[str, Any]] = None):
+        self.api_key = api_key
+        self.key_index = key_index
+
+        with _configure_lock:
+            genai.configure(api_key=api_key)
+            self.file_client = genai_client.get_default_file_client()
+            generative_client = genai_client.get_default_generative_client()
+
+        self.model = genai.GenerativeModel(model_name, generation_config=generation_config)
+        # Pin the model to this key's client instead of the global default
+        self.model._client = generative_client
+
+    def upload_file(self, path: str):
+        """Upload a PDF with this key"""
+        response = self.file_client.create_file(
+            path=path,
+            mime_type='application/pdf',
+            display_name=os.path.basename(path),
+        )
+        return file_types.File(response)
+
+    def get_file(self, name: str):
+        """Fetch the current state of an uploaded file"""
+        return file_types.File(self.file_client.get_file(name=name))
+
+    def delete_file(self, name: str):
+        """Delete an uploaded file"""
+        self.file_client.delete_file(request=protos.DeleteFileRequest(name=name))
+
+    def list_files(self, page_size: int = 100):
+        """List every file uploaded with this key"""
+        request = protos.ListFilesRequest(page_size=page_size)
+        return [file_types.File(proto) for proto in self.file_client.list_files(request)]
+
+    def generate_content(self, contents, **kwargs):
+        """Call generate_content on this key's model"""
+        return self.model.generate_content(contents, **kwargs)
+
+
+class ConcurrentMCQEngine:
+    """Schedules blocking Gemini calls as asyncio tasks across the keys of a KeyPool"""
+
+    def __init__(self, key_pool, requests_per_minute: float = 10, max_concurrency: int = 8):
+        self.key_pool = key_pool
+        self.api_keys = key_pool.api_keys
+        self.max_concurrency = max_concurrency
+
+        self.limiters = [TokenBucket(requests_per_minute) for _ in self.api_keys]
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='mcq-worker')
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def client(self, key_index: int) -> GeminiKeyClient:
+        """The pool's client for an API key"""
+        return self.key_pool.client(key_index)
+
+    def pick_key(self) -> int:
+        """Reserve the least-loaded healthy API key; pair with release_key()"""
+        return self.key_pool.reserve()
+
+    def release_key(self, key_index: int):
+        """Release a key reserved by pick_key()"""
+        self.key_pool.release(key_index)
+
+    async def call(self, key_index: int, fn: Callable, *args, rate_limited: bool = True):
+        """Run fn(client, *args) on a worker thread for the given key.
+
+        Generation calls wait out the key's cooldown and for a token from its
+        bucket; every call counts against the global concurrency cap. Health
+        is recorded by fn itself around the actual API calls (KeyPool.track)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if rate_limited:
+            await self.key_pool.wait_async(key_index)
+            await self.limiters[key_index].acquire_async()
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(fn, self.client(key_index), *args)
+            )
+
+    def run(self, coro):
+        """Run a coroutine to completion on a fresh event loop"""
+        self._semaphore = None
+        try:
+            return asyncio.run(coro)
+        finally:
+            self._semaphore = None
+
+    def shutdown(self):
+        """Stop the worker threads and flush key health they recorded since the last save"""
+        self.executor.shutdown(wait=True)
+        self.key_pool.save()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Uploaded File Readiness Waiter
+Polls uploaded PDFs until they leave the PROCESSING state, with exponential
+backoff, jitter and a hard timeout; the async form lets many uploads wait at
+once without tying up worker threads, so they process while others generate
+"""
+
+import time
+import random
+import asyncio
+from typing import Callable, Awaitable, Iterator, Tuple, Any
+
+
+class FileProcessingTimeout(Exception):
+    """Raised when an upload is still PROCESSING after the waiter's timeout"""
+
+
+class FileStateWaiter:
+    """Backoff schedule for file-state polls.
+
+    Delays start at initial_delay and multiply up to max_delay; each is
+    drawn from the upper half of its range, so files uploaded together
+    don't poll in lockstep. Returns the final file handle and how many
+    polls it took; the caller decides what a non-ACTIVE state means."""
+
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 15.0, multiplier: float = 2.0,
+                 timeout: float = 600.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.timeout = timeout
+
+    def delays(self) -> Iterator[float]:
+        delay = self.initial_delay
+        while True:
+            yield random.uniform(delay / 2, delay)
+            delay = min(self.max_delay, delay * self.multiplier)
+
+    def check_deadline(self, remote_file, deadline: float):
+        if time.monotonic() >= deadline:
+            raise FileProcessingTimeout(f"{remote_file.name} still PROCESSING after {self.timeout:.0f}s")
+
+    def wait(self, get_file: Callable[[str], Any], remote_file) -> Tuple[Any, int]:
+        """Block until get_file(name) reports a state other than PROCESSING"""
+        deadline = time.monotonic() + self.timeout
+        polls = 0
+        for delay in self.delays():
+            if remote_file.state.name != "PROCESSING":
+                return remote_file, polls
+            self.check_deadline(remote_file, deadline)
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            remote_file = get_file(remote_file.name)
+            polls += 1
+
+    async def wait_async(self, get_file: Callable[[str], Awaitable[Any]], remote_file) -> Tuple[Any, int]:
+        """Like wait(), but sleeps on the event loop; get_file is a coroutine function"""
+        deadline = time.monotonic() + self.timeout
+        polls = 0
+        for delay in self.delays():
+            if remote_file.state.name != "PROCESSING":
+                return remote_file, polls
+            self.check_deadline(remote_file, deadline)
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            remote_file = await get_file(remote_file.name)
+            polls += 1
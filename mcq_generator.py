@@ -7,11 +7,9 @@ Handles 20MB PDF limit and uses multiple API keys for load balancing
 
 import os
 import json
-import time
-import random
 import asyncio
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 try:
     import google.generativeai as genai
     from google.generativeai.types import RequestOptions
@@ -25,20 +23,54 @@ except ImportError:
     print("❌ PyMuPDF not installed. Run: pip install PyMuPDF")
     exit(1)
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from mcq_engine import ConcurrentMCQEngine, GeminiKeyClient, TokenBucket
+from mcq_key_pool import KeyPool, KeyUnavailable
+from mcq_upload_registry import UploadRegistry
+from mcq_response_cache import ResponseCache
+from mcq_stream_parser import IncrementalMCQParser
+from mcq_pdf_compress import PDFCompressor, COMPRESSION_VERSION
+from mcq_artifact_cache import ArtifactCache, is_derivative_pdf
+from mcq_file_waiter import FileStateWaiter
+from mcq_identity import assign_ids, chapter_path, merge_chapter_file, describe
+from mcq_question_bank import subject_grade, subject_key
 
 
 class MCQGenerator:
     def __init__(self, api_keys_file: str = "/home/yaseen/apikeys"):
         self.api_keys = self.load_api_keys(api_keys_file)
-        self.current_key_index = 0
-        self.setup_gemini()
+        self.current_key_index = None  # Chosen by the key pool in setup_gemini()
 
         # MCQ Generation Configuration
         self.target_mcqs_per_chapter = 100
         self.max_pdf_size_mb = 19  # Leave 1MB buffer
         self.max_retries = 3
-        self.rate_limit_delay = 2  # seconds between requests
+        self.requests_per_minute = 10  # Per-key request budget (token bucket)
+        self.max_concurrency = 8  # Global cap on in-flight API calls
+        self.cache_dir = "/home/yaseen/ourbooks/.mcq_cache"
+        self.model_name = 'gemini-1.5-flash'
+        self.generation_config = {
+            "temperature": 0.7,
+            "top_p": 0.8,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+        }
+
+        # Per-key health: invalid keys quarantined, throttled keys cooled down
+        self.key_pool = KeyPool(self.api_keys, os.path.join(self.cache_dir, "key_pool.json"),
+                                self.model_name, self.generation_config)
+
+        # Reuse live uploads across retries and re-runs instead of re-uploading
+        self.upload_registry = UploadRegistry(os.path.join(self.cache_dir, "uploads.json"))
+        # Uploads are polled until ACTIVE with exponential backoff and a timeout
+        self.file_waiter = FileStateWaiter()
+        # Raw responses keyed by (PDF hash, prompt, model, config) for offline re-parsing
+        self.response_cache = ResponseCache(os.path.join(self.cache_dir, "responses.sqlite3"))
+        # Image downsampling/re-encoding runs in worker processes, one chapter each
+        self.compressor = PDFCompressor()
+        # Compressed/split PDFs live here, keyed by source hash, instead of beside the books
+        self.artifact_cache = ArtifactCache(os.path.join(self.cache_dir, "artifacts"))
+
+        self.setup_gemini()
 
     def load_api_keys(self, filepath: str) -> List[str]:
         """Load API keys from file"""
@@ -52,33 +84,27 @@ class MCQGenerator:
         print(f"Loaded {len(keys)} API keys")
         return keys
 
-    def setup_gemini(self):
-        """Setup Gemini with current API key"""
+    def setup_gemini(self, key_index: int = None):
+        """Setup Gemini with the healthiest API key (or the given one)"""
         if not self.api_keys:
             raise ValueError("No API keys found")
 
-        current_key = self.api_keys[self.current_key_index]
-        genai.configure(api_key=current_key)
-
-        # Use the correct model initialization
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-
-        # Set generation config separately if needed
-        self.generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.8,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        }
+        # Client bound to the key instead of global genai state
+        self.current_key_index = self.key_pool.best_key() if key_index is None else key_index
+        self.client = self.key_pool.client(self.current_key_index)
+        self.limiter = TokenBucket(self.requests_per_minute)
 
     def rotate_api_key(self):
-        """Rotate to next API key"""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        self.setup_gemini()
+        """Switch to the healthiest other API key"""
+        try:
+            key_index = self.key_pool.best_key(exclude={self.current_key_index})
+        except KeyUnavailable:
+            key_index = self.key_pool.best_key()
+        self.setup_gemini(key_index)
         print(f"Switched to API key {self.current_key_index + 1}")
 
-    def compress_pdf(self, pdf_path: str, max_size_mb: int = 19) -> str:
-        """Compress PDF if it's over the size limit"""
+    def compress_pdf(self, pdf_path: str, compressed_path: str, max_size_mb: int = 19) -> str:
+        """Compress PDF if it's over the size limit, downsampling images rather than dropping them"""
         file_size_mb = os.path.getsize(pdf_path) / (1024 * 1024)
 
         if file_size_mb <= max_size_mb:
@@ -86,113 +112,246 @@ class MCQGenerator:
 
         print(f"PDF {pdf_path} is {file_size_mb:.1f}MB, compressing...")
 
-        # Open PDF with PyMuPDF
-        doc = fitz.open(pdf_path)
-        compressed_path = pdf_path.replace('.pdf', '_compressed.pdf')
-
-        # Compress by reducing image quality and removing unnecessary elements
-        for page in doc:
-            for img in page.get_images(full=True):
-                xref = img[0]
-                # Reduce image quality
-                doc._deleteObject(xref)
-
-        # Save with compression
-        doc.save(
-            compressed_path,
-            garbage=4,  # Remove unused objects
-            deflate=True,  # Compress streams
-            clean=True,  # Clean content streams
-        )
-        doc.close()
+        result = self.compressor.compress(pdf_path, compressed_path, max_size_mb)
 
-        new_size_mb = os.path.getsize(compressed_path) / (1024 * 1024)
-        print(f"Compressed to {new_size_mb:.1f}MB")
-
-        if new_size_mb > max_size_mb:
-            print(f"Still too large after compression. Splitting PDF...")
-            return self.split_pdf(compressed_path, max_size_mb)
+        settings = f" (images at {result['dpi']} DPI, JPEG quality {result['quality']})" if result['dpi'] else ""
+        print(f"Compressed to {result['size_mb']:.1f}MB{settings}")
 
         return compressed_path
 
-    def split_pdf(self, pdf_path: str, max_size_mb: int) -> str:
-        """Split PDF into smaller chunks if still too large"""
+    def prepare_pdf_parts(self, pdf_path: str) -> List[Tuple[str, int, int]]:
+        """Compress a chapter PDF and, if it is still too large, split it.
+
+        Returns (path, first_page, last_page) for every part, pages 1-based.
+        Parts come from the artifact cache when this PDF was processed before."""
+        if os.path.getsize(pdf_path) / (1024 * 1024) <= self.max_pdf_size_mb:
+            with fitz.open(pdf_path) as doc:
+                return [(pdf_path, 1, len(doc))]
+
+        params = {'max_size_mb': self.max_pdf_size_mb, 'compression': COMPRESSION_VERSION}
+        entry = self.artifact_cache.lookup(pdf_path, params)
+        if entry:
+            print(f"Reusing preprocessed PDF for {pdf_path}")
+            return [(self.artifact_cache.path(entry, name), first, last) for name, first, last in entry['meta']['parts']]
+
+        work_dir = self.artifact_cache.work_dir(pdf_path, params)
+        processed_pdf = self.compress_pdf(pdf_path, os.path.join(work_dir, os.path.basename(pdf_path)),
+                                          self.max_pdf_size_mb)
+
+        if os.path.getsize(processed_pdf) / (1024 * 1024) > self.max_pdf_size_mb:
+            print(f"Still too large after compression. Splitting PDF...")
+            parts = self.split_pdf(processed_pdf, self.max_pdf_size_mb)
+            os.remove(processed_pdf)  # Only the chunks are uploaded
+        else:
+            with fitz.open(processed_pdf) as doc:
+                parts = [(processed_pdf, 1, len(doc))]
+
+        self.artifact_cache.store(pdf_path, params, {
+            'parts': [(os.path.basename(path), first, last) for path, first, last in parts]
+        })
+        return parts
+
+    def split_pdf(self, pdf_path: str, max_size_mb: int) -> List[Tuple[str, int, int]]:
+        """Split a PDF into chunks under the size limit, covering every page"""
         doc = fitz.open(pdf_path)
         total_pages = len(doc)
 
         # Calculate pages per chunk
         file_size_mb = os.path.getsize(pdf_path) / (1024 * 1024)
-        pages_per_chunk = int((max_size_mb / file_size_mb) * total_pages)
-
-        if pages_per_chunk < 1:
-            pages_per_chunk = 1
-
-        # Create first chunk
-        chunk_doc = fitz.open()
-        for i in range(min(pages_per_chunk, total_pages)):
-            chunk_doc.insert_pdf(doc, from_page=i, to_page=i)
+        pages_per_chunk = max(1, int((max_size_mb / file_size_mb) * total_pages))
+
+        ranges = [(first, min(first + pages_per_chunk, total_pages) - 1)
+                  for first in range(0, total_pages, pages_per_chunk)]
+        chunks = []
+
+        # Pages aren't equally heavy, so a chunk over the limit is halved and retried
+        while ranges:
+            first, last = ranges.pop(0)
+            chunk_doc = fitz.open()
+            chunk_doc.insert_pdf(doc, from_page=first, to_page=last)
+            chunk_path = pdf_path.replace('.pdf', f'_chunk{len(chunks) + 1}.pdf')
+            chunk_doc.save(chunk_path, garbage=4, deflate=True)
+            chunk_doc.close()
+
+            if os.path.getsize(chunk_path) / (1024 * 1024) > max_size_mb and last > first:
+                middle = (first + last) // 2
+                ranges[:0] = [(first, middle), (middle + 1, last)]
+                continue
 
-        chunk_path = pdf_path.replace('.pdf', '_chunk1.pdf')
-        chunk_doc.save(chunk_path)
-        chunk_doc.close()
+            chunks.append((chunk_path, first + 1, last + 1))
 
-        print(f"Split PDF into chunks. Using first chunk: {chunk_path}")
         doc.close()
+        print(f"Split PDF into {len(chunks)} chunks: {', '.join(os.path.basename(c[0]) for c in chunks)}")
+
+        return chunks
+
+    def part_targets(self, parts: List[Tuple[str, int, int]], total: int) -> List[int]:
+        """Divide a chapter's MCQ target across parts in proportion to their page counts"""
+        pages = [last - first + 1 for _, first, last in parts]
+        shares = [total * count / sum(pages) for count in pages]
+        targets = [int(share) for share in shares]
+
+        # Hand the remainder to the parts with the largest fractional shares
+        by_remainder = sorted(range(len(parts)), key=lambda i: shares[i] - targets[i], reverse=True)
+        for i in by_remainder[:total - sum(targets)]:
+            targets[i] += 1
+        return [max(1, target) for target in targets]
+
+    def merge_parts(self, subject: str, chapter: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine the MCQs of every part into one chapter; a question two parts share gets a -2 id"""
+        mcqs = assign_ids(subject, chapter, [mcq for result in results for mcq in result['mcqs']])
+
+        return {
+            'subject': subject,
+            'chapter': chapter,
+            'total_mcqs': len(mcqs),
+            'mcqs': mcqs
+        }
 
-        return chunk_path
+    def generate_mcqs_for_chapter(self, pdf_path: str, subject: str, chapter: str,
+                                  client: GeminiKeyClient = None, limiter: TokenBucket = None) -> Dict[str, Any]:
+        """Generate MCQs for a specific chapter, one part at a time if it had to be split"""
+        parts = self.prepare_pdf_parts(pdf_path)
+        if len(parts) == 1:
+            return self.generate_mcqs_for_part(parts[0][0], subject, chapter, client=client, limiter=limiter)
+
+        targets = self.part_targets(parts, self.target_mcqs_per_chapter)
+        results = [
+            self.generate_mcqs_for_part(part_path, subject, chapter, client=client, limiter=limiter,
+                                        count=target, part=(i + 1, len(parts), first, last))
+            for i, ((part_path, first, last), target) in enumerate(zip(parts, targets))
+        ]
+        return self.merge_parts(subject, chapter, results)
+
+    def generate_mcqs_for_part(self, processed_pdf: str, subject: str, chapter: str,
+                               client: GeminiKeyClient = None, limiter: TokenBucket = None,
+                               count: int = None, part: Tuple[int, int, int, int] = None) -> Dict[str, Any]:
+        """Generate MCQs from one (already compressed) chapter PDF or chunk
+
+        With an explicit client every attempt stays on that key; otherwise
+        failed attempts rotate to the next key. This blocks on cooldowns,
+        PROCESSING and the rate limiter; the concurrent engine uses
+        process_part_async instead.
+        """
+        pinned = client is not None
+
+        prompt, pdf_hash, cache_key = self.part_request(processed_pdf, subject, chapter, count, part)
+        cached_text = self.response_cache.get(cache_key)
+        if cached_text is not None:
+            print(f"Using cached response for {subject} - {chapter}")
+            return self.parse_mcq_response(cached_text, subject, chapter)
 
-    def generate_mcqs_for_chapter(self, pdf_path: str, subject: str, chapter: str) -> Dict[str, Any]:
-        """Generate MCQs for a specific chapter"""
+        for attempt in range(self.max_retries):
+            if not pinned:
+                client, limiter = self.client, self.limiter
 
-        # Compress/split PDF if needed
-        processed_pdf = self.compress_pdf(pdf_path)
+            try:
+                self.key_pool.wait(client.key_index)
 
-        # Upload PDF to Gemini
-        sample_file = genai.upload_file(processed_pdf)
-        print(f"Uploaded PDF: {processed_pdf}")
+                sample_file = self.start_upload(client, processed_pdf)
+                try:
+                    # Wait for processing, backing off between polls
+                    sample_file, _ = self.file_waiter.wait(client.get_file, sample_file)
+                except Exception as e:
+                    self.key_pool.record_failure(client.key_index, e)
+                    raise
+                sample_file = self.finish_upload(client, processed_pdf, sample_file)
 
-        # Wait for processing
-        while sample_file.state.name == "PROCESSING":
-            time.sleep(2)
-            sample_file = genai.get_file(sample_file.name)
+                if limiter:
+                    limiter.acquire()
+                return self.request_part(client, sample_file, prompt, pdf_hash, cache_key, subject, chapter)
 
-        if sample_file.state.name != "ACTIVE":
-            raise ValueError(f"File processing failed: {sample_file.state.name}")
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed: {e}")
+                if attempt == self.max_retries - 1:
+                    raise e
+                if not pinned:
+                    self.rotate_api_key()
 
-        # Generate MCQs
-        prompt = self.create_mcq_prompt(subject, chapter)
+        raise ValueError("Failed to generate MCQs after all retries")
 
-        for attempt in range(self.max_retries):
+    def part_request(self, processed_pdf: str, subject: str, chapter: str, count: int = None,
+                     part: Tuple[int, int, int, int] = None) -> Tuple[str, str, str]:
+        """(prompt, PDF hash, response-cache key) for one PDF part"""
+        prompt = self.create_mcq_prompt(subject, chapter, count, part)
+        pdf_hash = self.upload_registry.pdf_hash(processed_pdf)
+        return prompt, pdf_hash, ResponseCache.make_key(pdf_hash, prompt, self.model_name, self.generation_config)
+
+    def start_upload(self, client: GeminiKeyClient, processed_pdf: str):
+        """Reuse or upload a PDF part; the returned handle may still be PROCESSING"""
+        # Files are only visible to the uploading key, so look up this key's handle
+        with self.upload_registry.upload_lock(client, processed_pdf):
             try:
-                response = self.model.generate_content(
-                    [sample_file, prompt],
-                    request_options=RequestOptions(timeout=300)
-                )
-
-                if response.text:
-                    mcqs_data = self.parse_mcq_response(response.text, subject, chapter)
-                    sample_file.delete()  # Clean up
-                    return mcqs_data
+                sample_file = self.upload_registry.lookup(client, processed_pdf)
+                if sample_file is not None:
+                    print(f"Reusing uploaded PDF: {processed_pdf}")
+                    return sample_file
 
+                sample_file = client.upload_file(processed_pdf)
             except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt < self.max_retries - 1:
-                    self.rotate_api_key()
-                    time.sleep(self.rate_limit_delay)
-                else:
-                    raise e
+                self.key_pool.record_failure(client.key_index, e)
+                raise
+            self.upload_registry.record(client, processed_pdf, sample_file)
+            print(f"Uploaded PDF: {processed_pdf}")
+            return sample_file
+
+    def finish_upload(self, client: GeminiKeyClient, processed_pdf: str, sample_file):
+        """Check that a file finished processing, and remember it as ACTIVE"""
+        if sample_file.state.name != "ACTIVE":
+            self.upload_registry.forget_file(sample_file.name)
+            raise ValueError(f"File processing failed: {sample_file.state.name}")
 
-        sample_file.delete()  # Clean up on failure
-        raise ValueError("Failed to generate MCQs after all retries")
+        self.upload_registry.mark_active(client, processed_pdf, sample_file)
+        return sample_file
+
+    async def upload_part_async(self, engine: ConcurrentMCQEngine, key_index: int, processed_pdf: str):
+        """Upload a PDF part and wait for it on the event loop, so PROCESSING holds no worker thread"""
+        async def get_file(name: str):
+            return await engine.call(key_index, lambda client: client.get_file(name), rate_limited=False)
+
+        sample_file = await engine.call(key_index, self.start_upload, processed_pdf, rate_limited=False)
+        try:
+            sample_file, _ = await self.file_waiter.wait_async(get_file, sample_file)
+        except Exception as e:
+            self.key_pool.record_failure(key_index, e)
+            raise
+        return self.finish_upload(engine.client(key_index), processed_pdf, sample_file)
+
+    def request_part(self, client: GeminiKeyClient, sample_file, prompt: str, pdf_hash: str, cache_key: str,
+                     subject: str, chapter: str) -> Dict[str, Any]:
+        """One generate call against an ACTIVE upload; the response is cached before parsing"""
+        with self.key_pool.track(client.key_index):
+            response = client.generate_content(
+                [sample_file, prompt],
+                request_options=RequestOptions(timeout=300)
+            )
 
-    def create_mcq_prompt(self, subject: str, chapter: str) -> str:
-        """Create detailed prompt for MCQ generation"""
-        return f"""You are an expert educator specializing in Pakistani Intermediate ({subject}) curriculum.
+        if not response.text:
+            raise ValueError("Empty response")
+        self.response_cache.put(cache_key, response.text, pdf_hash=pdf_hash, subject=subject,
+                                chapter=chapter, batch=1, model=self.model_name, prompt=prompt)
+        return self.parse_mcq_response(response.text, subject, chapter)
+
+    def create_mcq_prompt(self, subject: str, chapter: str, count: int = None,
+                          part: Tuple[int, int, int, int] = None) -> str:
+        """Create detailed prompt for MCQ generation
+
+        `part` is (index, total, first_page, last_page) when the chapter was split.
+        """
+        count = count or self.target_mcqs_per_chapter
+        name, grade = subject_grade(subject)  # Prompts name the subject, not its key
+        label = name if grade == 'XI' else f"{name}-{grade.lower()}"
+        scope = "the chapter"
+        if part:
+            index, total, first_page, last_page = part
+            scope = f"this part of the chapter (part {index} of {total}, pages {first_page}-{last_page})"
+
+        return f"""You are an expert educator specializing in Pakistani Intermediate ({label}) curriculum.
 Analyze the provided PDF chapter content and generate comprehensive MCQs.
 
 **Requirements:**
-- Generate EXACTLY {self.target_mcqs_per_chapter} MCQs
-- Cover ALL topics and subtopics from the chapter
+- Generate EXACTLY {count} MCQs
+- Cover ALL topics and subtopics from {scope}
 - Include variety: factual, conceptual, application, and analytical questions
 - Use proper LaTeX formatting for mathematical expressions: $...$ for inline, $$...$$ for display
 - Provide detailed explanations for each answer
@@ -200,7 +359,7 @@ Analyze the provided PDF chapter content and generate comprehensive MCQs.
 **MCQ Format (JSON Array):**
 [
   {{
-    "id": "{subject.lower()}_xi_{chapter}_mcq_001",
+    "id": "{label}_xi_{chapter}_mcq_001",
     "question": "Question text with $LaTeX$ formulas if needed",
     "question_type": "multiple_choice",
     "options": {{
@@ -241,17 +400,22 @@ Generate the MCQs now:"""
             json_start = response_text.find('[')
             json_end = response_text.rfind(']') + 1
 
-            if json_start == -1 or json_end == 0:
+            if json_start == -1:
                 raise ValueError("No JSON array found in response")
 
             json_content = response_text[json_start:json_end]
-            mcqs = json.loads(json_content)
+            try:
+                mcqs = json.loads(json_content)
+            except json.JSONDecodeError:
+                # Keep every well-formed MCQ object; skip malformed or truncated ones
+                mcqs = IncrementalMCQParser().parse_all(response_text[json_start:])
+                if not mcqs:
+                    raise
 
             # Validate and enhance MCQs
             validated_mcqs = []
-            for i, mcq in enumerate(mcqs):
+            for mcq in assign_ids(subject, chapter, mcqs):
                 # Ensure required fields
-                mcq['id'] = f"{subject.lower()}_xi_{chapter}_mcq_{str(i+1).zfill(3)}"
                 mcq['created_date'] = "2024-09-11"
                 mcq['source'] = f"{chapter}.pdf"
                 mcq['ai_generated'] = True
@@ -276,80 +440,131 @@ Generate the MCQs now:"""
             raise ValueError("Failed to parse MCQ response as JSON")
 
     def save_mcqs(self, mcq_data: Dict[str, Any], output_dir: str):
-        """Save MCQs to JSON file"""
-        os.makedirs(output_dir, exist_ok=True)
-
-        subject = mcq_data['subject'].lower()
+        """Merge MCQs into their chapter file by content id, rewriting it only if something changed"""
+        subject = mcq_data['subject']
         chapter = mcq_data['chapter']
 
-        # Create subject directory if needed
-        subject_dir = os.path.join(output_dir, f"{subject}_chapters")
-        os.makedirs(subject_dir, exist_ok=True)
-
-        filename = f"{chapter}_mcqs.json"
-        filepath = os.path.join(subject_dir, filename)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(mcq_data['mcqs'], f, indent=2, ensure_ascii=False)
-
-        print(f"Saved {mcq_data['total_mcqs']} MCQs to {filepath}")
+        filepath = chapter_path(output_dir, subject, chapter)
+        mcqs, report = merge_chapter_file(filepath, subject, chapter, mcq_data['mcqs'])
+        if report['written']:
+            print(f"Saved {len(mcqs)} MCQs to {filepath} ({describe(report)})")
+        else:
+            print(f"{filepath} unchanged ({len(mcqs)} MCQs)")
 
     def process_all_chapters(self, books_dir: str, output_dir: str):
-        """Process all chapters from all subjects"""
-        subjects = {
-            'chemistry': 'chemistry_chapters',
-            'physics': 'physics_chapters',
-            'biology': 'biology_chapters',
-            'mathematics': 'math_chapters',
-            'chemistry-xii': 'chemistryXII_chapters',
-            'physics-xii': 'physicsXII_chapters',
-            'biology-xii': 'biologyXII_chapters',
-            'mathematics-xii': 'mathsXII_chapters'
-        }
-
-        for subject, chapter_dir in subjects.items():
-            chapter_path = os.path.join(books_dir, chapter_dir)
+        """Process all chapters from all subjects concurrently"""
+        subjects = [
+            ('chemistry', 'XI'),
+            ('physics', 'XI'),
+            ('biology', 'XI'),
+            ('mathematics', 'XI'),
+            ('chemistry', 'XII'),
+            ('physics', 'XII'),
+            ('biology', 'XII'),
+            ('mathematics', 'XII'),
+        ]
+
+        jobs = []
+        for name, grade in subjects:
+            subject = subject_key(name, grade)  # Keys output files and ids like the chapter directory
+            chapter_path = os.path.join(books_dir, f"{subject}_chapters")
 
             if not os.path.exists(chapter_path):
                 print(f"Chapter directory not found: {chapter_path}")
                 continue
 
-            print(f"\nProcessing {subject} chapters...")
-
             # Get all PDF files in chapter directory
-            pdf_files = [f for f in os.listdir(chapter_path) if f.endswith('.pdf')]
+            pdf_files = [f for f in os.listdir(chapter_path) if f.endswith('.pdf') and not is_derivative_pdf(f)]
             pdf_files.sort()  # Sort for consistent processing
 
             for pdf_file in pdf_files:
                 chapter_name = pdf_file.replace('.pdf', '')
-                pdf_path = os.path.join(chapter_path, pdf_file)
+                jobs.append((os.path.join(chapter_path, pdf_file), subject, chapter_name))
 
-                print(f"\nGenerating MCQs for {subject} - {chapter_name}")
+        print(f"\nQueued {len(jobs)} chapters across {len(self.api_keys)} API keys")
 
-                try:
-                    mcq_data = self.generate_mcqs_for_chapter(pdf_path, subject, chapter_name)
-                    self.save_mcqs(mcq_data, output_dir)
+        engine = ConcurrentMCQEngine(
+            self.key_pool,
+            requests_per_minute=self.requests_per_minute,
+            max_concurrency=self.max_concurrency,
+        )
 
-                    # Rate limiting and API key rotation
-                    time.sleep(self.rate_limit_delay)
-                    if random.random() < 0.3:  # 30% chance to rotate key
-                        self.rotate_api_key()
+        async def run_all():
+            return await asyncio.gather(*(
+                self.process_chapter_async(engine, pdf_path, subject, chapter, output_dir)
+                for pdf_path, subject, chapter in jobs
+            ))
 
-                except Exception as e:
-                    print(f"Failed to process {chapter_name}: {e}")
-                    continue
+        # Reclaim uploads orphaned by earlier crashed runs (this also quarantines invalid keys)
+        for key_index in range(len(self.api_keys)):
+            if self.key_pool.is_quarantined(key_index):
+                continue
+            try:
+                reclaimed = self.upload_registry.collect_garbage(engine.client(key_index))
+                if reclaimed:
+                    print(f"Key {key_index + 1}: reclaimed {reclaimed} orphaned uploads")
+            except Exception as e:
+                self.key_pool.record_failure(key_index, e)
+                print(f"Key {key_index + 1}: garbage collection failed: {e}")
 
-    async def process_chapter_async(self, pdf_path: str, subject: str, chapter: str, output_dir: str):
-        """Async version for better performance"""
         try:
-            mcq_data = await asyncio.get_event_loop().run_in_executor(
-                None, self.generate_mcqs_for_chapter, pdf_path, subject, chapter
-            )
+            for line in engine.run(run_all()):
+                print(line)
+        finally:
+            engine.shutdown()
+            self.compressor.shutdown()
+
+    async def process_chapter_async(self, engine: ConcurrentMCQEngine, pdf_path: str, subject: str,
+                                    chapter: str, output_dir: str):
+        """Generate one chapter; the parts of a split chapter run in parallel on separate keys"""
+        try:
+            loop = asyncio.get_running_loop()
+            parts = await loop.run_in_executor(engine.executor, self.prepare_pdf_parts, pdf_path)
+
+            if len(parts) == 1:
+                mcq_data = await self.process_part_async(engine, parts[0][0], subject, chapter)
+            else:
+                targets = self.part_targets(parts, self.target_mcqs_per_chapter)
+                results = await asyncio.gather(*(
+                    self.process_part_async(engine, part_path, subject, chapter, target,
+                                            (i + 1, len(parts), first, last))
+                    for i, ((part_path, first, last), target) in enumerate(zip(parts, targets))
+                ))
+                mcq_data = self.merge_parts(subject, chapter, results)
+
             self.save_mcqs(mcq_data, output_dir)
             return f"✓ {subject} - {chapter}: {mcq_data['total_mcqs']} MCQs"
         except Exception as e:
             return f"✗ {subject} - {chapter}: {e}"
 
+    async def process_part_async(self, engine: ConcurrentMCQEngine, part_path: str, subject: str, chapter: str,
+                                 count: int = None, part: Tuple[int, int, int, int] = None) -> Dict[str, Any]:
+        """Generate one PDF part on the least-loaded healthy key, moving on if that key is quarantined.
+
+        The upload's PROCESSING poll, the key's cooldown and the rate limiter
+        are all awaited on the event loop; worker threads only make API calls."""
+        prompt, pdf_hash, cache_key = self.part_request(part_path, subject, chapter, count, part)
+        cached_text = self.response_cache.get(cache_key)
+        if cached_text is not None:
+            print(f"Using cached response for {subject} - {chapter}")
+            return self.parse_mcq_response(cached_text, subject, chapter)
+
+        attempt = 0
+        while True:
+            key_index = engine.pick_key()
+            try:
+                sample_file = await self.upload_part_async(engine, key_index, part_path)
+                return await engine.call(key_index, self.request_part, sample_file, prompt, pdf_hash,
+                                         cache_key, subject, chapter)
+            except Exception as e:
+                if self.key_pool.is_quarantined(key_index):
+                    continue
+                attempt += 1
+                print(f"Attempt {attempt} failed: {e}")
+                if attempt >= self.max_retries:
+                    raise
+            finally:
+                engine.release_key(key_index)
 
 def main():
     # Configuration
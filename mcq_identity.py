@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Content-Hash MCQ Identity
+Derives each MCQ's id from its normalised question text instead of its
+position in a response, and merges regenerated chapters into their files
+by id, reporting what was added, changed and removed so unchanged files,
+rows, bundles and CDN objects stay untouched
+"""
+
+import os
+import sys
+import json
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
+
+from mcq_latex import normalise_text
+from mcq_dedup import LATEX_COMMAND, NON_WORD, chapter_files, load_chapter_file
+
+ID_DIGEST_LENGTH = 12
+
+# Fields whose edits count as a change; ids, stamps and review state aren't content
+CONTENT_FIELDS = ('question', 'options', 'correct_answer', 'explanation', 'difficulty', 'topic', 'subtopic', 'tags')
+
+
+def mcq_content_hash(mcq: Dict[str, Any]) -> str:
+    """SHA-256 of an MCQ's content fields, stable across key order"""
+    content = {field: mcq.get(field) for field in CONTENT_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def normalise_question(question: Any) -> str:
+    """Lowercased question text with LaTeX repaired, markup stripped and whitespace collapsed"""
+    text = LATEX_COMMAND.sub(r' \1 ', normalise_text(str(question or ''))).lower()
+    return NON_WORD.sub(' ', text).strip()
+
+
+def chapter_path(output_dir: str, subject: str, chapter: str) -> str:
+    """<output_dir>/<subject>_chapters/<chapter>_mcqs.json. subject is the key the
+    generators save under ('chemistryXII'), which also prefixes the chapter's ids"""
+    return os.path.join(output_dir, f"{subject}_chapters", f"{chapter}_mcqs.json")
+
+
+def chapter_subject(filepath: str) -> Optional[Tuple[str, str]]:
+    """(subject key, chapter) of a chapter file, the inverse of chapter_path; None for other files"""
+    dir_name = os.path.basename(os.path.dirname(filepath))
+    name = os.path.basename(filepath)
+    if not dir_name.endswith('_chapters') or not name.endswith('_mcqs.json'):
+        return None
+    return dir_name[:-len('_chapters')], name[:-len('_mcqs.json')]
+
+
+def mcq_id(subject: str, chapter: str, mcq: Dict[str, Any]) -> str:
+    """'chemistry_ch1_3f9a0c2b71de': stable however the question is reworded in
+    case, spacing or markup, or wherever it lands in a response"""
+    digest = hashlib.sha256(normalise_question(mcq.get('question')).encode('utf-8')).hexdigest()
+    return f"{subject.lower()}_{chapter}_{digest[:ID_DIGEST_LENGTH]}"
+
+
+def assign_ids(subject: str, chapter: str, mcqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Set every MCQ's content id in place; a question repeated within the list gets -2, -3, ..."""
+    seen: Dict[str, int] = {}
+    for mcq in mcqs:
+        base = mcq_id(subject, chapter, mcq)
+        seen[base] = seen.get(base, 0) + 1
+        mcq['id'] = base if seen[base] == 1 else f"{base}-{seen[base]}"
+    return mcqs
+
+
+def merge_mcqs(existing: List[Dict[str, Any]], incoming: List[Dict[str, Any]],
+               replace: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Upsert incoming MCQs into existing ones by id; returns (merged, report).
+
+    Unchanged MCQs keep their stored object (review state, created_date);
+    changed ones take the incoming content but keep their created_date.
+    Existing order is kept and new MCQs go at the end, so a file only
+    differs where its content did. replace=True treats incoming as the
+    chapter's whole set and drops ids it no longer has."""
+    incoming_by_id = {mcq['id']: mcq for mcq in incoming}
+    report = {'added': [], 'changed': [], 'removed': [], 'unchanged': 0}
+
+    merged = []
+    for mcq in existing:
+        new = incoming_by_id.pop(mcq.get('id'), None)
+        if new is None:
+            if replace:
+                report['removed'].append(mcq.get('id'))
+            else:
+                merged.append(mcq)
+        elif mcq_content_hash(new) == mcq_content_hash(mcq):
+            merged.append(mcq)
+            report['unchanged'] += 1
+        else:
+            if 'created_date' in mcq:
+                new['created_date'] = mcq['created_date']
+            merged.append(new)
+            report['changed'].append(new['id'])
+
+    for mcq in incoming_by_id.values():
+        merged.append(mcq)
+        report['added'].append(mcq['id'])
+    return merged, report
+
+
+def merge_chapter_file(filepath: str, subject: str, chapter: str, mcqs: List[Dict[str, Any]],
+                       replace: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Assign content ids to mcqs and merge them into a chapter file; the file is
+    rewritten (atomically) only if something changed. Returns (merged, report).
+
+    Stored MCQs are re-keyed to their content ids first, so a file still on
+    positional ids ('..._mcq_001') matches by question and keeps its
+    created_dates; report['renamed'] counts the ids that moved."""
+    existing, renamed = reidentify_file(filepath, subject, chapter) if os.path.exists(filepath) else ([], 0)
+    merged, report = merge_mcqs(existing, assign_ids(subject, chapter, mcqs), replace=replace)
+    report['renamed'] = renamed
+
+    report['written'] = (bool(report['added'] or report['changed'] or report['removed'] or renamed)
+                         or not os.path.exists(filepath))
+    if report['written']:
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, filepath)
+    return merged, report
+
+
+def describe(report: Dict[str, Any]) -> str:
+    summary = (f"+{len(report['added'])} ~{len(report['changed'])} -{len(report['removed'])} "
+               f"={report['unchanged']}")
+    if report.get('renamed'):
+        summary += f", {report['renamed']} ids re-keyed"
+    return summary
+
+
+def reidentify_file(filepath: str, subject: str, chapter: str) -> Tuple[List[Dict[str, Any]], int]:
+    """A chapter file's MCQs with content ids, in the same order, and how many ids that changes"""
+    mcqs = [mcq for mcq in load_chapter_file(filepath) if isinstance(mcq, dict)]
+    old_ids = [mcq.get('id') for mcq in mcqs]
+    assign_ids(subject, chapter, mcqs)
+    return mcqs, sum(old != mcq['id'] for old, mcq in zip(old_ids, mcqs))
+
+
+def main():
+    # mcq_identity.py [output_dir] [--write]; reports positional ids, rewriting them with --write
+    output_dir = next((arg for arg in sys.argv[1:] if not arg.startswith('--')), '/home/yaseen/ourbooks/mcq_output')
+    write = '--write' in sys.argv
+
+    print("🆔 MCQ Content Ids")
+    print("=" * 40)
+
+    total = renamed = files = 0
+    for filepath in chapter_files(output_dir):
+        # The same key the generators saved the file (and derived its ids) under
+        located = chapter_subject(filepath)
+        if located is None:
+            continue
+        subject, chapter = located
+
+        mcqs, changed = reidentify_file(filepath, subject, chapter)
+        total += len(mcqs)
+        if not changed:
+            continue
+        renamed += changed
+        files += 1
+        if write:
+            tmp_path = f"{filepath}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(mcqs, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, filepath)
+
+    action = "Rewrote" if write else "Would rewrite"
+    print(f"📊 {action} {renamed}/{total} ids in {files} files")
+    if renamed and not write:
+        print("💡 Run with --write to apply")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Resumable Job Journal for MCQ Generation Runs
+Append-only JSONL log of completed batches and chapters, so a crashed or
+quota-limited run resumes where it stopped instead of re-spending API calls
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+
+def response_hash(response_text: str) -> str:
+    """SHA-256 of a raw response, recorded so resumed batches can be verified"""
+    return hashlib.sha256(response_text.encode('utf-8')).hexdigest()
+
+
+class JobJournal:
+    """Durable record of finished (subject, chapter, batch) work.
+
+    Chapters are identified by subject, chapter name and the PDF's content
+    hash, so XI and XII chapters that share a subject and name never collide
+    and an edited PDF is regenerated."""
+
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self.batches: Dict[Tuple[str, str, str], Dict[int, Dict[str, Any]]] = {}
+        self.chapters: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Replay the journal; a torn final line from a crash is ignored"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.apply(record)
+
+    def apply(self, record: Dict[str, Any]):
+        job = (record['subject'], record['chapter'], record['pdf_hash'])
+        if record['type'] == 'batch':
+            self.batches.setdefault(job, {})[record['batch']] = record
+        elif record['type'] == 'chapter':
+            self.chapters[job] = record
+
+    def append(self, record: Dict[str, Any]):
+        """Durably append a record (flushed and fsynced before returning)"""
+        record['time'] = time.time()
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.apply(record)
+
+    def record_batch(self, subject: str, chapter: str, pdf_hash: str, batch: int,
+                     mcq_count: int, response_text: str, cache_key: str):
+        self.append({
+            'type': 'batch',
+            'subject': subject,
+            'chapter': chapter,
+            'pdf_hash': pdf_hash,
+            'batch': batch,
+            'mcq_count': mcq_count,
+            'response_hash': response_hash(response_text),
+            'cache_key': cache_key,
+        })
+
+    def record_chapter(self, subject: str, chapter: str, pdf_hash: str, mcq_count: int, output_path: str):
+        self.append({
+            'type': 'chapter',
+            'subject': subject,
+            'chapter': chapter,
+            'pdf_hash': pdf_hash,
+            'mcq_count': mcq_count,
+            'output': output_path,
+        })
+
+    def completed_batch(self, subject: str, chapter: str, pdf_hash: str, batch: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.batches.get((subject, chapter, pdf_hash), {}).get(batch)
+
+    def completed_chapter(self, subject: str, chapter: str, pdf_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.chapters.get((subject, chapter, pdf_hash))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+API Key Pool with Health Tracking
+Tracks each Gemini key's success rate, latency, rate-limit and quota errors
+and daily request budget; quarantines invalid keys, cools down throttled ones
+and hands out the least-loaded healthy key
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import datetime
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Set, Callable
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+from mcq_engine import GeminiKeyClient
+from mcq_upload_registry import key_fingerprint
+
+# Substrings of Gemini error messages, checked after the exception type name
+INVALID_KEY_MARKERS = ('API_KEY_INVALID', 'API key not valid', 'API_KEY_SERVICE_BLOCKED',
+                       'PERMISSION_DENIED', 'has been suspended')
+QUOTA_MARKERS = ('PerDay', 'per day', 'daily')
+RATE_LIMIT_MARKERS = ('429', 'RESOURCE_EXHAUSTED', 'Resource has been exhausted', 'quota', 'rate limit')
+RETRY_DELAY = re.compile(r'retry(?:_delay)?\D{0,20}?(\d+(?:\.\d+)?)\s*s', re.IGNORECASE)
+
+
+class KeyUnavailable(Exception):
+    """Raised when a key is quarantined, or when no key is usable at all"""
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'invalid', 'quota', 'rate_limit' or 'transient' for API errors; None for everything else"""
+    name = type(error).__name__
+    message = str(error)
+
+    if name in ('PermissionDenied', 'Unauthenticated') or any(m in message for m in INVALID_KEY_MARKERS):
+        return 'invalid'
+    if name == 'ResourceExhausted' or any(m in message for m in RATE_LIMIT_MARKERS):
+        return 'quota' if any(m in message for m in QUOTA_MARKERS) else 'rate_limit'
+    if name in ('ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+                'TooManyRequests', 'ConnectionError', 'TimeoutError'):
+        return 'transient'
+    return None
+
+
+def quota_clock(now: float) -> datetime.datetime:
+    """Gemini daily quotas reset at midnight Pacific time"""
+    tz = ZoneInfo('America/Los_Angeles') if ZoneInfo else datetime.timezone(datetime.timedelta(hours=-8))
+    return datetime.datetime.fromtimestamp(now, tz)
+
+
+def quota_day(now: float) -> str:
+    """The quota day (Pacific date) now falls in, as YYYY-MM-DD"""
+    return quota_clock(now).strftime('%Y-%m-%d')
+
+
+def next_quota_reset(now: float) -> float:
+    local = quota_clock(now)
+    midnight = (local + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+class KeyPool:
+    """Shared, thread-safe view of every API key's health and load.
+
+    Health survives restarts (keyed by key fingerprint, never the raw key),
+    so keys found invalid once aren't retried on every run until the
+    quarantine expires. Clients are created lazily, one per key."""
+
+    def __init__(self, api_keys: List[str], state_path: str, model_name: str = 'gemini-1.5-flash',
+                 generation_config: Optional[Dict[str, Any]] = None, daily_budget: int = 1500,
+                 base_cooldown: float = 30, max_cooldown: float = 900,
+                 quarantine_seconds: float = 24 * 3600, smoothing: float = 0.2,
+                 save_interval: float = 5.0,
+                 client_factory: Callable[..., GeminiKeyClient] = GeminiKeyClient):
+        self.api_keys = api_keys
+        self.state_path = state_path
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.daily_budget = daily_budget
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.quarantine_seconds = quarantine_seconds
+        self.smoothing = smoothing
+        self.save_interval = save_interval  # Successes alone rewrite the state file at most this often
+        self.client_factory = client_factory  # Swapped for a local stand-in by mcq_benchmark
+
+        self.fingerprints = [key_fingerprint(key) for key in api_keys]
+        self.assigned = [0] * len(api_keys)   # Chapters pinned to each key
+        self.in_flight = [0] * len(api_keys)  # API calls currently running on each key
+        self._clients: Dict[int, GeminiKeyClient] = {}
+        self._lock = threading.RLock()
+        self._last_save = 0.0
+
+        self.health: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        """Load key health from disk"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.health = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.health = {}
+
+    def save(self):
+        """Atomically write key health to disk"""
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.health, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+        self._last_save = time.monotonic()
+
+    def state(self, key_index: int) -> Dict[str, Any]:
+        entry = self.health.setdefault(self.fingerprints[key_index], {
+            'successes': 0,
+            'failures': 0,
+            'rate_limits': 0,
+            'latency': None,
+            'cooldown_until': 0,
+            'consecutive_throttles': 0,
+            'quarantined_until': 0,
+            'quarantine_reason': None,
+            'day': None,
+            'requests_today': 0,
+        })
+        today = quota_day(time.time())  # Counts reset with the quota, not the local date
+        if entry['day'] != today:
+            entry['day'] = today
+            entry['requests_today'] = 0
+        return entry
+
+    def client(self, key_index: int) -> GeminiKeyClient:
+        """Get (or lazily create) the client for an API key"""
+        with self._lock:
+            if key_index not in self._clients:
+                self._clients[key_index] = self.client_factory(
+                    self.api_keys[key_index], key_index, self.model_name, self.generation_config
+                )
+            return self._clients[key_index]
+
+    def success_rate(self, entry: Dict[str, Any]) -> float:
+        # Laplace-smoothed, so an untried key isn't ranked below one with a single failure
+        return (entry['successes'] + 1) / (entry['successes'] + entry['failures'] + 2)
+
+    def is_quarantined(self, key_index: int) -> bool:
+        with self._lock:
+            return self.state(key_index)['quarantined_until'] > time.time()
+
+    def ready_at(self, key_index: int) -> float:
+        """When the key may next be used (0 = now); inf if quarantined"""
+        with self._lock:
+            entry = self.state(key_index)
+            now = time.time()
+            if entry['quarantined_until'] > now:
+                return float('inf')
+            if entry['requests_today'] >= self.daily_budget:
+                return max(entry['cooldown_until'], next_quota_reset(now))
+            return entry['cooldown_until'] if entry['cooldown_until'] > now else 0
+
+    def usable(self, key_index: int) -> bool:
+        return self.ready_at(key_index) == 0
+
+    def best_key(self, exclude: Set[int] = frozenset()) -> int:
+        """Least-loaded healthy key; if every key is cooling down, the one ready soonest"""
+        with self._lock:
+            candidates = [i for i in range(len(self.api_keys)) if i not in exclude]
+            ready = {i: self.ready_at(i) for i in candidates}
+            candidates = [i for i in candidates if ready[i] != float('inf')]
+            if not candidates:
+                raise KeyUnavailable("No usable API keys (all quarantined or none loaded)")
+
+            def rank(i):
+                entry = self.state(i)
+                return (ready[i], self.assigned[i] + self.in_flight[i],
+                        -self.success_rate(entry), entry['latency'] or 0)
+
+            return min(candidates, key=rank)
+
+    def reserve(self) -> int:
+        """Pin a unit of work (a chapter) to the best key; pair with release()"""
+        with self._lock:
+            key_index = self.best_key()
+            self.assigned[key_index] += 1
+            return key_index
+
+    def release(self, key_index: int):
+        with self._lock:
+            self.assigned[key_index] -= 1
+
+    def wait(self, key_index: int):
+        """Block until a key is out of cooldown"""
+        while True:
+            ready = self.ready_at(key_index)
+            if ready == float('inf'):
+                raise KeyUnavailable(f"API key {key_index + 1} is quarantined")
+            if ready <= time.time():
+                return
+            time.sleep(ready - time.time())
+
+    async def wait_async(self, key_index: int):
+        """Wait without blocking the event loop until a key is out of cooldown"""
+        while True:
+            ready = self.ready_at(key_index)
+            if ready == float('inf'):
+                raise KeyUnavailable(f"API key {key_index + 1} is quarantined")
+            if ready <= time.time():
+                return
+            await asyncio.sleep(ready - time.time())
+
+    @contextmanager
+    def track(self, key_index: int):
+        """Account one live API call on a key: load, latency and outcome"""
+        with self._lock:
+            self.in_flight[key_index] += 1
+            self.state(key_index)['requests_today'] += 1
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(key_index, e)
+            raise
+        else:
+            self.record_success(key_index, time.monotonic() - started)
+        finally:
+            with self._lock:
+                self.in_flight[key_index] -= 1
+
+    def record_success(self, key_index: int, latency: float):
+        with self._lock:
+            entry = self.state(key_index)
+            entry['successes'] += 1
+            recovered = entry['consecutive_throttles'] > 0
+            entry['consecutive_throttles'] = 0
+            old = entry['latency']
+            entry['latency'] = latency if old is None else old + self.smoothing * (latency - old)
+            # Counters and latency can lag on disk; a key leaving its backoff can't
+            if recovered or time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+
+    def record_failure(self, key_index: int, error: Exception):
+        """Classify an error and quarantine or cool down the key accordingly"""
+        kind = classify_error(error)
+        if kind is None:
+            return  # Not the key's fault (e.g. an unparseable response)
+
+        with self._lock:
+            entry = self.state(key_index)
+            entry['failures'] += 1
+            now = time.time()
+
+            if kind == 'invalid':
+                entry['quarantined_until'] = now + self.quarantine_seconds
+                entry['quarantine_reason'] = str(error)[:200]
+                print(f"🚫 API key {key_index + 1} quarantined: {entry['quarantine_reason'][:80]}")
+            elif kind == 'quota':
+                entry['rate_limits'] += 1
+                entry['cooldown_until'] = next_quota_reset(now)
+                print(f"⛔ API key {key_index + 1}: daily quota exhausted, resting until reset")
+            elif kind == 'rate_limit':
+                entry['rate_limits'] += 1
+                entry['consecutive_throttles'] += 1
+                match = RETRY_DELAY.search(str(error))
+                cooldown = min(self.max_cooldown,
+                               self.base_cooldown * 2 ** (entry['consecutive_throttles'] - 1))
+                if match:
+                    cooldown = max(cooldown, float(match.group(1)))
+                entry['cooldown_until'] = now + cooldown
+                print(f"⏳ API key {key_index + 1}: rate limited, cooling down {cooldown:.0f}s")
+
+            self.save()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-key health snapshot for reporting"""
+        with self._lock:
+            return [{
+                'key': i + 1,
+                'usable': self.usable(i),
+                'quarantined': self.is_quarantined(i),
+                'success_rate': round(self.success_rate(self.state(i)), 3),
+                'latency': self.state(i)['latency'],
+                'rate_limits': self.state(i)['rate_limits'],
+                'requests_today': self.state(i)['requests_today'],
+                'in_flight': self.in_flight[i],
+            } for i in range(len(self.api_keys))]
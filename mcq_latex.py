@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+LaTeX Normaliser for MCQ Text
+One compiled scan per job over a fixed command table: restores LaTeX
+commands that JSON decoding turned into control characters (\\text → TAB +
+"ext", \\frac → FF + "rac"), doubles backslashes JSON can't take, and renders
+LaTeX to plain text with brace matching for \\frac, \\text, \\ce and friends
+"""
+
+import os
+import re
+import sys
+import json
+from typing import List, Dict, Any, Tuple
+
+# Commands that must never be read as a JSON escape plus letters. A backslash
+# run is matched whole, so \cdots is never taken for \cdot (or \deg for \de)
+COMMANDS = frozenset('''
+    alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa lambda mu nu xi pi
+    varpi rho varrho sigma varsigma tau upsilon phi varphi chi psi omega
+    Gamma Delta Theta Lambda Xi Pi Sigma Upsilon Phi Psi Omega
+    text textbf textit textrm textsf texttt mathrm mathbf mathit mathsf mathcal mathbb operatorname
+    frac dfrac tfrac cfrac binom sqrt ce pu boxed overline underline overbrace underbrace
+    vec hat bar dot ddot tilde widehat widetilde overrightarrow overleftarrow
+    times div cdot cdots ldots dots vdots ddots bullet circ deg prime ast star oplus otimes
+    pm mp approx neq ne leq le geq ge ll gg equiv sim simeq cong propto infty partial nabla
+    int iint iiint oint sum prod lim limsup liminf
+    log ln lg exp sin cos tan sec csc cot arcsin arccos arctan sinh cosh tanh coth
+    max min sup inf det dim gcd arg mod bmod pmod
+    rightarrow leftarrow leftrightarrow Rightarrow Leftarrow Leftrightarrow longrightarrow
+    longleftarrow longleftrightarrow Longrightarrow rightleftharpoons leftrightharpoons
+    uparrow downarrow updownarrow to gets mapsto implies iff
+    left right big Big bigg Bigg displaystyle textstyle quad qquad hspace vspace
+    angle triangle perp parallel mid vert lvert rvert langle rangle lfloor rfloor lceil rceil
+    cup cap subset subseteq supset supseteq in notin forall exists neg land lor emptyset varnothing
+    therefore because hbar ell AA Re Im begin end
+'''.split())
+
+# Plain-text renderings; commands not listed render as their name (sin, log, ...)
+SYMBOLS = {
+    'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'delta': 'δ', 'epsilon': 'ε', 'varepsilon': 'ε', 'zeta': 'ζ',
+    'eta': 'η', 'theta': 'θ', 'vartheta': 'ϑ', 'iota': 'ι', 'kappa': 'κ', 'lambda': 'λ', 'mu': 'μ', 'nu': 'ν',
+    'xi': 'ξ', 'pi': 'π', 'varpi': 'ϖ', 'rho': 'ρ', 'varrho': 'ϱ', 'sigma': 'σ', 'varsigma': 'ς', 'tau': 'τ',
+    'upsilon': 'υ', 'phi': 'φ', 'varphi': 'φ', 'chi': 'χ', 'psi': 'ψ', 'omega': 'ω',
+    'Gamma': 'Γ', 'Delta': 'Δ', 'Theta': 'Θ', 'Lambda': 'Λ', 'Xi': 'Ξ', 'Pi': 'Π', 'Sigma': 'Σ',
+    'Upsilon': 'Υ', 'Phi': 'Φ', 'Psi': 'Ψ', 'Omega': 'Ω',
+    'times': '×', 'div': '÷', 'cdot': '·', 'cdots': '⋯', 'ldots': '…', 'dots': '…', 'vdots': '⋮', 'ddots': '⋱',
+    'bullet': '•', 'circ': '°', 'deg': '°', 'prime': '′', 'ast': '∗', 'star': '⋆', 'oplus': '⊕', 'otimes': '⊗',
+    'pm': '±', 'mp': '∓', 'approx': '≈', 'neq': '≠', 'ne': '≠', 'leq': '≤', 'le': '≤', 'geq': '≥', 'ge': '≥',
+    'll': '≪', 'gg': '≫', 'equiv': '≡', 'sim': '∼', 'simeq': '≃', 'cong': '≅', 'propto': '∝', 'infty': '∞',
+    'partial': '∂', 'nabla': '∇', 'int': '∫', 'iint': '∬', 'iiint': '∭', 'oint': '∮', 'sum': 'Σ', 'prod': 'Π',
+    'rightarrow': '→', 'leftarrow': '←', 'leftrightarrow': '↔', 'Rightarrow': '⇒', 'Leftarrow': '⇐',
+    'Leftrightarrow': '⇔', 'longrightarrow': '→', 'longleftarrow': '←', 'longleftrightarrow': '↔',
+    'Longrightarrow': '⇒', 'rightleftharpoons': '⇌', 'leftrightharpoons': '⇋', 'uparrow': '↑',
+    'downarrow': '↓', 'updownarrow': '↕', 'to': '→', 'gets': '←', 'mapsto': '↦', 'implies': '⇒', 'iff': '⇔',
+    'angle': '∠', 'triangle': '△', 'perp': '⊥', 'parallel': '∥', 'mid': '|', 'vert': '|', 'lvert': '|',
+    'rvert': '|', 'langle': '⟨', 'rangle': '⟩', 'lfloor': '⌊', 'rfloor': '⌋', 'lceil': '⌈', 'rceil': '⌉',
+    'cup': '∪', 'cap': '∩', 'subset': '⊂', 'subseteq': '⊆', 'supset': '⊃', 'supseteq': '⊇', 'in': '∈',
+    'notin': '∉', 'forall': '∀', 'exists': '∃', 'neg': '¬', 'land': '∧', 'lor': '∨', 'emptyset': '∅',
+    'varnothing': '∅', 'therefore': '∴', 'because': '∵', 'hbar': 'ħ', 'ell': 'ℓ', 'AA': 'Å',
+    'quad': ' ', 'qquad': ' ',
+}
+
+# Commands whose one argument is kept as-is, braces dropped
+ARGUMENT_COMMANDS = frozenset('''
+    text textbf textit textrm textsf texttt mathrm mathbf mathit mathsf mathcal mathbb operatorname
+    ce pu boxed overline underline overbrace underbrace vec hat bar dot ddot tilde widehat widetilde
+    overrightarrow overleftarrow hspace vspace
+'''.split())
+FRACTION_COMMANDS = frozenset(('frac', 'dfrac', 'tfrac', 'cfrac'))
+DROPPED_COMMANDS = frozenset(('left', 'right', 'big', 'Big', 'bigg', 'Bigg', 'displaystyle', 'textstyle'))
+ESCAPED_SYMBOLS = {'\\': ' ', ',': ' ', ';': ' ', ':': ' ', '!': '', ' ': ' '}
+
+# JSON escape letters that decoding turns into control characters
+CONTROL_ESCAPES = {'\t': 't', '\f': 'f', '\b': 'b', '\r': 'r', '\n': 'n'}
+
+# Raw JSON: a \\uXXXX escape, a backslash + letter run, or a backslash + any other character
+JSON_BACKSLASH = re.compile(r'\\(?:(u[0-9a-fA-F]{4})|([A-Za-z]+)|(.))', re.S)
+
+# Decoded text: a control character + letter run, or inline math wrapped in markdown backticks
+DECODED_DAMAGE = re.compile(r'([\t\f\b\r\n])([A-Za-z]+)|`(\$\$?[^`$]+\$\$?)`')
+
+LATEX_TOKEN = re.compile(r'\\([A-Za-z]+)|\\(.)|([{}^_$])|([^\\{}^_$]+)', re.S)
+
+
+def _repair_backslash(match) -> str:
+    unicode_escape, letters, other = match.groups()
+    if unicode_escape:
+        return match.group(0)
+    if letters:
+        if letters in COMMANDS or letters[0] not in 'bfnrt':
+            return '\\\\' + letters
+        return match.group(0)  # A real JSON escape, e.g. \nThe
+    return match.group(0) if other in '"\\/' else '\\\\' + other
+
+
+def repair_json_escapes(text: str) -> str:
+    """Escape LaTeX backslashes in raw JSON text so decoding keeps them.
+
+    \\text, \\frac, \\beta, \\rho and \\nu are valid JSON escapes (TAB, FF,
+    BS, CR, LF) followed by letters, so json.loads silently mangles them; a
+    backslash run naming a known command is doubled instead. Properly
+    escaped text passes through unchanged."""
+    return JSON_BACKSLASH.sub(_repair_backslash, text) if '\\' in text else text
+
+
+def _repair_decoded(match) -> str:
+    control, letters, math = match.groups()
+    if math:
+        return DECODED_DAMAGE.sub(_repair_decoded, math)
+    command = CONTROL_ESCAPES[control] + letters
+    return '\\' + command if command in COMMANDS else match.group(0)
+
+
+def normalise_text(text: str) -> str:
+    """Repair an already-decoded string: control characters that were
+    LaTeX commands get their backslash back, and `$math$` loses its backticks"""
+    return DECODED_DAMAGE.sub(_repair_decoded, text)
+
+
+def normalise_mcq(mcq: Dict[str, Any]) -> int:
+    """normalise_text over an MCQ's question, options and explanation, in place; returns fields changed"""
+    changed = 0
+    for field in ('question', 'explanation'):
+        value = mcq.get(field)
+        if isinstance(value, str):
+            fixed = normalise_text(value)
+            if fixed != value:
+                mcq[field] = fixed
+                changed += 1
+
+    options = mcq.get('options')
+    if isinstance(options, dict):
+        for label, value in options.items():
+            if isinstance(value, str):
+                fixed = normalise_text(value)
+                if fixed != value:
+                    options[label] = fixed
+                    changed += 1
+    return changed
+
+
+def _wrap(text: str) -> str:
+    return text if len(text) <= 1 or text.isalnum() else f"({text})"
+
+
+def _render_group(tokens: List[Tuple[str, str, str, str]], i: int) -> Tuple[str, int]:
+    """Render one argument: a {...} group, one character of plain text, or one token"""
+    while i < len(tokens) and tokens[i][3] and not tokens[i][3].strip():
+        i += 1
+    if i >= len(tokens):
+        return '', i
+
+    plain = tokens[i][3].lstrip()
+    if plain:
+        if len(plain) > 1:
+            tokens[i] = ('', '', '', plain[1:])  # \frac12 takes the 1, leaves the 2
+            return plain[0], i
+        return plain, i + 1
+    if tokens[i][2] == '{':
+        return _render(tokens, i + 1, closing=True)
+    return _render_token(tokens, i)
+
+
+def _render_token(tokens: List[Tuple[str, str, str, str]], i: int) -> Tuple[str, int]:
+    command, escaped, special, plain = tokens[i]
+    i += 1
+    if plain:
+        return plain, i
+    if escaped:
+        return ESCAPED_SYMBOLS.get(escaped, escaped), i
+    if special == '{':
+        return _render(tokens, i, closing=True)
+    if special in ('^', '_'):
+        argument, i = _render_group(tokens, i)
+        return special + _wrap(argument), i
+    if special:
+        return '', i  # $ delimiters and stray }
+
+    if command in FRACTION_COMMANDS:
+        numerator, i = _render_group(tokens, i)
+        denominator, i = _render_group(tokens, i)
+        return f"{_wrap(numerator)}/{_wrap(denominator)}", i
+    if command == 'sqrt':
+        argument, i = _render_group(tokens, i)
+        return '√' + _wrap(argument), i
+    if command in ARGUMENT_COMMANDS:
+        return _render_group(tokens, i)
+    if command in DROPPED_COMMANDS:
+        return '', i
+    return SYMBOLS.get(command, command), i
+
+
+def _render(tokens: List[Tuple[str, str, str, str]], i: int, closing: bool = False) -> Tuple[str, int]:
+    parts = []
+    while i < len(tokens):
+        if closing and tokens[i][2] == '}':
+            return ''.join(parts), i + 1
+        part, i = _render_token(tokens, i)
+        parts.append(part)
+    return ''.join(parts), i
+
+
+def latex_to_text(text: str) -> str:
+    """Plain-text rendering of text with inline LaTeX, for search and previews:
+    \\frac{a+b}{2} → (a+b)/2, \\text{ mol} → mol, \\Delta → Δ, $ dropped"""
+    if not text:
+        return ''
+    rendered, _ = _render(LATEX_TOKEN.findall(normalise_text(text)), 0)
+    return ' '.join(rendered.split())
+
+
+def normalise_file(filepath: str) -> Tuple[List[Dict[str, Any]], int]:
+    """A chapter file's MCQs with LaTeX repaired, and how many MCQs changed"""
+    from mcq_dedup import load_chapter_file  # mcq_dedup's parser imports this module
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    before = load_chapter_file(filepath)
+    try:
+        mcqs = json.loads(repair_json_escapes(content))
+    except json.JSONDecodeError:
+        mcqs = json.loads(json.dumps(before))
+    if not isinstance(mcqs, list):
+        return before, 0
+
+    for mcq in mcqs:
+        if isinstance(mcq, dict):
+            normalise_mcq(mcq)
+    changed = sum(1 for old, new in zip(before, mcqs) if old != new) + abs(len(mcqs) - len(before))
+    return mcqs, changed
+
+
+def main():
+    # mcq_latex.py [output_dir] [--write]
+    from mcq_dedup import chapter_files
+
+    output_dir = next((arg for arg in sys.argv[1:] if not arg.startswith('--')), '/home/yaseen/ourbooks/mcq_output')
+    write = '--write' in sys.argv
+
+    print("🧮 LaTeX Normaliser")
+    print("=" * 40)
+
+    files_changed = 0
+    mcqs_changed = 0
+    for filepath in chapter_files(output_dir):
+        mcqs, changed = normalise_file(filepath)
+        if not changed:
+            continue
+
+        files_changed += 1
+        mcqs_changed += changed
+        label = os.path.relpath(filepath, output_dir)
+        print(f"• {label}: {changed}/{len(mcqs)} MCQs {'repaired' if write else 'need repair'}")
+        if write:
+            tmp_path = f"{filepath}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(mcqs, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, filepath)
+
+    print(f"\n📊 {files_changed} files, {mcqs_changed} MCQs {'repaired' if write else 'to repair'}")
+    if files_changed and not write:
+        print("💡 Run with --write to save the repaired files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Per-Phase Metrics for MCQ Generation
+Times every request phase (compress, upload, processing poll, generate,
+parse, validate, dedup, save) with its token counts, key, MCQ outcomes and retries,
+appends each record to a JSONL file and keeps a Prometheus textfile of the
+aggregates up to date
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+# Upper bounds (seconds) of the phase duration histogram buckets
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+RECORD_FIELDS = ('subject', 'chapter', 'batch', 'key', 'input_tokens', 'output_tokens',
+                 'accepted', 'rejected', 'retries')
+
+
+def usage_tokens(response) -> Tuple[Optional[int], Optional[int]]:
+    """(input, output) token counts from a response's usage_metadata, if it has any"""
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None)
+
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+class MetricsRecorder:
+    """Thread-safe sink for phase records.
+
+    Every record is one JSONL line with the same fields (None where a phase
+    has nothing to report). Aggregates are kept per (phase, subject, key)
+    and rewritten atomically to the textfile at most every flush_interval
+    seconds, as node_exporter's textfile collector expects."""
+
+    def __init__(self, jsonl_path: str, prometheus_path: str, flush_interval: float = 15):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.flush_interval = flush_interval
+
+        self.phases: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.tokens: Dict[Tuple[str, str, str], int] = {}     # (direction, subject, key) -> tokens
+        self.mcqs: Dict[Tuple[str, str, str], int] = {}       # (outcome, phase, subject) -> MCQs
+        self.chapter_failures: Dict[Tuple[str, str], int] = {}
+        self.flushed = 0.0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, **fields):
+        """Time a block as one record; the block may fill in fields of the yielded dict"""
+        record = dict(fields)
+        started = time.monotonic()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            self.record(name, time.monotonic() - started, **record)
+
+    def record(self, name: str, seconds: float, error: str = None, **fields):
+        """Write one phase record and fold it into the aggregates"""
+        subject = fields.get('subject')
+        chapter = fields.get('chapter')
+
+        with self._lock:
+            if name == 'generate' and subject and chapter:
+                # Failed calls are retried as later batches of the same chapter
+                chapter_key = (subject, chapter)
+                fields.setdefault('retries', self.chapter_failures.get(chapter_key, 0))
+                if error:
+                    self.chapter_failures[chapter_key] = self.chapter_failures.get(chapter_key, 0) + 1
+
+            record = {'time': time.time(), 'phase': name, 'seconds': round(seconds, 4), 'error': error}
+            record.update({field: fields.pop(field, None) for field in RECORD_FIELDS})
+            if record['key'] is not None:
+                record['key'] += 1  # Keys are numbered from 1, as in the logs
+            record.update(fields)
+            self.aggregate(record)
+
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.jsonl_path) or '.', exist_ok=True)
+                self._file = open(self.jsonl_path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+            if time.time() - self.flushed >= self.flush_interval:
+                self.write_prometheus()
+
+    def aggregate(self, record: Dict[str, Any]):
+        """Fold a record into the Prometheus aggregates (caller holds the lock)"""
+        subject = record['subject'] or ''
+        key = '' if record['key'] is None else str(record['key'])
+
+        stats = self.phases.setdefault((record['phase'], subject, key), {
+            'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(SECONDS_BUCKETS),
+        })
+        stats['count'] += 1
+        stats['errors'] += int(bool(record['error']))
+        stats['seconds'] += record['seconds']
+        for i, bound in enumerate(SECONDS_BUCKETS):
+            if record['seconds'] <= bound:
+                stats['buckets'][i] += 1
+
+        for direction in ('input', 'output'):
+            count = record[f'{direction}_tokens']
+            if count:
+                token_key = (direction, subject, key)
+                self.tokens[token_key] = self.tokens.get(token_key, 0) + count
+
+        for outcome in ('accepted', 'rejected'):
+            count = record[outcome]
+            if count:
+                mcq_key = (outcome, record['phase'], subject)
+                self.mcqs[mcq_key] = self.mcqs.get(mcq_key, 0) + count
+
+    def write_prometheus(self):
+        """Atomically rewrite the textfile (caller holds the lock)"""
+        lines = [
+            '# HELP mcq_phase_seconds Wall time of MCQ generation phases',
+            '# TYPE mcq_phase_seconds histogram',
+        ]
+        for (phase, subject, key), stats in sorted(self.phases.items()):
+            labels = {'phase': phase, 'subject': subject, 'key': key}
+            for bound, count in zip(SECONDS_BUCKETS, stats['buckets']):
+                lines.append(f"mcq_phase_seconds_bucket{{{prometheus_labels(dict(labels, le=bound))}}} {count}")
+            lines.append(f"mcq_phase_seconds_bucket{{{prometheus_labels(dict(labels, le='+Inf'))}}} {stats['count']}")
+            lines.append(f"mcq_phase_seconds_sum{{{prometheus_labels(labels)}}} {stats['seconds']:.4f}")
+            lines.append(f"mcq_phase_seconds_count{{{prometheus_labels(labels)}}} {stats['count']}")
+
+        # Failed generate calls are what later batches retry
+        lines += ['# HELP mcq_phase_errors_total Phases that raised', '# TYPE mcq_phase_errors_total counter']
+        for (phase, subject, key), stats in sorted(self.phases.items()):
+            labels = prometheus_labels({'phase': phase, 'subject': subject, 'key': key})
+            lines.append(f"mcq_phase_errors_total{{{labels}}} {stats['errors']}")
+
+        lines += ['# HELP mcq_tokens_total Gemini tokens from usage_metadata', '# TYPE mcq_tokens_total counter']
+        for (direction, subject, key), count in sorted(self.tokens.items()):
+            labels = prometheus_labels({'direction': direction, 'subject': subject, 'key': key})
+            lines.append(f"mcq_tokens_total{{{labels}}} {count}")
+
+        lines += ['# HELP mcq_mcqs_total MCQs accepted or rejected, by the phase that decided',
+                  '# TYPE mcq_mcqs_total counter']
+        for (outcome, phase, subject), count in sorted(self.mcqs.items()):
+            labels = prometheus_labels({'outcome': outcome, 'phase': phase, 'subject': subject})
+            lines.append(f"mcq_mcqs_total{{{labels}}} {count}")
+
+        os.makedirs(os.path.dirname(self.prometheus_path) or '.', exist_ok=True)
+        tmp_path = f"{self.prometheus_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
+        self.flushed = time.time()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-phase totals across subjects and keys"""
+        with self._lock:
+            totals: Dict[str, Dict[str, Any]] = {}
+            for (phase, _, _), stats in self.phases.items():
+                total = totals.setdefault(phase, {'count': 0, 'errors': 0, 'seconds': 0.0})
+                total['count'] += stats['count']
+                total['errors'] += stats['errors']
+                total['seconds'] += stats['seconds']
+            return {phase: dict(total, seconds=round(total['seconds'], 2)) for phase, total in sorted(totals.items())}
+
+    def close(self):
+        """Write the final textfile and close the JSONL file"""
+        with self._lock:
+            if self.phases:
+                self.write_prometheus()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
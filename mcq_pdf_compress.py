@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Image-Aware PDF Compression
+Downsamples embedded images to a target DPI and re-encodes them as JPEG,
+binary-searching the quality so the chapter fits the upload size budget
+while keeping its figures; each chapter compresses in a worker process
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional
+
+try:
+    import fitz
+except ImportError:
+    print("❌ PyMuPDF not installed. Run: pip install PyMuPDF")
+    exit(1)
+
+MIN_IMAGE_SIDE = 64  # Icons and rules aren't worth re-encoding
+COMPRESSION_VERSION = 1  # Bump when the output changes, to invalidate cached artifacts
+
+
+def image_display_widths(doc) -> Dict[int, float]:
+    """Widest on-page rendering (in inches) of every image xref in the document"""
+    widths: Dict[int, float] = {}
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref = img[0]
+            try:
+                rects = page.get_image_rects(xref)
+            except Exception:
+                rects = []
+            for rect in rects:
+                widths[xref] = max(widths.get(xref, 0.0), rect.width / 72)
+    return widths
+
+
+def rewrite_images(doc, dpi: int, quality: int) -> int:
+    """Downsample and JPEG-encode every eligible image in place; returns how many changed"""
+    widths = image_display_widths(doc)
+    rewritten = 0
+    seen = set()
+
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref, smask, width, height, bpc = img[0], img[1], img[2], img[3], img[4]
+            if xref in seen:
+                continue
+            seen.add(xref)
+
+            # Soft-masked images would lose transparency, and 1-bit scans grow as JPEG
+            if smask or bpc == 1 or min(width, height) < MIN_IMAGE_SIDE:
+                continue
+
+            try:
+                pix = fitz.Pixmap(doc, xref)
+                if pix.alpha:
+                    pix = fitz.Pixmap(pix, 0)
+                if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+
+                shown_width = widths.get(xref)
+                if shown_width and pix.width / shown_width > dpi:
+                    scale = dpi * shown_width / pix.width
+                    pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)), None)
+
+                data = pix.tobytes('jpeg', jpg_quality=quality)
+                if len(data) < len(doc.xref_stream_raw(xref) or b''):
+                    page.replace_image(xref, stream=data)
+                    rewritten += 1
+            except Exception:
+                continue  # Leave images PyMuPDF can't decode untouched
+
+    return rewritten
+
+
+def compressed_bytes(pdf_path: str, dpi: Optional[int], quality: Optional[int]) -> bytes:
+    """The PDF re-saved with garbage collection, and images rewritten if dpi/quality given"""
+    with fitz.open(pdf_path) as doc:
+        if dpi and quality:
+            rewrite_images(doc, dpi, quality)
+        return doc.tobytes(garbage=4, deflate=True, clean=True)
+
+
+def compress_pdf_file(pdf_path: str, output_path: str, max_size_mb: float, dpis=(150, 110, 72),
+                      min_quality: int = 20, max_quality: int = 85) -> Dict[str, Any]:
+    """Write the best-looking version of a PDF that fits max_size_mb; runs in a worker process.
+
+    Lossless cleanup is tried first. Otherwise, for each DPI in turn, the
+    JPEG quality is binary-searched for the highest value that fits. If
+    nothing fits, the smallest attempt is written and the caller splits it."""
+    budget = max_size_mb * 1024 * 1024
+    attempts = 0
+
+    best = compressed_bytes(pdf_path, None, None)
+    result = {'dpi': None, 'quality': None}
+    attempts += 1
+
+    if len(best) > budget:
+        smallest = best
+        for dpi in dpis:
+            low, high, fitted = min_quality, max_quality, None
+            quality = max_quality  # Most chapters fit at full quality once downsampled
+            while low <= high:
+                data = compressed_bytes(pdf_path, dpi, quality)
+                attempts += 1
+                if len(data) <= budget:
+                    fitted = (data, quality)
+                    low = quality + 1
+                else:
+                    if len(data) < len(smallest):
+                        smallest, result = data, {'dpi': dpi, 'quality': quality}
+                    high = quality - 1
+                quality = (low + high) // 2
+
+            if fitted:
+                best, result = fitted[0], {'dpi': dpi, 'quality': fitted[1]}
+                break
+        else:
+            best = smallest
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(best)
+    os.replace(tmp_path, output_path)
+
+    return {
+        'path': output_path,
+        'size_mb': len(best) / (1024 * 1024),
+        'fits': len(best) <= budget,
+        'attempts': attempts,
+        **result,
+    }
+
+
+class PDFCompressor:
+    """Runs compress_pdf_file in a shared process pool, so concurrent chapters don't
+    serialise on the GIL; callers block only on their own chapter."""
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def compress(self, pdf_path: str, output_path: str, max_size_mb: float) -> Dict[str, Any]:
+        """Compress one chapter in a worker process and wait for the result"""
+        return self.executor().submit(compress_pdf_file, pdf_path, output_path, max_size_mb).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Local PDF Text Extraction for MCQ Prompts
+Extracts chapter text page by page in a process pool, keeping superscripts
+and subscripts as LaTeX, and groups pages into sections so each batch can
+send a targeted page range as plain text instead of the whole uploaded PDF
+"""
+
+import os
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple
+
+try:
+    import fitz
+except ImportError:
+    print("❌ PyMuPDF not installed. Run: pip install PyMuPDF")
+    exit(1)
+
+from mcq_upload_registry import file_sha256
+
+SUPERSCRIPT_FLAG = 1  # PyMuPDF span flag bit
+
+
+def span_text(span: Dict[str, Any], line_size: float, line_baseline: float) -> str:
+    """A span's text, marked up as ^{...} or _{...} if it is a raised or lowered script"""
+    text = span['text']
+    if not text.strip() or span['size'] >= 0.85 * line_size:
+        return text
+    if span['flags'] & SUPERSCRIPT_FLAG or span['origin'][1] < line_baseline - 0.1 * line_size:
+        return f"^{{{text.strip()}}}"
+    if span['origin'][1] > line_baseline + 0.1 * line_size:
+        return f"_{{{text.strip()}}}"
+    return text
+
+
+def page_text(page) -> str:
+    """Reading-order text of one page, with scripts kept so equations survive"""
+    blocks = []
+    for block in page.get_text('dict')['blocks']:
+        if block.get('type') != 0:
+            continue  # Image block
+
+        lines = []
+        for line in block['lines']:
+            spans = line['spans']
+            if not spans:
+                continue
+            # The line's main text sets the reference size and baseline for scripts
+            main = max(spans, key=lambda s: (s['size'], len(s['text'])))
+            text = ''.join(span_text(s, main['size'], main['origin'][1]) for s in spans)
+            if text.strip():
+                lines.append(text.rstrip())
+
+        if lines:
+            blocks.append('\n'.join(lines))
+
+    return '\n\n'.join(blocks)
+
+
+def extract_page_range(pdf_path: str, first_page: int, last_page: int) -> List[str]:
+    """Text of pages first_page..last_page (0-based, inclusive); runs in a worker process"""
+    with fitz.open(pdf_path) as doc:
+        return [page_text(doc[i]) for i in range(first_page, last_page + 1)]
+
+
+class PDFTextExtractor:
+    """Extracts and caches chapter text, and splits it into prompt-sized sections.
+
+    Page text is cached on disk by the PDF's SHA-256, so a chapter is only
+    extracted once across batches, boosts and runs."""
+
+    def __init__(self, cache_dir: str, workers: int = None, pages_per_task: int = 4):
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self._executor = None
+        self._hashes: Dict[Tuple[str, float, int], str] = {}
+        self._pages: Dict[str, List[str]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def pages(self, pdf_path: str) -> List[str]:
+        """Text of every page of a PDF, extracted in parallel on first use"""
+        stat = os.stat(pdf_path)
+        hash_key = (os.path.abspath(pdf_path), stat.st_mtime, stat.st_size)
+        if hash_key not in self._hashes:
+            self._hashes[hash_key] = file_sha256(pdf_path)
+        pdf_hash = self._hashes[hash_key]
+
+        with self._lock:
+            if pdf_hash in self._pages:
+                return self._pages[pdf_hash]
+            lock = self._locks.setdefault(pdf_hash, threading.Lock())
+
+        # Concurrent batches of one chapter wait for a single extraction
+        with lock:
+            if pdf_hash not in self._pages:
+                self._pages[pdf_hash] = self.load_or_extract(pdf_path, pdf_hash)
+            return self._pages[pdf_hash]
+
+    def load_or_extract(self, pdf_path: str, pdf_hash: str) -> List[str]:
+        cache_path = os.path.join(self.cache_dir, f"{pdf_hash}.json")
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+        ranges = [(first, min(first + self.pages_per_task, page_count) - 1)
+                  for first in range(0, page_count, self.pages_per_task)]
+        futures = [self.executor().submit(extract_page_range, pdf_path, first, last) for first, last in ranges]
+        pages = [text for future in futures for text in future.result()]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pages, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+        print(f"📝 Extracted {page_count} pages of text from {os.path.basename(pdf_path)}")
+        return pages
+
+    def sections(self, pdf_path: str, max_chars: int) -> List[Tuple[int, int, str]]:
+        """Consecutive page ranges of at most ~max_chars text: (first_page, last_page, text), 1-based"""
+        sections = []
+        first, texts, size = 1, [], 0
+        for number, text in enumerate(self.pages(pdf_path), 1):
+            if texts and size + len(text) > max_chars:
+                sections.append((first, number - 1, '\n\n'.join(texts)))
+                first, texts, size = number, [], 0
+            texts.append(text)
+            size += len(text)
+        if texts:
+            sections.append((first, first + len(texts) - 1, '\n\n'.join(texts)))
+        return sections
+
+    def section_for_batch(self, pdf_path: str, batch_num: int, max_chars: int) -> Tuple[int, int, str]:
+        """The section a batch should draw its questions from; batches cycle through the chapter"""
+        sections = [section for section in self.sections(pdf_path, max_chars) if section[2].strip()]
+        if not sections:
+            raise ValueError(f"No extractable text in {pdf_path} (scanned PDF? use upload mode)")
+        return sections[(batch_num - 1) % len(sections)]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+SQLite Question Bank
+Loads every chapter file in mcq_output into SQLite, with an FTS5 index over
+question, option and explanation text and indexes on subject, grade,
+chapter, difficulty, topic and tags; re-syncs incrementally, only touching
+changed files and MCQs, so ad-hoc queries skip the scan-and-parse
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Dict, Any, Tuple
+
+from mcq_dedup import chapter_files, load_chapter_file
+from mcq_identity import mcq_content_hash
+
+# mcq_output directory prefix -> (subject, grade)
+SUBJECT_DIRS = {
+    'chemistry': ('chemistry', 'XI'),
+    'physics': ('physics', 'XI'),
+    'biology': ('biology', 'XI'),
+    'math': ('mathematics', 'XI'),
+    'mathematics': ('mathematics', 'XI'),
+    'chemistryXII': ('chemistry', 'XII'),
+    'physicsXII': ('physics', 'XII'),
+    'biologyXII': ('biology', 'XII'),
+    'mathsXII': ('mathematics', 'XII'),
+}
+
+FILTER_COLUMNS = ('subject', 'grade', 'chapter', 'difficulty', 'topic', 'subtopic')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    mcq_count INTEGER,
+    synced REAL
+);
+CREATE TABLE IF NOT EXISTS mcqs (
+    rowid INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    id TEXT NOT NULL,
+    subject TEXT,
+    grade TEXT,
+    chapter TEXT,
+    difficulty TEXT,
+    topic TEXT,
+    subtopic TEXT,
+    tags TEXT,
+    question TEXT,
+    options_text TEXT,
+    explanation TEXT,
+    correct_answer TEXT,
+    content_hash TEXT,
+    data TEXT,
+    updated REAL,
+    UNIQUE (file, id)
+);
+CREATE INDEX IF NOT EXISTS idx_mcqs_chapter ON mcqs(subject, grade, chapter);
+CREATE INDEX IF NOT EXISTS idx_mcqs_difficulty ON mcqs(difficulty, subject);
+CREATE INDEX IF NOT EXISTS idx_mcqs_topic ON mcqs(topic, subtopic);
+CREATE INDEX IF NOT EXISTS idx_mcqs_hash ON mcqs(content_hash);
+
+CREATE TABLE IF NOT EXISTS mcq_tags (
+    mcq_rowid INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tags_tag ON mcq_tags(tag, mcq_rowid);
+CREATE INDEX IF NOT EXISTS idx_tags_mcq ON mcq_tags(mcq_rowid);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS mcq_fts USING fts5(
+    question, options_text, explanation,
+    content='mcqs', content_rowid='rowid', tokenize='porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS mcqs_ai AFTER INSERT ON mcqs BEGIN
+    INSERT INTO mcq_fts(rowid, question, options_text, explanation)
+    VALUES (new.rowid, new.question, new.options_text, new.explanation);
+    INSERT INTO mcq_tags(mcq_rowid, tag) SELECT new.rowid, value FROM json_each(new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS mcqs_ad AFTER DELETE ON mcqs BEGIN
+    INSERT INTO mcq_fts(mcq_fts, rowid, question, options_text, explanation)
+    VALUES ('delete', old.rowid, old.question, old.options_text, old.explanation);
+    DELETE FROM mcq_tags WHERE mcq_rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS mcqs_au AFTER UPDATE ON mcqs BEGIN
+    INSERT INTO mcq_fts(mcq_fts, rowid, question, options_text, explanation)
+    VALUES ('delete', old.rowid, old.question, old.options_text, old.explanation);
+    INSERT INTO mcq_fts(rowid, question, options_text, explanation)
+    VALUES (new.rowid, new.question, new.options_text, new.explanation);
+    DELETE FROM mcq_tags WHERE mcq_rowid = old.rowid;
+    INSERT INTO mcq_tags(mcq_rowid, tag) SELECT new.rowid, value FROM json_each(new.tags);
+END;
+"""
+
+
+def subject_grade(dir_name: str) -> Tuple[str, str]:
+    """('chemistry', 'XII') for 'chemistryXII_chapters'"""
+    prefix = dir_name[:-len('_chapters')] if dir_name.endswith('_chapters') else dir_name
+    if prefix in SUBJECT_DIRS:
+        return SUBJECT_DIRS[prefix]
+    match = re.match(r'(.*?)_?(XII|XI|xii|xi)?$', prefix)
+    return match.group(1).lower(), (match.group(2) or 'XI').upper()
+
+
+def subject_key(subject: str, grade: str = 'XI') -> str:
+    """'chemistryXII' for ('chemistry', 'XII'): the chapter directory prefix that keys a
+    subject's files, dedup labels, combined log, journal entries and MCQ ids"""
+    for prefix, (name, level) in SUBJECT_DIRS.items():
+        if (name, level) == (subject.lower(), grade.upper()):
+            return prefix  # 'math' before 'mathematics', as the books are laid out
+    return subject.lower() if grade.upper() == 'XI' else f"{subject.lower()}{grade.upper()}"
+
+
+def fts_query(text: str) -> str:
+    """Quote each search term so user input can't break FTS5 syntax; a trailing * keeps prefix search"""
+    terms = []
+    for term in text.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms)
+
+
+class QuestionBank:
+    """SQLite view of mcq_output, keyed by (chapter file, MCQ id).
+
+    Ids aren't unique across the corpus (some physics files reuse chemistry
+    ids), so rows are scoped to their file; an MCQ without an id is keyed by
+    its content hash. Unchanged files are skipped by mtime and size, and
+    unchanged MCQs in a changed file by content hash."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def sync(self, output_dir: str) -> Dict[str, int]:
+        """Bring the bank in line with output_dir; returns counts of what changed"""
+        stats = {'files_scanned': 0, 'files_skipped': 0, 'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        seen_files = set()
+
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self.conn.execute("SELECT file, mtime, size FROM files")}
+
+            for filepath in chapter_files(output_dir):
+                file = os.path.relpath(filepath, output_dir).replace(os.sep, '/')
+                seen_files.add(file)
+                stat = os.stat(filepath)
+                if known.get(file) == (stat.st_mtime, stat.st_size):
+                    stats['files_skipped'] += 1
+                    continue
+
+                stats['files_scanned'] += 1
+                mcqs = [mcq for mcq in load_chapter_file(filepath) if isinstance(mcq, dict)]
+                self.sync_file(file, mcqs, stats)
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                  (file, stat.st_mtime, stat.st_size, len(mcqs), time.time()))
+
+            for file in set(known) - seen_files:
+                stats['removed'] += self.conn.execute("DELETE FROM mcqs WHERE file = ?", (file,)).rowcount
+                self.conn.execute("DELETE FROM files WHERE file = ?", (file,))
+
+            self.conn.commit()
+        return stats
+
+    def sync_file(self, file: str, mcqs: List[Dict[str, Any]], stats: Dict[str, int]):
+        """Upsert one chapter file's MCQs and drop the ones it no longer has (caller holds the lock)"""
+        subject, grade = subject_grade(os.path.dirname(file))
+        chapter = os.path.basename(file)[:-len('_mcqs.json')]
+        existing = {row[0]: row[1] for row in
+                    self.conn.execute("SELECT id, content_hash FROM mcqs WHERE file = ?", (file,))}
+
+        now = time.time()
+        ids = set()
+        for mcq in mcqs:
+            content_hash = mcq_content_hash(mcq)
+            mcq_id = str(mcq.get('id') or content_hash[:16])
+            if mcq_id in ids:
+                mcq_id = f"{mcq_id}#{content_hash[:8]}"  # Repeated id within one file
+            ids.add(mcq_id)
+
+            if existing.get(mcq_id) == content_hash:
+                stats['unchanged'] += 1
+                continue
+            stats['updated' if mcq_id in existing else 'added'] += 1
+
+            options = mcq.get('options') or {}
+            options_text = '\n'.join(str(v) for v in options.values()) if isinstance(options, dict) else str(options)
+            tags = mcq.get('tags') or []
+            self.conn.execute("""
+                INSERT INTO mcqs (file, id, subject, grade, chapter, difficulty, topic, subtopic, tags,
+                                  question, options_text, explanation, correct_answer, content_hash, data, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file, id) DO UPDATE SET
+                    difficulty = excluded.difficulty, topic = excluded.topic, subtopic = excluded.subtopic,
+                    tags = excluded.tags, question = excluded.question, options_text = excluded.options_text,
+                    explanation = excluded.explanation, correct_answer = excluded.correct_answer,
+                    content_hash = excluded.content_hash, data = excluded.data, updated = excluded.updated
+            """, (
+                file, mcq_id, subject, grade, chapter,
+                str(mcq.get('difficulty', '')).lower(), mcq.get('topic'), mcq.get('subtopic'),
+                json.dumps(tags if isinstance(tags, list) else [tags], ensure_ascii=False),
+                mcq.get('question'), options_text, mcq.get('explanation'), mcq.get('correct_answer'),
+                content_hash, json.dumps(mcq, ensure_ascii=False), now,
+            ))
+
+        stale = [(file, mcq_id) for mcq_id in existing if mcq_id not in ids]
+        if stale:
+            self.conn.executemany("DELETE FROM mcqs WHERE file = ? AND id = ?", stale)
+            stats['removed'] += len(stale)
+
+    def search(self, text: str = None, tag: str = None, limit: int = 50, **filters) -> List[Dict[str, Any]]:
+        """MCQs matching full-text terms and column filters, best text matches first.
+
+        Filters are exact unless the value contains % (SQL LIKE), e.g.
+        search('entropy', difficulty='hard', topic='thermo%')."""
+        clauses, params = [], []
+        for column, value in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown filter: {column}")
+            if value is None:
+                continue
+            clauses.append(f"mcqs.{column} {'LIKE' if '%' in str(value) else '='} ?")
+            params.append(value)
+        if tag:
+            clauses.append("mcqs.rowid IN (SELECT mcq_rowid FROM mcq_tags WHERE tag = ?)")
+            params.append(tag)
+
+        if text:
+            sql = "SELECT mcqs.file, mcqs.subject, mcqs.grade, mcqs.chapter, mcqs.data FROM mcq_fts " \
+                  "JOIN mcqs ON mcqs.rowid = mcq_fts.rowid WHERE mcq_fts MATCH ?"
+            params.insert(0, fts_query(text))
+            order = "ORDER BY bm25(mcq_fts)"
+        else:
+            sql = "SELECT mcqs.file, mcqs.subject, mcqs.grade, mcqs.chapter, mcqs.data FROM mcqs WHERE 1"
+            order = "ORDER BY mcqs.subject, mcqs.grade, mcqs.chapter, mcqs.rowid"
+
+        sql = ' '.join([sql] + [f"AND {clause}" for clause in clauses] + [order, "LIMIT ?"])
+        with self._lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+
+        return [{'file': file, 'subject': subject, 'grade': grade, 'chapter': chapter, 'mcq': json.loads(data)}
+                for file, subject, grade, chapter, data in rows]
+
+    def counts(self, *columns: str) -> List[Tuple]:
+        """MCQ counts grouped by the given columns, e.g. counts('subject', 'grade')"""
+        for column in columns:
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown column: {column}")
+        group = ', '.join(columns)
+        with self._lock:
+            return self.conn.execute(f"SELECT {group}, COUNT(*) FROM mcqs GROUP BY {group} ORDER BY {group}").fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def main():
+    # mcq_question_bank.py [sync] [output_dir] | search <terms...> [column=value ...] | counts [column ...]
+    args = sys.argv[1:]
+    command = args.pop(0) if args and args[0] in ('sync', 'search', 'counts') else 'sync'
+    output_dir = '/home/yaseen/ourbooks/mcq_output'
+    bank = QuestionBank('/home/yaseen/ourbooks/.mcq_cache/question_bank.sqlite3')
+
+    if command == 'sync':
+        if args:
+            output_dir = args[0]
+        started = time.time()
+        stats = bank.sync(output_dir)
+        print(f"🗃️ Synced {output_dir} in {time.time() - started:.2f}s: {stats['added']} added, "
+              f"{stats['updated']} updated, {stats['removed']} removed, {stats['unchanged']} unchanged "
+              f"({stats['files_scanned']} files read, {stats['files_skipped']} unchanged)")
+
+    elif command == 'search':
+        filters = dict(arg.split('=', 1) for arg in args if '=' in arg)
+        text = ' '.join(arg for arg in args if '=' not in arg)
+        limit = int(filters.pop('limit', 20))
+        started = time.time()
+        results = bank.search(text or None, tag=filters.pop('tag', None), limit=limit, **filters)
+        elapsed_ms = (time.time() - started) * 1000
+        for result in results:
+            mcq = result['mcq']
+            print(f"• [{result['subject']} {result['grade']} {result['chapter']}, {mcq.get('difficulty')}] "
+                  f"{str(mcq.get('question', ''))[:90]}")
+        print(f"\n🔎 {len(results)} MCQs in {elapsed_ms:.1f}ms")
+
+    else:
+        columns = args or ['subject', 'grade']
+        for row in bank.counts(*columns):
+            print(f"• {' / '.join(str(v) for v in row[:-1])}: {row[-1]} MCQs")
+
+    bank.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Balanced Quiz Builder
+Buckets each subject's MCQs by difficulty and topic once, then deals
+cross-chapter quizzes that follow the prompt's 30/40/20/10 difficulty mix
+in O(quiz size) each, and writes N static quiz files per subject so test
+papers are served as-is instead of filtered out of whole chapters
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+from typing import List, Dict, Any, Tuple
+
+from mcq_dedup import chapter_files, load_chapter_file
+from mcq_bundle import minify, content_hash, write_atomic
+
+QUIZ_DIR_NAME = 'quizzes'
+
+# The mix MCQGenerator.create_mcq_prompt asks Gemini for
+DIFFICULTY_MIX = {'easy': 0.3, 'medium': 0.4, 'hard': 0.2, 'expert': 0.1}
+
+# Where a short difficulty's share goes, nearest level first
+FALLBACK = {
+    'easy': ('medium', 'hard', 'expert'),
+    'medium': ('easy', 'hard', 'expert'),
+    'hard': ('expert', 'medium', 'easy'),
+    'expert': ('hard', 'medium', 'easy'),
+}
+
+
+def difficulty_quotas(size: int, available: Dict[str, int]) -> Dict[str, int]:
+    """Split size across difficulties by DIFFICULTY_MIX (largest remainder),
+    moving any share a difficulty can't fill to its nearest neighbour"""
+    shares = {level: size * weight for level, weight in DIFFICULTY_MIX.items()}
+    quotas = {level: int(share) for level, share in shares.items()}
+    for level in sorted(shares, key=lambda level: shares[level] - quotas[level], reverse=True):
+        if sum(quotas.values()) >= size:
+            break
+        quotas[level] += 1
+
+    for level in DIFFICULTY_MIX:
+        excess = quotas[level] - available.get(level, 0)
+        if excess <= 0:
+            continue
+        quotas[level] -= excess
+        for other in FALLBACK[level]:
+            room = available.get(other, 0) - quotas[other]
+            moved = min(room, excess)
+            if moved > 0:
+                quotas[other] += moved
+                excess -= moved
+    return quotas
+
+
+class TopicBucket:
+    """One topic's MCQs in shuffled order, dealt front to back"""
+
+    def __init__(self, mcqs: List[Dict[str, Any]]):
+        self.mcqs = mcqs
+        self.cursor = 0
+
+    def reshuffle(self, rng: random.Random):
+        rng.shuffle(self.mcqs)
+        self.cursor = 0
+
+    def deal(self) -> Dict[str, Any]:
+        mcq = self.mcqs[self.cursor]
+        self.cursor += 1
+        return mcq
+
+
+class DifficultyBucket:
+    """A difficulty's topics, dealt round-robin so a quiz spreads across
+    topics (and so chapters) before repeating one.
+
+    A topic drops out of the rotation once it is used up; when every topic
+    has, all are reshuffled and the next cycle starts, so no MCQ comes round
+    twice before the whole difficulty has been dealt."""
+
+    def __init__(self, topics: Dict[Tuple[str, str], List[Dict[str, Any]]], rng: random.Random):
+        self.rng = rng
+        self.topics = [TopicBucket(mcqs) for mcqs in topics.values()]
+        self.size = sum(len(topic.mcqs) for topic in self.topics)
+        self.active: List[TopicBucket] = []
+        self.position = 0
+
+    def deal(self) -> Dict[str, Any]:
+        if not self.active:
+            for topic in self.topics:
+                topic.reshuffle(self.rng)
+            self.active = list(self.topics)
+            self.rng.shuffle(self.active)
+            self.position = 0
+
+        topic = self.active[self.position]
+        mcq = topic.deal()
+        if topic.cursor == len(topic.mcqs):
+            self.active.pop(self.position)
+        else:
+            self.position += 1
+        if self.position >= len(self.active):
+            self.position = 0
+        return mcq
+
+
+class QuizAssembler:
+    """Deals balanced quizzes for one subject.
+
+    Buckets are built once per subject; each quiz then costs O(size)
+    deals. A difficulty never deals more than it holds into one quiz, so
+    no quiz repeats an MCQ, and consecutive quizzes overlap only once a
+    difficulty's whole pool has been used."""
+
+    def __init__(self, chapters: List[Tuple[str, List[Dict[str, Any]]]], seed: Any = 0):
+        self.rng = random.Random(seed)
+        grouped: Dict[str, Dict[Tuple[str, str], List[Dict[str, Any]]]] = {}
+        for chapter, mcqs in chapters:
+            for mcq in mcqs:
+                level = str(mcq.get('difficulty', '')).lower()
+                if level not in DIFFICULTY_MIX:
+                    level = 'medium'
+                topic = (chapter, str(mcq.get('topic') or ''))
+                grouped.setdefault(level, {}).setdefault(topic, []).append(dict(mcq, chapter=chapter))
+
+        self.buckets = {level: DifficultyBucket(topics, self.rng) for level, topics in grouped.items()}
+        self.available = {level: bucket.size for level, bucket in self.buckets.items()}
+        self.total = sum(self.available.values())
+
+    def quiz(self, size: int) -> List[Dict[str, Any]]:
+        """One quiz of up to size MCQs, easiest first"""
+        quotas = difficulty_quotas(min(size, self.total), self.available)
+        mcqs = []
+        for level in DIFFICULTY_MIX:
+            dealt = set()  # A quiz straddling two cycles mustn't get the same MCQ from both
+            while len(dealt) < quotas[level]:
+                mcq = self.buckets[level].deal()
+                if id(mcq) not in dealt:
+                    dealt.add(id(mcq))
+                    mcqs.append(mcq)
+        return mcqs
+
+
+class QuizSetBuilder:
+    """Writes quizzes/<subject dir>/quiz-<n>.<hash>.json (with .gz) and an
+    index.json of every subject's quizzes, pruning quiz files it no longer lists"""
+
+    def __init__(self, output_dir: str, quiz_dir: str = None, seed: int = 0):
+        self.output_dir = output_dir
+        self.quiz_dir = quiz_dir or os.path.join(output_dir, QUIZ_DIR_NAME)
+        self.index_path = os.path.join(self.quiz_dir, 'index.json')
+        self.seed = seed
+
+    def chapters_by_subject(self) -> Dict[str, List[Tuple[str, List[Dict[str, Any]]]]]:
+        subjects: Dict[str, List[Tuple[str, List[Dict[str, Any]]]]] = {}
+        for filepath in chapter_files(self.output_dir):
+            dir_name = os.path.basename(os.path.dirname(filepath))
+            if not dir_name.endswith('_chapters'):
+                continue
+            mcqs = [mcq for mcq in load_chapter_file(filepath) if isinstance(mcq, dict)]
+            if mcqs:
+                chapter = os.path.basename(filepath)[:-len('_mcqs.json')]
+                subjects.setdefault(dir_name[:-len('_chapters')], []).append((chapter, mcqs))
+        return subjects
+
+    def build(self, quizzes_per_subject: int = 10, quiz_size: int = 20) -> Dict[str, Any]:
+        subjects = {}
+        live = {'index.json'}
+        for subject_dir, chapters in sorted(self.chapters_by_subject().items()):
+            assembler = QuizAssembler(chapters, seed=f"{self.seed}:{subject_dir}")
+            entries = []
+            for number in range(1, quizzes_per_subject + 1):
+                mcqs = assembler.quiz(quiz_size)
+                data = minify(mcqs)
+                relative = f"{subject_dir}/quiz-{number}.{content_hash(data)}.json"
+                path = os.path.join(self.quiz_dir, relative)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    write_atomic(path, data)
+                    write_atomic(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+                live.update((relative, f"{relative}.gz"))
+
+                difficulty = {}
+                for mcq in mcqs:
+                    level = str(mcq.get('difficulty', '')).lower()
+                    difficulty[level] = difficulty.get(level, 0) + 1
+                entries.append({
+                    'file': relative,
+                    'count': len(mcqs),
+                    'difficulty': difficulty,
+                    'chapters': sorted({mcq['chapter'] for mcq in mcqs}),
+                })
+            subjects[subject_dir] = {'pool': assembler.total, 'available': assembler.available, 'quizzes': entries}
+
+        index = {'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'subjects': subjects}
+        os.makedirs(self.quiz_dir, exist_ok=True)
+        write_atomic(self.index_path, json.dumps(index, ensure_ascii=False, indent=1).encode('utf-8'))
+
+        for root, dirs, names in os.walk(self.quiz_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.quiz_dir).replace(os.sep, '/') not in live:
+                    os.remove(path)
+        return index
+
+
+def main():
+    # mcq_quiz_builder.py [output_dir] [quizzes_per_subject] [quiz_size] [quiz_dir]
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else '/home/yaseen/ourbooks/mcq_output'
+    quizzes_per_subject = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    quiz_size = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    quiz_dir = sys.argv[4] if len(sys.argv) > 4 else None
+
+    print("📝 Balanced Quiz Builder")
+    print("=" * 40)
+
+    started = time.time()
+    builder = QuizSetBuilder(output_dir, quiz_dir)
+    index = builder.build(quizzes_per_subject, quiz_size)
+
+    for subject_dir, subject in index['subjects'].items():
+        quizzes = subject['quizzes']
+        chapters = sum(len(quiz['chapters']) for quiz in quizzes) / max(1, len(quizzes))
+        mix = ', '.join(f"{level} {count}" for level, count in sorted(subject['available'].items()))
+        print(f"• {subject_dir}: {len(quizzes)} quizzes from {subject['pool']} MCQs ({mix}), "
+              f"~{chapters:.1f} chapters per quiz")
+
+    print(f"\n✅ Built in {time.time() - started:.2f}s")
+    print(f"💾 Index: {builder.index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Persistent Response Cache for Gemini MCQ Requests
+Stores raw model output keyed by (PDF hash, prompt, model, generation config)
+in SQLite with size-bounded LRU eviction, so identical requests are skipped
+and parsing/formatting can be re-run offline
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Iterator
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of raw API responses"""
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                pdf_hash TEXT,
+                subject TEXT,
+                chapter TEXT,
+                batch INTEGER,
+                model TEXT,
+                prompt TEXT,
+                response TEXT,
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chapter ON responses(subject, chapter)")
+        self.conn.commit()
+
+        # Running size of the table, so a put doesn't sum every row; summed once here
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(pdf_hash: str, prompt: str, model: str,
+                 generation_config: Optional[Dict[str, Any]] = None, variant: Any = None) -> str:
+        """Cache key for a request.
+
+        `variant` separates requests that share a prompt but must not share an
+        answer, e.g. concurrent batches of the same chapter."""
+        payload = json.dumps({
+            'pdf': pdf_hash,
+            'prompt': prompt,
+            'model': model,
+            'config': generation_config or {},
+            'variant': variant,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response text and mark it recently used"""
+        with self._lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return row[0]
+
+    def put(self, key: str, response: str, pdf_hash: str = '', subject: str = '', chapter: str = '',
+            batch: int = 0, model: str = '', prompt: str = ''):
+        """Store a response, then evict least recently used entries over the size cap"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            replaced = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, pdf_hash, subject, chapter, batch, model, prompt, response, size, now, now)
+            )
+            self.total_bytes += size - (replaced[0] if replaced else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Another process may share the file, so the scan starts from the real total
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.total_bytes = total
+
+    def chapters(self) -> List[Dict[str, str]]:
+        """Every (subject, chapter) pair with cached responses"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT subject, chapter FROM responses ORDER BY subject, chapter"
+            ).fetchall()
+        return [{'subject': subject, 'chapter': chapter} for subject, chapter in rows]
+
+    def chapter_responses(self, subject: str, chapter: str, pdf_hash: Optional[str] = None) -> Iterator[str]:
+        """Latest cached response per batch of a chapter, in batch order; with pdf_hash,
+        only responses to that version of the chapter PDF"""
+        query = "SELECT batch, response FROM responses WHERE subject = ? AND chapter = ?"
+        params = [subject, chapter]
+        if pdf_hash is not None:
+            query += " AND pdf_hash = ?"
+            params.append(pdf_hash)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY batch ASC, created DESC", params).fetchall()
+
+        seen = set()
+        for batch, response in rows:
+            if batch in seen:
+                continue
+            seen.add(batch)
+            yield response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {'entries': count, 'bytes': total, 'max_bytes': self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
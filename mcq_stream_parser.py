@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Incremental MCQ JSON Parser
+Extracts each top-level MCQ object from a (possibly streamed, truncated or
+partly malformed) JSON array as soon as its closing brace arrives
+"""
+
+import re
+import json
+from typing import List, Dict, Any
+
+from mcq_latex import repair_json_escapes
+
+# Where an MCQ object plausibly begins, used to resynchronise after bad input
+OBJECT_START = re.compile(r'\{\s*"(?:id|question)"')
+
+
+class IncrementalMCQParser:
+    """Feed response text in chunks; get back every complete MCQ object.
+
+    A malformed object is counted in `skipped` and dropped, and scanning
+    resumes at the next object start instead of abandoning the response.
+    A trailing object cut off by max_output_tokens is simply never emitted."""
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0          # Next character of buffer to scan
+        self.start = -1       # Start of the object being scanned
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.parsed = 0
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Scan a new chunk and return the objects it completed"""
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+        i = self.pos
+
+        while i < len(buffer):
+            ch = buffer[i]
+            i += 1
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                if self.depth > 0:
+                    self.in_string = True
+            elif ch == '{':
+                if self.depth == 0:
+                    self.start = i - 1
+                self.depth += 1
+            elif ch == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    mcq = self.decode(buffer[self.start:i])
+                    if mcq is not None:
+                        completed.append(mcq)
+                    else:
+                        # Resynchronise at the next object start inside the bad span,
+                        # in case a stray quote or brace swallowed good objects
+                        match = OBJECT_START.search(buffer, self.start + 1, i)
+                        if match:
+                            i = match.start()
+                    self.start = -1
+
+        # Drop everything already consumed so the buffer stays small
+        keep_from = self.start if self.start >= 0 else len(buffer)
+        self.buffer = buffer[keep_from:]
+        self.pos = len(buffer) - keep_from
+        if self.start >= 0:
+            self.start = 0
+
+        return completed
+
+    def decode(self, text: str):
+        """Decode one object, with LaTeX backslashes repaired (\\text would otherwise decode as TAB + "ext")"""
+        for candidate in (repair_json_escapes(text), text):
+            try:
+                mcq = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(mcq, dict):
+                self.parsed += 1
+                return mcq
+
+        self.skipped += 1
+        return None
+
+    @property
+    def truncated(self) -> bool:
+        """True if the text ended in the middle of an object"""
+        return self.start >= 0
+
+    def parse_all(self, text: str) -> List[Dict[str, Any]]:
+        """Parse a complete response in one go"""
+        return self.feed(text)
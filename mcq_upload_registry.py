@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Upload Registry for Gemini File Handles
+Remembers which chapter PDFs are already uploaded under which API key so
+batches, boosts and re-runs reuse a live file instead of uploading again
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Tuple
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Short stable id for an API key, so raw keys never hit the disk"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class UploadRegistry:
+    """Persistent map of (PDF SHA-256, API key) -> remote file name and expiry"""
+
+    def __init__(self, registry_path: str, expiry_margin: int = 3600):
+        self.registry_path = registry_path
+        self.expiry_margin = expiry_margin  # Don't hand out files this close to expiring
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._hashes: Dict[Tuple[str, float, int], str] = {}
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._active: Dict[str, Any] = {}  # Handles confirmed ACTIVE during this process
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the registry from disk"""
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def save(self):
+        """Atomically write the registry to disk"""
+        os.makedirs(os.path.dirname(self.registry_path) or '.', exist_ok=True)
+        tmp_path = f"{self.registry_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.registry_path)
+
+    def pdf_hash(self, pdf_path: str) -> str:
+        """Content hash of a PDF, memoised on (path, mtime, size)"""
+        stat = os.stat(pdf_path)
+        cache_key = (os.path.abspath(pdf_path), stat.st_mtime, stat.st_size)
+        if cache_key not in self._hashes:
+            self._hashes[cache_key] = file_sha256(pdf_path)
+        return self._hashes[cache_key]
+
+    def entry_key(self, pdf_path: str, api_key: str) -> str:
+        return f"{self.pdf_hash(pdf_path)}:{key_fingerprint(api_key)}"
+
+    def upload_lock(self, client, pdf_path: str) -> threading.Lock:
+        """Lock serialising uploads of one PDF under one key, so concurrent batches share an upload"""
+        entry_key = self.entry_key(pdf_path, client.api_key)
+        with self._lock:
+            return self._upload_locks.setdefault(entry_key, threading.Lock())
+
+    def is_live(self, entry: Dict[str, Any]) -> bool:
+        return entry.get('expires', 0) - self.expiry_margin > time.time()
+
+    def lookup(self, client, pdf_path: str):
+        """Return a still-usable remote file for this PDF and key, or None"""
+        entry_key = self.entry_key(pdf_path, client.api_key)
+        with self._lock:
+            entry = self.entries.get(entry_key)
+
+        if not entry:
+            return None
+
+        if not self.is_live(entry):
+            self.forget(entry_key)
+            return None
+
+        if entry_key in self._active:
+            return self._active[entry_key]
+
+        try:
+            remote_file = client.get_file(entry['name'])
+        except Exception:
+            self.forget(entry_key)
+            return None
+
+        if remote_file.state.name not in ("ACTIVE", "PROCESSING"):
+            self.forget(entry_key)
+            return None
+
+        return remote_file
+
+    def record(self, client, pdf_path: str, remote_file):
+        """Remember a freshly uploaded file"""
+        expires = getattr(remote_file, 'expiration_time', None)
+        try:
+            expires_at = expires.timestamp()
+        except AttributeError:
+            expires_at = time.time() + 47 * 3600  # Gemini keeps files for 48 hours
+
+        entry_key = self.entry_key(pdf_path, client.api_key)
+        with self._lock:
+            self.entries[entry_key] = {
+                'name': remote_file.name,
+                'key': key_fingerprint(client.api_key),
+                'pdf': os.path.basename(pdf_path),
+                'uploaded': time.time(),
+                'expires': expires_at,
+            }
+            self.save()
+
+    def mark_active(self, client, pdf_path: str, remote_file):
+        """Remember that a file is ACTIVE so later lookups skip the remote check"""
+        self._active[self.entry_key(pdf_path, client.api_key)] = remote_file
+
+    def forget(self, entry_key: str):
+        """Drop an entry (expired, failed or deleted remotely)"""
+        with self._lock:
+            self._active.pop(entry_key, None)
+            if self.entries.pop(entry_key, None) is not None:
+                self.save()
+
+    def forget_file(self, remote_name: str):
+        """Drop whichever entry points at a remote file name"""
+        with self._lock:
+            stale = [k for k, e in self.entries.items() if e.get('name') == remote_name]
+            for entry_key in stale:
+                del self.entries[entry_key]
+                self._active.pop(entry_key, None)
+            if stale:
+                self.save()
+
+    def collect_garbage(self, client) -> int:
+        """Delete remote files of this key that the registry doesn't track as live.
+
+        These are uploads orphaned by crashes or exceptions that skipped
+        delete(), plus tracked files that are about to expire anyway."""
+        fingerprint = key_fingerprint(client.api_key)
+
+        with self._lock:
+            expired = [k for k, e in self.entries.items() if e.get('key') == fingerprint and not self.is_live(e)]
+            for entry_key in expired:
+                del self.entries[entry_key]
+                self._active.pop(entry_key, None)
+            if expired:
+                self.save()
+            live_names = {e['name'] for e in self.entries.values() if e.get('key') == fingerprint}
+
+        reclaimed = 0
+        for remote_file in client.list_files():
+            if remote_file.name in live_names:
+                continue
+            try:
+                client.delete_file(remote_file.name)
+                reclaimed += 1
+            except Exception as e:
+                print(f"⚠️ Could not delete {remote_file.name}: {e}")
+
+        return reclaimed
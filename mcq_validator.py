@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+MCQ Validator
+Checks parsed MCQs for the defects that used to force whole-chapter reruns
+(answer not among the options, fewer than 4 options, duplicate options,
+empty explanations, unbalanced $ delimiters), inline on every batch so
+rejects are refilled while the upload is live, or in bulk over mcq_output
+"""
+
+import os
+import re
+import sys
+import json
+from typing import List, Dict, Any, Tuple
+
+from mcq_dedup import chapter_files, load_chapter_file
+
+MIN_OPTIONS = 4
+
+# A $ not escaped as \$; $$ display math counts twice, so it balances like $
+DOLLAR = re.compile(r'(?<!\\)\$')
+
+
+def option_items(options) -> List[Tuple[str, str]]:
+    """(label, text) pairs from an options dict, or a list labelled A, B, ..."""
+    if isinstance(options, dict):
+        return [(str(label), '' if text is None else str(text)) for label, text in options.items()]
+    if isinstance(options, list):
+        return [(chr(ord('A') + i), '' if text is None else str(text)) for i, text in enumerate(options)]
+    return []
+
+
+def validate_mcq(mcq: Dict[str, Any]) -> List[str]:
+    """Problems with one MCQ; an empty list means it is usable"""
+    if not isinstance(mcq, dict):
+        return ['not_an_object']
+
+    problems = []
+    question = mcq.get('question')
+    if not isinstance(question, str) or not question.strip():
+        problems.append('empty_question')
+
+    options = option_items(mcq.get('options'))
+    if len(options) < MIN_OPTIONS:
+        problems.append('too_few_options')
+    if any(not text.strip() for _, text in options):
+        problems.append('empty_option')
+
+    # Case only matters inside math ($T_n$ and $t_n$ are different options)
+    normalised = [' '.join(text.split()) if '$' in text else ' '.join(text.split()).rstrip('.').casefold()
+                  for _, text in options]
+    if len(set(normalised)) < len(normalised):
+        problems.append('duplicate_options')
+
+    answer = str(mcq.get('correct_answer') or '').strip()
+    labels = {label for label, _ in options}
+    if answer not in labels and answer.upper() not in labels:
+        problems.append('answer_not_in_options')
+
+    explanation = mcq.get('explanation')
+    if not isinstance(explanation, str) or not explanation.strip():
+        problems.append('empty_explanation')
+
+    texts = [question, explanation] + [text for _, text in options]
+    if any(isinstance(text, str) and len(DOLLAR.findall(text)) % 2 for text in texts):
+        problems.append('unbalanced_latex')
+
+    return problems
+
+
+def validate_batch(mcqs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], List[str]]]]:
+    """Split a batch into (valid MCQs, [(rejected MCQ, problems)])"""
+    valid, rejected = [], []
+    for mcq in mcqs:
+        problems = validate_mcq(mcq)
+        if problems:
+            rejected.append((mcq, problems))
+        else:
+            valid.append(mcq)
+    return valid, rejected
+
+
+def problem_counts(rejected: List[Tuple[Dict[str, Any], List[str]]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for _, problems in rejected:
+        for problem in problems:
+            counts[problem] = counts.get(problem, 0) + 1
+    return counts
+
+
+def validate_tree(output_dir: str) -> Dict[str, Any]:
+    """Validate every chapter file under output_dir; returns totals and per-file rejects"""
+    report = {'files': 0, 'mcqs': 0, 'rejected': 0, 'problems': {}, 'by_file': {}}
+    for filepath in chapter_files(output_dir):
+        mcqs = load_chapter_file(filepath)
+        _, rejected = validate_batch(mcqs)
+
+        report['files'] += 1
+        report['mcqs'] += len(mcqs)
+        report['rejected'] += len(rejected)
+        for problem, count in problem_counts(rejected).items():
+            report['problems'][problem] = report['problems'].get(problem, 0) + count
+        if rejected:
+            label = os.path.relpath(filepath, output_dir).replace(os.sep, '/')
+            report['by_file'][label] = [
+                {'id': mcq.get('id') if isinstance(mcq, dict) else None, 'problems': problems}
+                for mcq, problems in rejected
+            ]
+    return report
+
+
+def main():
+    output_dir = next((arg for arg in sys.argv[1:] if not arg.startswith('--')), '/home/yaseen/ourbooks/mcq_output')
+
+    report = validate_tree(output_dir)
+    if '--json' in sys.argv:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print("🔎 MCQ Validator")
+    print("=" * 40)
+    for label, rejects in sorted(report['by_file'].items()):
+        print(f"• {label}: {len(rejects)} invalid")
+        for reject in rejects[:5]:
+            print(f"    - {reject['id']}: {', '.join(reject['problems'])}")
+        if len(rejects) > 5:
+            print(f"    ... and {len(rejects) - 5} more")
+
+    print(f"\n📊 {report['rejected']}/{report['mcqs']} MCQs invalid across {report['files']} files")
+    for problem, count in sorted(report['problems'].items(), key=lambda item: -item[1]):
+        print(f"• {problem}: {count}")
+
+
+if __name__ == "__main__":
+    main()
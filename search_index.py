@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Static Search Index Builder
+Crawls the chapter pages under *books/ and the MCQs in mcq_output, stems
+their text and writes a BM25-weighted inverted index split into term-prefix
+shards (with .gz and .br siblings), so search.html fetches the manifest and
+then only the shards and result blocks a query touches
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import math
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # .br siblings are skipped; pip install brotli to build them
+
+from mcq_dedup import chapter_files, load_chapter_file
+from mcq_bundle import content_hash, write_atomic
+from mcq_latex import latex_to_text
+from mcq_question_bank import SUBJECT_DIRS
+
+INDEX_DIR_NAME = 'search_index'
+MANIFEST_VERSION = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_BOOST = 3  # A title term counts as this many body terms
+WEIGHT_SCALE = 100  # Weights ship as integers
+
+PREFIX_LENGTH = 2  # Terms sharing a prefix always land in the same shard
+SHARD_BYTES = 32 * 1024  # Consecutive prefixes are packed into shards up to this size
+DOC_BLOCK = 256  # Result metadata is fetched in blocks of this many documents
+SNIPPET_LENGTH = 200
+
+TOKEN = re.compile(r'[^\W_]+')
+
+STOPWORDS = (
+    'a', 'about', 'above', 'after', 'again', 'all', 'also', 'an', 'and', 'any', 'are', 'as', 'at',
+    'be', 'because', 'been', 'before', 'being', 'between', 'both', 'but', 'by', 'can', 'could',
+    'did', 'do', 'does', 'each', 'for', 'from', 'further', 'had', 'has', 'have', 'having', 'he',
+    'her', 'here', 'his', 'how', 'if', 'in', 'into', 'is', 'it', 'its', 'just', 'may', 'more',
+    'most', 'no', 'nor', 'not', 'of', 'on', 'once', 'only', 'or', 'other', 'our', 'out', 'over',
+    'own', 'same', 'she', 'should', 'so', 'some', 'such', 'than', 'that', 'the', 'their', 'them',
+    'then', 'there', 'these', 'they', 'this', 'those', 'through', 'to', 'too', 'under', 'until',
+    'up', 'very', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'while', 'who', 'whom',
+    'why', 'will', 'with', 'would', 'you', 'your',
+)
+
+# A light Porter-style stemmer as data, shipped in the manifest so the page
+# stems queries exactly as the index was built. In each step the first
+# matching suffix decides; it is replaced only if what's left is at least
+# MIN_STEM characters and has a vowel
+STEM_STEPS = (
+    (('sses', 'ss'), ('ies', 'i'), ('ss', 'ss'), ('us', 'us'), ('is', 'is'), ('s', '')),
+    (('eed', 'ee'), ('ing', ''), ('ed', '')),
+    (('ational', 'ate'), ('ization', 'ize'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous'),
+     ('tional', 'tion'), ('bility', 'ble'), ('ation', 'ate'), ('alism', 'al'), ('ality', 'al'),
+     ('ivity', 'ive'), ('ement', ''), ('ment', ''), ('ness', ''), ('ical', 'ic'), ('ful', ''), ('ly', '')),
+    (('e', ''), ('y', 'i')),
+)
+MIN_STEM = 3
+VOWEL = re.compile(r'[aeiouy]')
+
+STOPWORD_SET = frozenset(STOPWORDS)
+
+# *books directory -> (subject, grade), from the mcq_output prefixes they mirror
+BOOK_DIRS = {f"{prefix.lower()}books": subject_grade for prefix, subject_grade in SUBJECT_DIRS.items()}
+
+
+def stem(token: str) -> str:
+    for step in STEM_STEPS:
+        for suffix, replacement in step:
+            if token.endswith(suffix):
+                base = token[:-len(suffix)]
+                if len(base) >= MIN_STEM and VOWEL.search(base):
+                    token = base + replacement
+                break
+    return token
+
+
+def tokenise(text: str) -> List[str]:
+    """Stemmed terms of text, without stopwords or single characters"""
+    return [stem(token) for token in TOKEN.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORD_SET]
+
+
+def snippet(text: str, length: int = SNIPPET_LENGTH) -> str:
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0] + '…'
+
+
+class ChapterPageParser(HTMLParser):
+    """Title, <main> text and first paragraph of a chapter page"""
+
+    SKIPPED = {'script', 'style', 'nav', 'noscript', 'template', 'svg'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.paragraph = ''
+        self.text: List[str] = []
+        self.in_title = False
+        self.in_main = 0
+        self.skipping = 0
+        self.paragraph_parts: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        elif tag == 'title':
+            self.in_title = True
+        elif tag == 'main':
+            self.in_main += 1
+        elif tag == 'p' and self.in_main and not self.paragraph:
+            self.paragraph_parts = []
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag == 'title':
+            self.in_title = False
+        elif tag == 'main':
+            self.in_main = max(0, self.in_main - 1)
+        elif tag == 'p' and self.paragraph_parts is not None:
+            self.paragraph = ' '.join(''.join(self.paragraph_parts).split())
+            self.paragraph_parts = None
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif self.in_main and not self.skipping:
+            self.text.append(data)
+            if self.paragraph_parts is not None:
+                self.paragraph_parts.append(data)
+
+
+class SearchIndexBuilder:
+    """Writes manifest.json, shards/<n>.<hash>.json and docs/<n>.<hash>.json under index_dir.
+
+    A shard maps each of its terms to a flat [doc delta, weight, ...]
+    postings list, weights being precomputed BM25 term scores, so a query
+    is scored by summing them. Shards and doc blocks are content-hashed
+    like the MCQ bundles: unchanged ones are reused and stale ones pruned."""
+
+    def __init__(self, root: str, output_dir: str = None, index_dir: str = None):
+        self.root = Path(root)
+        self.output_dir = output_dir or str(self.root / 'mcq_output')
+        self.index_dir = index_dir or str(self.root / INDEX_DIR_NAME)
+        self.manifest_path = os.path.join(self.index_dir, 'manifest.json')
+        self.docs: List[Dict[str, Any]] = []
+        self.written = 0
+        self.reused = 0
+
+    def add_document(self, url: str, title: str, body: str, subject: str, grade: str, kind: str, preview: str):
+        self.docs.append({
+            'url': url, 'title': title, 'subject': subject, 'grade': grade, 'kind': kind,
+            'snippet': snippet(preview), 'title_terms': tokenise(title), 'body_terms': tokenise(body),
+        })
+
+    def crawl_pages(self):
+        for book_dir in sorted(self.root.glob('*books')):
+            if not book_dir.is_dir() or book_dir.name not in BOOK_DIRS:
+                continue
+            subject, grade = BOOK_DIRS[book_dir.name]
+            for page in sorted(book_dir.glob('*.html'), key=lambda page: chapter_number(page.stem)):
+                parser = ChapterPageParser()
+                parser.feed(page.read_text(encoding='utf-8'))
+                title = ' '.join(parser.title.split()) or page.stem
+                body = latex_to_text(' '.join(parser.text))
+                self.add_document(page.relative_to(self.root).as_posix(),
+                                  f"{subject.title()} {grade} · {title}", body, subject, grade,
+                                  'chapter', latex_to_text(parser.paragraph) or body)
+
+    def crawl_mcqs(self):
+        for filepath in chapter_files(self.output_dir):
+            dir_name = os.path.basename(os.path.dirname(filepath))
+            prefix = dir_name[:-len('_chapters')]
+            if not dir_name.endswith('_chapters') or prefix not in SUBJECT_DIRS:
+                continue
+            subject, grade = SUBJECT_DIRS[prefix]
+            chapter = os.path.basename(filepath)[:-len('_mcqs.json')]
+            url = self.chapter_page(prefix, chapter)
+
+            for mcq in load_chapter_file(filepath):
+                if not isinstance(mcq, dict):
+                    continue
+                question = latex_to_text(str(mcq.get('question') or ''))
+                options = mcq.get('options') if isinstance(mcq.get('options'), dict) else {}
+                answer = latex_to_text(str(options.get(mcq.get('correct_answer'), '')))
+                explanation = latex_to_text(str(mcq.get('explanation') or ''))
+                body = ' '.join([question, answer, explanation, str(mcq.get('topic') or ''),
+                                 str(mcq.get('subtopic') or '')])
+                self.add_document(url, snippet(question, 120), body, subject, grade, 'mcq',
+                                  f"Answer: {answer}. {explanation}" if answer else explanation)
+
+    def chapter_page(self, prefix: str, chapter: str) -> str:
+        """The page an MCQ chapter was generated from (ch15_Homeostasis → biologyxiibooks/ch15.html),
+        or the subject's book directory if it has none"""
+        book_dir = f"{prefix.lower()}books"
+        match = re.match(r'ch\d+', chapter)
+        if match and (self.root / book_dir / f"{match.group(0)}.html").exists():
+            return f"{book_dir}/{match.group(0)}.html"
+        return f"{book_dir}/"
+
+    def postings(self) -> Dict[str, List[Tuple[int, int]]]:
+        """{term: [(doc, scaled BM25 weight), ...]} in doc order"""
+        lengths = [len(doc['body_terms']) + TITLE_BOOST * len(doc['title_terms']) for doc in self.docs]
+        average = sum(lengths) / max(1, len(lengths))
+
+        frequencies: Dict[str, Dict[int, int]] = {}
+        for number, doc in enumerate(self.docs):
+            for term in doc['body_terms']:
+                counts = frequencies.setdefault(term, {})
+                counts[number] = counts.get(number, 0) + 1
+            for term in doc['title_terms']:
+                counts = frequencies.setdefault(term, {})
+                counts[number] = counts.get(number, 0) + TITLE_BOOST
+
+        postings = {}
+        total = len(self.docs)
+        for term, counts in frequencies.items():
+            idf = math.log(1 + (total - len(counts) + 0.5) / (len(counts) + 0.5))
+            postings[term] = [
+                (number, max(1, round(WEIGHT_SCALE * idf * tf * (BM25_K1 + 1) /
+                                      (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[number] / average)))))
+                for number, tf in sorted(counts.items())
+            ]
+        return postings
+
+    def write_file(self, kind: str, name: str, value: Any) -> str:
+        """Write one minified, content-hashed file and its compressed siblings; returns its relative path"""
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        relative = f"{kind}/{name}.{content_hash(data)}.json"
+        path = os.path.join(self.index_dir, relative)
+        if os.path.exists(path) and os.path.exists(f"{path}.gz") and (brotli is None or os.path.exists(f"{path}.br")):
+            self.reused += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+            write_atomic(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write_atomic(f"{path}.br", brotli.compress(data, quality=11))
+            self.written += 1
+        return relative
+
+    def write_shards(self, postings: Dict[str, List[Tuple[int, int]]]) -> List[List[str]]:
+        """Pack term-prefix groups, in order, into shards; returns [[first prefix, file], ...]"""
+        groups: Dict[str, Dict[str, List[int]]] = {}
+        for term in sorted(postings):
+            flat, previous = [], 0
+            for number, weight in postings[term]:
+                flat.extend((number - previous, weight))
+                previous = number
+            groups.setdefault(term[:PREFIX_LENGTH], {})[term] = flat
+
+        shards, current, first, size = [], {}, None, 0
+        for prefix, terms in groups.items():
+            group_size = len(json.dumps(terms, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            if current and size + group_size > SHARD_BYTES:
+                shards.append([first, self.write_file('shards', str(len(shards)), current)])
+                current, size = {}, 0
+            if not current:
+                first = prefix
+            current.update(terms)
+            size += group_size
+        if current:
+            shards.append([first, self.write_file('shards', str(len(shards)), current)])
+        return shards
+
+    def build(self) -> Dict[str, Any]:
+        self.docs = []
+        self.crawl_pages()
+        self.crawl_mcqs()
+        postings = self.postings()
+
+        subjects = sorted({doc['subject'] for doc in self.docs})
+        blocks = [
+            self.write_file('docs', str(number // DOC_BLOCK),
+                            [[doc['url'], doc['title'], doc['subject'], doc['grade'], doc['kind'], doc['snippet']]
+                             for doc in self.docs[number:number + DOC_BLOCK]])
+            for number in range(0, len(self.docs), DOC_BLOCK)
+        ]
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'documents': len(self.docs),
+            'terms': len(postings),
+            'tokenizer': {
+                'stopwords': list(STOPWORDS),
+                'stem_steps': [[list(rule) for rule in step] for step in STEM_STEPS],
+                'min_stem': MIN_STEM,
+            },
+            'prefix_length': PREFIX_LENGTH,
+            'shards': self.write_shards(postings),
+            'doc_block': DOC_BLOCK,
+            'docs': blocks,
+            # One character per document: its subject's index in subjects, so filters need no doc blocks
+            'subjects': subjects,
+            'doc_subjects': ''.join(str(subjects.index(doc['subject'])) for doc in self.docs),
+        }
+        os.makedirs(self.index_dir, exist_ok=True)
+        write_atomic(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+        self.prune(manifest)
+        return manifest
+
+    def prune(self, manifest: Dict[str, Any]) -> int:
+        """Delete shards and doc blocks (and siblings) the manifest no longer references"""
+        live = {file for _, file in manifest['shards']} | set(manifest['docs'])
+        removed = 0
+        for root, dirs, names in os.walk(self.index_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.index_dir).replace(os.sep, '/')
+                shard = relative[:-3] if relative.endswith(('.gz', '.br')) else relative
+                if relative != 'manifest.json' and shard not in live:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+def chapter_number(name: str) -> Tuple[int, str]:
+    match = re.match(r'ch(\d+)', name)
+    return (int(match.group(1)) if match else sys.maxsize, name)
+
+
+def main():
+    # search_index.py [site_root] [index_dir]; index_dir defaults to <site_root>/search_index
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else '.').resolve()
+    index_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print("🔎 Static Search Index")
+    print("=" * 40)
+    if brotli is None:
+        print("⚠️ brotli not installed, skipping .br files. Run: pip install brotli")
+
+    started = time.time()
+    builder = SearchIndexBuilder(str(root), index_dir=index_dir)
+    manifest = builder.build()
+
+    kinds: Dict[str, int] = {}
+    for doc in builder.docs:
+        kinds[doc['kind']] = kinds.get(doc['kind'], 0) + 1
+    shard_bytes = [os.path.getsize(os.path.join(builder.index_dir, file)) for _, file in manifest['shards']]
+    gzip_bytes = sum(os.path.getsize(os.path.join(builder.index_dir, f"{file}.gz")) for _, file in manifest['shards'])
+
+    print(f"📄 {kinds.get('chapter', 0)} chapter pages, {kinds.get('mcq', 0)} MCQs, {manifest['terms']} terms")
+    print(f"📊 {len(shard_bytes)} shards: {sum(shard_bytes) / 1024:.0f} KB, {gzip_bytes / 1024:.0f} KB gzipped "
+          f"(largest {max(shard_bytes, default=0) / 1024:.0f} KB), {len(manifest['docs'])} doc blocks "
+          f"({builder.written} written, {builder.reused} unchanged) in {time.time() - started:.2f}s")
+    print(f"💾 Manifest: {builder.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
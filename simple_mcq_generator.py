@@ -5,9 +5,12 @@ A streamlined version for generating MCQs from PDF textbooks
 """
 
 import os
+import sys
 import json
 import time
-import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any
 
@@ -28,19 +31,81 @@ except ImportError:
     print("Run: pip install PyMuPDF")
     exit(1)
 
+from mcq_engine import ConcurrentMCQEngine, GeminiKeyClient, TokenBucket
+from mcq_key_pool import KeyPool, KeyUnavailable
+from mcq_upload_registry import UploadRegistry
+from mcq_response_cache import ResponseCache
+from mcq_job_journal import JobJournal
+from mcq_stream_parser import IncrementalMCQParser
+from mcq_dedup import MCQDedupIndex, index_corpus
+from mcq_batch_sizer import BatchSizeController, DEFAULT_OUTPUT_TOKEN_LIMIT
+from mcq_pdf_text import PDFTextExtractor
+from mcq_pdf_compress import PDFCompressor, COMPRESSION_VERSION
+from mcq_artifact_cache import ArtifactCache, is_derivative_pdf
+from mcq_metrics import MetricsRecorder, usage_tokens
+from mcq_file_waiter import FileStateWaiter
+from mcq_question_bank import QuestionBank, subject_grade, subject_key
+from mcq_combined_log import CombinedMCQLog
+from mcq_validator import validate_batch, problem_counts
+from mcq_latex import repair_json_escapes, normalise_mcq
+from mcq_identity import assign_ids, chapter_path, merge_chapter_file, describe
+
 
 class SimpleMCQGenerator:
-    def __init__(self, api_keys_file: str = "/home/yaseen/apikeys"):
+    def __init__(self, api_keys_file: str = "/home/yaseen/apikeys",
+                 cache_dir: str = '/home/yaseen/ourbooks/.mcq_cache'):
         self.api_keys = self.load_api_keys(api_keys_file)
-        self.current_key_index = 2  # Start with API key 3 (index 2)
+        self.current_key_index = None  # Chosen by the key pool in setup_gemini()
 
         # Configuration
         self.target_mcqs_per_subject = 500  # Generate minimum 500 MCQs per subject
         self.target_mcqs_per_chapter = 50   # Target MCQs per chapter
-        self.max_single_request = 5         # Maximum MCQs per API request (API limit)
-        self.max_requests_per_chapter = 10  # Maximum API requests per chapter
         self.max_pdf_size_mb = 19
-        self.api_delay = 3                  # Delay between API requests (seconds)
+        self.requests_per_minute = 10       # Per-key request budget (token bucket)
+        self.max_concurrency = 8            # Global cap on in-flight API calls
+        self.batches_per_round = 4          # Concurrent batches per chapter before resizing
+        self.model_name = 'gemini-1.5-flash'
+        self.generation_config = {}         # Model defaults; part of the response cache key
+        self.stream_responses = True        # Parse MCQs as they stream in
+        self.ingest_mode = 'upload'         # 'upload' the PDF, or send extracted 'text' per batch
+        self.text_section_chars = 16000     # Text per batch in text mode (~4k input tokens)
+        self.upload_prefetch = 2            # Upcoming chapters uploaded ahead in sequential runs
+        self.cache_dir = cache_dir
+
+        # Key health (invalid keys quarantined, throttled keys cooled down) persists across runs
+        self.key_pool = KeyPool(self.api_keys, os.path.join(self.cache_dir, 'key_pool.json'),
+                                self.model_name, self.generation_config)
+        # Uploaded PDFs are kept until they expire and reused across batches and runs
+        self.upload_registry = UploadRegistry(os.path.join(self.cache_dir, 'uploads.json'))
+        # Raw responses, so identical requests are skipped and parsing can be re-run offline
+        self.response_cache = ResponseCache(os.path.join(self.cache_dir, 'responses.sqlite3'))
+        # Completed batches and chapters, so interrupted runs resume where they stopped
+        self.journal = JobJournal(os.path.join(self.cache_dir, 'journal.jsonl'))
+        # Oversized chapters have their images downsampled in worker processes
+        self.compressor = PDFCompressor()
+        # Uploads are polled until ACTIVE with backoff rather than a fixed sleep
+        self.file_waiter = FileStateWaiter()
+        self._prefetch_executor = None
+        self._prefetched = set()
+        self._prefetch_lock = threading.Lock()
+        # Compressed PDFs are cached by source hash instead of written beside the books
+        self.artifact_cache = ArtifactCache(os.path.join(self.cache_dir, 'artifacts'))
+        # Chapter text extracted locally, for text ingest mode
+        self.text_extractor = PDFTextExtractor(os.path.join(self.cache_dir, 'text'))
+        # Near-duplicate questions are rejected at ingest, across chapters and the corpus
+        self.dedup_index = MCQDedupIndex()
+        self.dedup_output_dir = None
+        # MCQs per request (and requests per chapter) are learned per subject
+        self.batch_sizer = BatchSizeController(
+            os.path.join(self.cache_dir, 'batch_sizes.json'),
+            output_token_limit=self.generation_config.get('max_output_tokens', DEFAULT_OUTPUT_TOKEN_LIMIT),
+        )
+        # Per-phase timings, tokens and MCQ outcomes, as JSONL and a Prometheus textfile
+        self.metrics = MetricsRecorder(os.path.join(self.cache_dir, 'metrics.jsonl'),
+                                       os.path.join(self.cache_dir, 'metrics.prom'))
+        # Finished chapters are appended per subject and compacted into *_all_mcqs.json once
+        self.combined_logs: Dict[tuple, CombinedMCQLog] = {}
+        self._combined_logs_lock = threading.Lock()
 
         print(f"🔑 Loaded {len(self.api_keys)} API keys")
 
@@ -57,19 +122,23 @@ class SimpleMCQGenerator:
             print(f"❌ API keys file not found: {filepath}")
             return []
 
-    def setup_gemini(self):
-        """Setup Gemini with current API key"""
+    def setup_gemini(self, key_index: int = None):
+        """Setup Gemini with the healthiest API key (or the given one)"""
         if not self.api_keys:
             raise ValueError("No API keys available")
 
-        current_key = self.api_keys[self.current_key_index]
-        genai.configure(api_key=current_key)
+        self.current_key_index = self.key_pool.best_key() if key_index is None else key_index
+        self.client = self.key_pool.client(self.current_key_index)
+        self.limiter = TokenBucket(self.requests_per_minute)
         print(f"🔄 Using API key {self.current_key_index + 1}")
 
     def rotate_api_key(self):
-        """Rotate to next API key"""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        self.setup_gemini()
+        """Switch to the healthiest other API key"""
+        try:
+            key_index = self.key_pool.best_key(exclude={self.current_key_index})
+        except KeyUnavailable:
+            key_index = self.key_pool.best_key()
+        self.setup_gemini(key_index)
 
 
 
@@ -80,22 +149,26 @@ class SimpleMCQGenerator:
         if file_size_mb <= self.max_pdf_size_mb:
             return pdf_path
 
+        params = {'max_size_mb': self.max_pdf_size_mb, 'compression': COMPRESSION_VERSION}
+        entry = self.artifact_cache.lookup(pdf_path, params)
+        if entry:
+            print(f"♻️ Using cached compressed PDF ({entry['size'] / (1024 * 1024):.1f}MB)")
+            return self.artifact_cache.path(entry, entry['meta']['file'])
+
         print(f"📦 Compressing PDF ({file_size_mb:.1f}MB)...")
 
         try:
-            doc = fitz.open(pdf_path)
-            compressed_path = pdf_path.replace('.pdf', '_compressed.pdf')
-
-            doc.save(
-                compressed_path,
-                garbage=4,
-                deflate=True,
-                clean=True
-            )
-            doc.close()
-
-            new_size = os.path.getsize(compressed_path) / (1024 * 1024)
-            print(f"✅ Compressed to {new_size:.1f}MB")
+            work_dir = self.artifact_cache.work_dir(pdf_path, params)
+            compressed_path = os.path.join(work_dir, os.path.basename(pdf_path))
+            with self.metrics.phase('compress', pdf=os.path.basename(pdf_path)) as record:
+                result = self.compressor.compress(pdf_path, compressed_path, self.max_pdf_size_mb)
+                record.update(size_mb=round(result['size_mb'], 2), attempts=result['attempts'])
+            self.artifact_cache.store(pdf_path, params, {'file': os.path.basename(compressed_path)})
+
+            settings = f" (images at {result['dpi']} DPI, quality {result['quality']})" if result['dpi'] else ""
+            print(f"✅ Compressed to {result['size_mb']:.1f}MB{settings}")
+            if not result['fits']:
+                print(f"⚠️ Still above {self.max_pdf_size_mb}MB")
 
             return compressed_path
         except Exception as e:
@@ -108,75 +181,41 @@ class SimpleMCQGenerator:
         # Setup API
         self.setup_gemini()
 
-        # Compress PDF if needed
-        processed_pdf = self.compress_pdf(pdf_path)
+        # Compress PDF if needed (text mode never uploads it)
+        processed_pdf = pdf_path if self.ingest_mode == 'text' else self.compress_pdf(pdf_path)
 
         try:
-            # Upload PDF
-            print(f"📤 Uploading PDF: {os.path.basename(processed_pdf)}")
-            sample_file = genai.upload_file(processed_pdf)
-
-            # Wait for processing
-            print("⏳ Processing PDF...")
-            while sample_file.state.name == "PROCESSING":
-                time.sleep(2)
-                sample_file = genai.get_file(sample_file.name)
-
-            if sample_file.state.name != "ACTIVE":
-                raise ValueError(f"PDF processing failed: {sample_file.state.name}")
-
-            # Create model and generate MCQs
-            model = genai.GenerativeModel('gemini-1.5-flash')
-
             # Generate MCQs in multiple requests to reach target
             mcqs = []
             request_count = 0
-            max_requests = 15  # Maximum number of API requests
-            response = None
+            max_requests = self.batch_sizer.request_budget(subject, self.target_mcqs_per_chapter)
+            label = self.chapter_label(subject, chapter)
+            self.dedup_index.remove(label)
 
             while len(mcqs) < self.target_mcqs_per_chapter and request_count < max_requests:
                 request_count += 1
                 remaining_needed = self.target_mcqs_per_chapter - len(mcqs)
-                request_size = min(self.max_single_request, remaining_needed)
+                request_size = self.batch_sizer.request_size(subject, remaining_needed)
 
                 print(f"🎯 Request {request_count}: Generating {request_size} MCQs (Total needed: {remaining_needed})...")
 
-                if request_count == 1:
-                    prompt = self.create_mcq_prompt(subject, chapter)
-                else:
-                    prompt = self.create_additional_mcq_prompt(subject, chapter, request_size, len(mcqs))
-
-                response = model.generate_content([sample_file, prompt])
-
-                if response and response.text:
-                    batch_mcqs = self.parse_response(response.text, subject, chapter)
-                    mcqs.extend(batch_mcqs)
-                    print(f"✅ Request {request_count}: Got {len(batch_mcqs)} MCQs (Total: {len(mcqs)})")
-
-                    # Add delay between requests to avoid rate limits
-                    if request_count < max_requests and len(mcqs) < self.target_mcqs_per_chapter:
-                        print("⏳ Waiting 2 seconds before next request...")
-                        time.sleep(2)
-                else:
-                    print(f"❌ Request {request_count} failed")
-                    break
+                if not self.is_batch_cached(processed_pdf, subject, chapter, request_size, len(mcqs), request_count):
+                    self.key_pool.wait(self.current_key_index)
+                    self.limiter.acquire()
+                batch_mcqs = self.request_batch(self.client, processed_pdf, subject, chapter,
+                                                request_size, len(mcqs), request_count)
+                batch_mcqs = self.accept_batch(batch_mcqs, subject, chapter)
+                mcqs.extend(batch_mcqs)
+                print(f"✅ Request {request_count}: Got {len(batch_mcqs)} MCQs (Total: {len(mcqs)})")
 
             print(f"🏁 Generation complete: {len(mcqs)} MCQs generated in {request_count} requests")
 
-            # Clean up
-            sample_file.delete()
-
-            if response and response.text:
-                # Debug: Save raw response
-                with open(f'/home/yaseen/ourbooks/debug_raw_response_{chapter}.txt', 'w') as f:
-                    f.write(response.text)
-                print(f"💾 Saved raw response to debug_raw_response_{chapter}.txt")
-
-                mcqs = self.parse_response(response.text, subject, chapter)
-                return self.format_mcq_data(mcqs, subject, chapter)
-            else:
+            if not mcqs:
                 raise ValueError("No response from API")
 
+            # Raw responses are kept in the response cache (see rebuild_from_cache)
+            return self.format_mcq_data(mcqs, subject, chapter)
+
         except Exception as e:
             print(f"❌ Error generating MCQs: {e}")
             # Try with different API key
@@ -286,8 +325,12 @@ You have already generated {existing_count} MCQs, so focus on different topics a
 
 Generate the additional MCQs now. Return ONLY the JSON array, no additional text."""
 
-    def parse_response(self, response_text: str, subject: str, chapter: str) -> List[Dict[str, Any]]:
-        """Parse API response into structured format"""
+    def parse_response(self, response_text: str, subject: str, chapter: str,
+                       outcome: Dict[str, bool] = None) -> List[Dict[str, Any]]:
+        """Parse API response into structured format.
+
+        If given, outcome gets whether the response was truncated and whether
+        malformed objects had to be skipped, for the batch sizer"""
         try:
             # Clean the response text
             response_text = response_text.strip()
@@ -302,8 +345,7 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
 
             response_text = response_text.strip()
 
-            # Skip LaTeX fixing for now - Gemini returns properly formatted LaTeX
-            # response_text = self.fix_latex_in_json(response_text)
+            response_text = self.fix_latex_in_json(response_text)
 
             # Try to parse the entire response as JSON first
             try:
@@ -314,54 +356,23 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
                 else:
                     raise ValueError("Response is not a JSON array")
             except json.JSONDecodeError:
-                # If direct parsing fails, try to extract JSON array
-                print("⚠️ Direct JSON parsing failed, trying extraction...")
+                # Fall back to object-by-object extraction, which skips malformed
+                # objects and keeps every complete one before a truncation
+                print("⚠️ Direct JSON parsing failed, extracting objects incrementally...")
 
-                start_idx = response_text.find('[')
-                end_idx = response_text.rfind(']') + 1
+                parser = IncrementalMCQParser()
+                mcqs = parser.parse_all(response_text)
+                if outcome is not None:
+                    outcome.update(truncated=parser.truncated, salvaged=bool(parser.skipped))
 
-                if start_idx == -1:
-                    print(f"❌ No JSON array found in response")
+                if not mcqs:
+                    print(f"❌ No MCQ objects found in response")
                     print(f"Response preview: {response_text[:300]}...")
-                    raise ValueError("No JSON array found")
-
-                json_str = response_text[start_idx:end_idx]
-
-                # Skip LaTeX fixing for extracted JSON too
-                # json_str = self.fix_latex_in_json(json_str)
-
-                # Debug: Print the extracted JSON
-                print(f"📄 Extracted JSON length: {len(json_str)}")
-                print(f"📄 JSON preview: {json_str[:200]}...")
-
-                # Try to fix common JSON issues
-                json_str = json_str.strip()
+                    raise ValueError("No JSON objects found")
 
-                # If it ends with a comma before closing, remove it
-                if json_str.endswith(',]'):
-                    json_str = json_str[:-2] + ']'
-
-                try:
-                    mcqs = json.loads(json_str)
-                    print(f"✅ Successfully parsed {len(mcqs)} MCQs via extraction")
-                    return mcqs
-                except json.JSONDecodeError as e:
-                    print(f"❌ JSON parsing failed: {e}")
-                    print(f"Problem area: {json_str[max(0, 4110):4120]}...")
-
-                    # Try to salvage partial JSON
-                    try:
-                        # Find the last complete object
-                        last_complete = json_str.rfind('},') + 1
-                        if last_complete > 1:
-                            partial_json = json_str[:last_complete] + ']'
-                            partial_json = self.fix_latex_in_json(partial_json)
-                            mcqs = json.loads(partial_json)
-                            print(f"⚠️ Parsed partial JSON with {len(mcqs)} MCQs")
-                            return mcqs
-                    except Exception as salvage_error:
-                        print(f"❌ Could not salvage partial JSON: {salvage_error}")
-                        raise ValueError(f"Failed to parse JSON: {e}")
+                note = " (truncated)" if parser.truncated else ""
+                print(f"⚠️ Recovered {len(mcqs)} MCQs, skipped {parser.skipped} malformed{note}")
+                return mcqs
 
         except Exception as e:
             print(f"❌ Unexpected error in parse_response: {e}")
@@ -371,64 +382,18 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
         return []
 
     def fix_latex_in_json(self, text: str) -> str:
-        """Fix LaTeX expressions that cause JSON parsing issues"""
-        import re
-
-        # Replace problematic LaTeX commands with safe alternatives
-        replacements = {
-            r'\\times': '×',  # Multiplication symbol
-            r'\\frac{([^}]+)}{([^}]+)}': r'\1/\2',  # Simple fractions
-            r'\\text{([^}]+)}': r'\1',  # Remove text commands
-            r'\\mathrm{([^}]+)}': r'\1',  # Remove math roman
-            r'\\ce{([^}]+)}': r'\1',  # Remove chemistry expressions
-            r'\\Delta': 'Δ',  # Delta symbol
-            r'\\alpha': 'α',  # Alpha symbol
-            r'\\beta': 'β',   # Beta symbol
-            r'\\gamma': 'γ',  # Gamma symbol
-            r'\\delta': 'δ',  # Delta symbol
-            r'\\rightarrow': '→',  # Arrow
-            r'\\leftarrow': '←',  # Left arrow
-            r'\\leftrightarrow': '↔',  # Double arrow
-            r'\\pm': '±',     # Plus minus
-            r'\\approx': '≈', # Approximately equal
-            r'\\neq': '≠',    # Not equal
-            r'\\leq': '≤',    # Less than or equal
-            r'\\geq': '≥',    # Greater than or equal
-            r'\\infty': '∞',  # Infinity
-            r'\\pi': 'π',     # Pi
-            r'\\sigma': 'σ',  # Sigma
-            r'\\mu': 'μ',     # Mu
-            r'\\nu': 'ν',     # Nu
-            r'\\tau': 'τ',    # Tau
-            r'\\omega': 'ω',  # Omega
-            r'\\deg': '°',    # Degree
-            r'\\circ': '°',   # Circle (degree)
-            r'\\prime': "'",  # Prime
-            r'\\cdot': '·',   # Center dot
-            r'\\cdots': '...', # Center ellipsis
-            r'\\vdots': ':',  # Vertical ellipsis
-            r'\\ddots': '...', # Diagonal ellipsis
-        }
-
-        for pattern, replacement in replacements.items():
-            text = re.sub(pattern, replacement, text)
-
-        # Handle superscripts and subscripts (basic)
-        text = re.sub(r'\^\{([^}]+)\}', r'^\1', text)  # Remove braces from superscripts
-        text = re.sub(r'_\{([^}]+)\}', r'_\1', text)   # Remove braces from subscripts
+        """Escape LaTeX backslashes in a raw response so json.loads keeps them.
 
-        # Handle double backslashes that might cause issues
-        text = re.sub(r'\\\\', r'\\', text)
-
-        return text
+        One scan with mcq_latex's command table: \\text, \\frac or \\nu would
+        otherwise decode as a control character plus letters."""
+        return repair_json_escapes(text)
 
     def format_mcq_data(self, mcqs: List[Dict[str, Any]], subject: str, chapter: str) -> Dict[str, Any]:
         """Format MCQs into the expected data structure"""
         # Validate and enhance MCQs
         validated_mcqs = []
-        for i, mcq in enumerate(mcqs):
+        for mcq in assign_ids(subject, chapter, mcqs):
             # Ensure required fields
-            mcq['id'] = f"{subject.lower()}_xi_{chapter}_mcq_{str(i+1).zfill(3)}"
             mcq['question_type'] = 'multiple_choice'
             mcq['created_date'] = '2024-09-11'
             mcq['source'] = f"{chapter}.pdf"
@@ -448,19 +413,22 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
         }
 
     def save_mcqs(self, mcq_data: Dict[str, Any], output_dir: str):
-        """Save MCQs to JSON file"""
-        os.makedirs(output_dir, exist_ok=True)
-
-        subject_dir = os.path.join(output_dir, f"{mcq_data['subject'].lower()}_chapters")
-        os.makedirs(subject_dir, exist_ok=True)
+        """Merge MCQs into their chapter file by content id.
 
-        filename = f"{mcq_data['chapter']}_mcqs.json"
-        filepath = os.path.join(subject_dir, filename)
+        The file is only rewritten if an MCQ was added, changed or removed;
+        mcq_data['mcqs'] becomes the merged list and mcq_data['merge'] the report"""
+        filepath = chapter_path(output_dir, mcq_data['subject'], mcq_data['chapter'])
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(mcq_data['mcqs'], f, indent=2, ensure_ascii=False)
+        mcq_data['mcqs'], report = merge_chapter_file(filepath, mcq_data['subject'], mcq_data['chapter'],
+                                                      mcq_data['mcqs'])
+        mcq_data['total_mcqs'] = len(mcq_data['mcqs'])
+        mcq_data['merge'] = report
 
-        print(f"💾 Saved {mcq_data['total_mcqs']} MCQs to {filepath}")
+        if report['written']:
+            print(f"💾 Saved {mcq_data['total_mcqs']} MCQs to {filepath} ({describe(report)})")
+        else:
+            print(f"💾 {filepath} unchanged ({mcq_data['total_mcqs']} MCQs)")
+        return filepath
 
     def test_single_chapter(self):
         """Test with a single chapter"""
@@ -484,7 +452,7 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
             print(f"❌ Test failed: {e}")
             return False
 
-    def generate_subject_mcqs(self, subject: str, pdf_base_dir: str, output_dir: str):
+    def generate_subject_mcqs(self, subject: str, pdf_base_dir: str, output_dir: str) -> int:
         """Generate MCQs for an entire subject to reach 500+ MCQs"""
         print(f"🚀 STARTING MASSIVE MCQ GENERATION FOR {subject.upper()}")
         print(f"🎯 Target: {self.target_mcqs_per_subject} MCQs")
@@ -495,17 +463,18 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
         # Get all available chapters
         if not os.path.exists(pdf_base_dir):
             print(f"❌ PDF directory not found: {pdf_base_dir}")
-            return []
+            return 0
+
+        self.prepare_dedup_index(output_dir)
 
         chapters = []
-        for file in os.listdir(pdf_base_dir):
-            if file.endswith('.pdf'):
+        for file in sorted(os.listdir(pdf_base_dir)):
+            if file.endswith('.pdf') and not is_derivative_pdf(file):
                 chapter_name = file.replace('.pdf', '')
                 chapters.append(chapter_name)
 
         print(f"📚 Found {len(chapters)} chapters: {chapters[:5]}...")
 
-        all_mcqs = []
         total_generated = 0
         processed_chapters = 0
 
@@ -520,37 +489,37 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
             print(f"📊 Progress: {total_generated}/{self.target_mcqs_per_subject} MCQs")
 
             try:
+                resumed_mcqs = self.load_completed_chapter(pdf_path, subject, chapter)
+                if resumed_mcqs is not None:
+                    print(f"⏭️ Chapter {chapter}: already complete ({len(resumed_mcqs)} MCQs), resuming")
+                    self.append_combined(subject, chapter, resumed_mcqs, output_dir)
+                    total_generated += len(resumed_mcqs)
+                    processed_chapters += 1
+                    continue
+
+                # Upcoming chapters upload and process while this one generates
+                self.prefetch_uploads(subject, pdf_base_dir, chapters[i:i + self.upload_prefetch])
+
                 # Generate multiple batches for this chapter
                 chapter_mcqs = self.generate_chapter_batches(pdf_path, subject, chapter)
 
                 if chapter_mcqs:
                     chapter_count = len(chapter_mcqs)
-                    all_mcqs.extend(chapter_mcqs)
                     total_generated += chapter_count
                     processed_chapters += 1
 
                     print(f"✅ Chapter {chapter}: Generated {chapter_count} MCQs")
                     print(f"📊 Running total: {total_generated} MCQs")
 
-                    # Save individual chapter
-                    mcq_data = {
-                        'subject': subject,
-                        'chapter': chapter,
-                        'total_mcqs': chapter_count,
-                        'mcqs': chapter_mcqs
-                    }
-                    self.save_mcqs(mcq_data, output_dir)
+                    # Save individual chapter; it goes to the combined log and out of memory
+                    self.finish_chapter(pdf_path, subject, chapter, chapter_mcqs, output_dir)
+                    del chapter_mcqs
 
                     # Check if we've reached the target
                     if total_generated >= self.target_mcqs_per_subject:
                         print(f"🎉 TARGET REACHED: {total_generated} MCQs!")
                         break
 
-                    # Save combined results every 3 chapters
-                    if processed_chapters % 3 == 0:
-                        self.save_combined_mcqs(all_mcqs, subject, output_dir)
-                        print(f"💾 Saved combined results: {total_generated} MCQs so far")
-
                 else:
                     print(f"❌ Chapter {chapter}: No MCQs generated")
 
@@ -559,7 +528,9 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
                 continue
 
         # Final combined save
-        self.save_combined_mcqs(all_mcqs, subject, output_dir)
+        self.save_combined_mcqs(subject, output_dir)
+        self.stop_prefetch()
+        self.metrics.close()
 
         print(f"\\n🏁 SUBJECT GENERATION COMPLETE: {subject.upper()}")
         print(f"📊 Final Results:")
@@ -569,78 +540,592 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
         print(f"• Average per chapter: {total_generated / max(1, processed_chapters):.1f}")
         print(f"• Combined file: {output_dir}/{subject}_chapters/{subject}_all_mcqs.json")
 
-        return all_mcqs
+        return total_generated
+
+    async def generate_subject_mcqs_async(self, engine: ConcurrentMCQEngine, subject: str,
+                                          pdf_base_dir: str, output_dir: str) -> int:
+        """Generate MCQs for every chapter of a subject concurrently; returns the subject's MCQ count"""
+        if not os.path.exists(pdf_base_dir):
+            print(f"❌ PDF directory not found: {pdf_base_dir}")
+            return 0
+
+        chapters = sorted(file.replace('.pdf', '') for file in os.listdir(pdf_base_dir)
+                          if file.endswith('.pdf') and not is_derivative_pdf(file))
+        print(f"📚 {subject}: {len(chapters)} chapters queued from {pdf_base_dir}")
+
+        async def run_chapter(chapter: str):
+            pdf_path = os.path.join(pdf_base_dir, f"{chapter}.pdf")
+            resumed_mcqs = self.load_completed_chapter(pdf_path, subject, chapter)
+            if resumed_mcqs is not None:
+                print(f"⏭️ {subject} {chapter}: already complete ({len(resumed_mcqs)} MCQs)")
+                self.append_combined(subject, chapter, resumed_mcqs, output_dir)
+                return len(resumed_mcqs)
+
+            chapter_mcqs = await self.generate_chapter_batches_async(engine, pdf_path, subject, chapter)
+            if chapter_mcqs:
+                self.finish_chapter(pdf_path, subject, chapter, chapter_mcqs, output_dir)
+            return len(chapter_mcqs)
+
+        results = await asyncio.gather(*(run_chapter(chapter) for chapter in chapters), return_exceptions=True)
+
+        for chapter, result in zip(chapters, results):
+            if isinstance(result, Exception):
+                print(f"❌ Chapter {chapter}: Error - {result}")
+
+        total, _ = self.save_combined_mcqs(subject, output_dir)
+        print(f"🏁 {subject.upper()}: {total} MCQs from {len(chapters)} chapters")
+        return total
+
+    async def generate_corpus_async(self, engine: ConcurrentMCQEngine, subjects_config: List[Dict[str, str]],
+                                    output_dir: str) -> Dict[str, int]:
+        """Generate every configured subject in parallel.
+
+        XI and XII share a name, so each runs under its subject key
+        ('chemistryXII'): that keys its chapter files, dedup labels,
+        combined log, journal and ids apart from the other grade's"""
+        results = await asyncio.gather(*(
+            self.generate_subject_mcqs_async(engine, subject_key(config['name'], config['grade']),
+                                             config['pdf_dir'], output_dir)
+            for config in subjects_config
+        ), return_exceptions=True)
+
+        counts = {}
+        for config, result in zip(subjects_config, results):
+            subject_full = f"{config['name']} {config['grade']}"
+            if isinstance(result, Exception):
+                print(f"❌ {subject_full}: Error - {result}")
+                counts[subject_full] = 0
+            else:
+                counts[subject_full] = result
+        return counts
+
+    def generate_corpus(self, subjects_config: List[Dict[str, str]], output_dir: str) -> Dict[str, int]:
+        """Run the concurrent engine over all subjects and return MCQ counts"""
+        # Listing files probes every key, so invalid ones are quarantined before any chapter starts
+        self.collect_remote_garbage()
+        engine = ConcurrentMCQEngine(
+            self.key_pool,
+            requests_per_minute=self.requests_per_minute,
+            max_concurrency=self.max_concurrency,
+        )
+        healthy = sum(1 for i in range(len(self.api_keys)) if not self.key_pool.is_quarantined(i))
+        print(f"⚡ Concurrent engine: {healthy}/{len(engine.api_keys)} healthy keys, "
+              f"{self.requests_per_minute} req/min per key, {self.max_concurrency} in flight")
+        self.prepare_dedup_index(output_dir)
+        try:
+            return engine.run(self.generate_corpus_async(engine, subjects_config, output_dir))
+        finally:
+            engine.shutdown()
+            self.text_extractor.shutdown()
+            self.compressor.shutdown()
+            self.metrics.close()
+
+    def upload_chapter_pdf(self, client: GeminiKeyClient, pdf_path: str):
+        """Get an ACTIVE file handle for a chapter PDF, uploading only if no live one exists"""
+        sample_file = self.start_upload(client, pdf_path)
+        if sample_file.state.name == "PROCESSING":
+            print(f"⏳ Processing PDF: {os.path.basename(pdf_path)}...")
+            try:
+                with self.metrics.phase('processing_poll', key=client.key_index,
+                                        pdf=os.path.basename(pdf_path)) as record:
+                    sample_file, record['polls'] = self.file_waiter.wait(client.get_file, sample_file)
+            except Exception as e:
+                self.key_pool.record_failure(client.key_index, e)
+                raise
+        return self.finish_upload(client, pdf_path, sample_file)
+
+    async def upload_chapter_pdf_async(self, engine: ConcurrentMCQEngine, key_index: int, pdf_path: str):
+        """Upload a chapter and wait for it on the event loop, so PROCESSING holds no worker thread.
+
+        Chapters start their uploads as soon as they are scheduled, so later
+        chapters process while earlier ones generate."""
+        async def get_file(name: str):
+            return await engine.call(key_index, lambda client: client.get_file(name), rate_limited=False)
+
+        client = engine.client(key_index)
+        sample_file = await engine.call(key_index, self.start_upload, pdf_path, rate_limited=False)
+        if sample_file.state.name == "PROCESSING":
+            try:
+                with self.metrics.phase('processing_poll', key=key_index, pdf=os.path.basename(pdf_path)) as record:
+                    sample_file, record['polls'] = await self.file_waiter.wait_async(get_file, sample_file)
+            except Exception as e:
+                self.key_pool.record_failure(key_index, e)
+                raise
+        return self.finish_upload(client, pdf_path, sample_file)
+
+    def start_upload(self, client: GeminiKeyClient, pdf_path: str):
+        """Reuse or upload a chapter PDF; the returned handle may still be PROCESSING"""
+        with self.upload_registry.upload_lock(client, pdf_path):
+            try:
+                sample_file = self.upload_registry.lookup(client, pdf_path)
+                if sample_file is not None:
+                    print(f"♻️ Reusing uploaded PDF: {os.path.basename(pdf_path)} (key {client.key_index + 1})")
+                    return sample_file
+
+                print(f"📤 Uploading PDF: {os.path.basename(pdf_path)} (key {client.key_index + 1})")
+                with self.metrics.phase('upload', key=client.key_index, pdf=os.path.basename(pdf_path)):
+                    sample_file = client.upload_file(pdf_path)
+            except Exception as e:
+                self.key_pool.record_failure(client.key_index, e)
+                raise
+            self.upload_registry.record(client, pdf_path, sample_file)
+            return sample_file
+
+    def finish_upload(self, client: GeminiKeyClient, pdf_path: str, sample_file):
+        """Check that a file finished processing, and remember it as ACTIVE"""
+        if sample_file.state.name != "ACTIVE":
+            self.upload_registry.forget_file(sample_file.name)
+            raise ValueError(f"PDF processing failed: {sample_file.state.name}")
+
+        self.upload_registry.mark_active(client, pdf_path, sample_file)
+        return sample_file
+
+    def prefetch_uploads(self, subject: str, pdf_dir: str, chapters: List[str]):
+        """Upload upcoming chapters on the current key in the background, so their
+        PROCESSING overlaps this chapter's generation (sequential runs only)"""
+        if self.ingest_mode == 'text':
+            return
+        if not getattr(self, 'client', None):
+            self.setup_gemini()
+
+        with self._prefetch_lock:
+            for chapter in chapters:
+                pdf_path = os.path.join(pdf_dir, f"{chapter}.pdf")
+                prefetch_key = (self.current_key_index, pdf_path)
+                if prefetch_key in self._prefetched or not os.path.exists(pdf_path):
+                    continue
+                if self.load_completed_chapter(pdf_path, subject, chapter) is not None:
+                    continue
+
+                if self._prefetch_executor is None:
+                    self._prefetch_executor = ThreadPoolExecutor(max_workers=max(1, self.upload_prefetch),
+                                                                 thread_name_prefix='mcq-prefetch')
+                self._prefetched.add(prefetch_key)
+                self._prefetch_executor.submit(self.prefetch_upload, self.client, pdf_path)
+
+    def prefetch_upload(self, client: GeminiKeyClient, pdf_path: str):
+        try:
+            self.upload_chapter_pdf(client, pdf_path)
+        except Exception as e:
+            print(f"⚠️ Prefetch of {os.path.basename(pdf_path)} failed (will retry on use): {e}")
+
+    def stop_prefetch(self):
+        with self._prefetch_lock:
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=True)
+                self._prefetch_executor = None
+            self._prefetched.clear()
+
+    def collect_remote_garbage(self) -> int:
+        """Delete uploaded files the registry no longer tracks, for every healthy key"""
+        reclaimed = 0
+        for key_index in range(len(self.api_keys)):
+            if self.key_pool.is_quarantined(key_index):
+                continue
+            try:
+                count = self.upload_registry.collect_garbage(self.key_pool.client(key_index))
+            except Exception as e:
+                self.key_pool.record_failure(key_index, e)
+                print(f"⚠️ Key {key_index + 1}: garbage collection failed - {e}")
+                continue
+            if count:
+                print(f"🧹 Key {key_index + 1}: reclaimed {count} orphaned uploads")
+            reclaimed += count
+        return reclaimed
+
+    def batch_request(self, pdf_path: str, subject: str, chapter: str, request_size: int,
+                      existing_count: int, batch_num: int):
+        """Build the prompt and response-cache key for one batch"""
+        name, _ = subject_grade(subject)  # Prompts name the subject, not its key
+        if batch_num == 1:
+            # Sized like every other batch; asking for the whole chapter at once gets truncated
+            prompt = self.create_batch_mcq_prompt(name, chapter, request_size, 0)
+        else:
+            prompt = self.create_additional_mcq_prompt(name, chapter, request_size, existing_count)
+
+        if self.ingest_mode == 'text':
+            # The section text is part of the prompt, and so of the cache key
+            first_page, last_page, text = self.text_extractor.section_for_batch(
+                pdf_path, batch_num, self.text_section_chars
+            )
+            prompt = self.add_chapter_text(prompt, first_page, last_page, text)
+
+        pdf_hash = self.upload_registry.pdf_hash(pdf_path)
+        journaled = self.journal.completed_batch(subject, chapter, pdf_hash, batch_num)
+        if journaled and self.response_cache.contains(journaled['cache_key']):
+            # Resume with exactly the response this batch finished with last run
+            return prompt, journaled['cache_key']
+
+        cache_key = ResponseCache.make_key(pdf_hash, prompt, self.model_name, self.generation_config,
+                                           variant=batch_num)
+        return prompt, cache_key
+
+    def add_chapter_text(self, prompt: str, first_page: int, last_page: int, text: str) -> str:
+        """Attach an extracted page range to a prompt in place of the uploaded PDF"""
+        return f"""{prompt}
+
+**Chapter Content (pages {first_page}-{last_page}, extracted text in place of the PDF):**
+Base every question on this section only. Superscripts and subscripts appear as ^{{...}} and _{{...}}.
+
+{text}"""
+
+    def is_batch_cached(self, pdf_path: str, subject: str, chapter: str, request_size: int,
+                        existing_count: int, batch_num: int) -> bool:
+        """Whether a batch can be answered from the response cache (no API call needed)"""
+        _, cache_key = self.batch_request(pdf_path, subject, chapter, request_size, existing_count, batch_num)
+        return self.response_cache.contains(cache_key)
+
+    def request_batch(self, client: GeminiKeyClient, pdf_path: str, subject: str, chapter: str,
+                      request_size: int, existing_count: int, batch_num: int,
+                      sample_file=None) -> List[Dict[str, Any]]:
+        """Request one batch of MCQs, from the response cache or against the uploaded PDF.
+
+        sample_file is the chapter's ACTIVE upload on this client's key; without
+        it the PDF is uploaded (and waited for) here, on the calling thread."""
+        prompt, cache_key = self.batch_request(pdf_path, subject, chapter, request_size, existing_count, batch_num)
+
+        batch_mcqs = None
+        parse_seconds = 0.0  # Streamed responses are parsed while they generate
+        outcome = {'truncated': False, 'salvaged': False}
+        response_text = self.response_cache.get(cache_key)
+        cached = response_text is not None
+        if cached:
+            print(f"📦 {chapter} batch {batch_num}: cached response")
+        else:
+            if self.ingest_mode == 'text':
+                contents = [prompt]  # No upload or PROCESSING wait
+            else:
+                contents = [sample_file or self.upload_chapter_pdf(client, pdf_path), prompt]
+            started = time.time()
+
+            with self.metrics.phase('generate', subject=subject, chapter=chapter, batch=batch_num,
+                                    key=client.key_index, requested=request_size) as record:
+                with self.key_pool.track(client.key_index):
+                    if self.stream_responses:
+                        response_text, batch_mcqs, response, parse_seconds = self.stream_batch(
+                            client, contents, chapter, batch_num, outcome
+                        )
+                    else:
+                        response = client.generate_content(contents)
+                        response_text = response.text if response else ''
+                record['input_tokens'], record['output_tokens'] = usage_tokens(response)
+
+            if not response_text:
+                raise ValueError("No response from API")
+
+            seconds = time.time() - started
+            self.response_cache.put(
+                cache_key, response_text,
+                pdf_hash=self.upload_registry.pdf_hash(pdf_path), subject=subject, chapter=chapter,
+                batch=batch_num, model=self.model_name, prompt=prompt
+            )
+
+        parse_started = time.monotonic()
+        parse_error = None
+        try:
+            if not batch_mcqs:
+                batch_mcqs = self.parse_response(response_text, subject, chapter, outcome)
+        except ValueError as e:
+            parse_error = str(e)
+            raise
+        finally:
+            self.metrics.record('parse', parse_seconds + time.monotonic() - parse_started, error=parse_error,
+                                subject=subject, chapter=chapter, batch=batch_num,
+                                parsed=len(batch_mcqs or []), cached=cached)
+            if not cached:
+                self.observe_batch(subject, request_size, batch_mcqs or [], outcome, response, seconds)
+
+        pdf_hash = self.upload_registry.pdf_hash(pdf_path)
+        if not self.journal.completed_batch(subject, chapter, pdf_hash, batch_num):
+            self.journal.record_batch(subject, chapter, pdf_hash, batch_num, len(batch_mcqs),
+                                      response_text, cache_key)
+
+        return batch_mcqs
+
+    def stream_batch(self, client: GeminiKeyClient, contents: List[Any], chapter: str, batch_num: int,
+                     outcome: Dict[str, bool]):
+        """Stream one generation, extracting each MCQ as soon as its object closes.
+
+        Returns the full response text (for the cache), the MCQs parsed so
+        far, which include every complete object even if the output was cut
+        off at max_output_tokens, the last chunk (it carries usage metadata)
+        and the seconds spent parsing. outcome gets the parser's truncated
+        and salvaged flags."""
+        parser = IncrementalMCQParser()
+        chunks = []
+        mcqs = []
+        started = time.time()
+        parse_seconds = 0.0
+        chunk = None
+
+        for chunk in client.generate_content(contents, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunks carrying only a finish reason have no text
+            chunks.append(text)
+
+            parse_started = time.monotonic()
+            new_mcqs = parser.feed(text)
+            parse_seconds += time.monotonic() - parse_started
+            if new_mcqs and not mcqs:
+                print(f"⚡ {chapter} batch {batch_num}: first MCQ after {time.time() - started:.1f}s")
+            mcqs.extend(new_mcqs)
+
+        if parser.skipped or parser.truncated:
+            note = ", response truncated" if parser.truncated else ""
+            print(f"⚠️ {chapter} batch {batch_num}: skipped {parser.skipped} malformed MCQs{note}")
+        outcome.update(truncated=parser.truncated, salvaged=bool(parser.skipped))
+
+        return ''.join(chunks), mcqs, chunk, parse_seconds
+
+    def observe_batch(self, subject: str, request_size: int, batch_mcqs: List[Dict[str, Any]],
+                      outcome: Dict[str, bool], response, seconds: float):
+        """Feed one live response's token count, truncation and parse outcome to the batch sizer"""
+        usage = getattr(response, 'usage_metadata', None)
+        output_tokens = getattr(usage, 'candidates_token_count', None)
+
+        finish_reason = None
+        try:
+            finish_reason = response.candidates[0].finish_reason.name
+        except (AttributeError, IndexError, TypeError):
+            pass
+
+        # outcome comes from the parse the batch already had, streamed or whole
+        truncated = finish_reason == 'MAX_TOKENS' or outcome['truncated']
+        salvaged = outcome['salvaged']
+
+        self.batch_sizer.observe(subject, request_size, len(batch_mcqs), output_tokens,
+                                 truncated, salvaged, seconds)
+
+    def chapter_label(self, subject: str, chapter: str) -> str:
+        """Chapter file path relative to the output directory, used as its dedup label"""
+        return chapter_path('', subject, chapter)
+
+    def prepare_dedup_index(self, output_dir: str):
+        """Index every existing chapter file once, so new batches are checked against the corpus"""
+        if self.dedup_output_dir == output_dir:
+            return
+
+        started = time.time()
+        self.dedup_index = MCQDedupIndex()
+        duplicates = index_corpus(self.dedup_index, output_dir) if os.path.isdir(output_dir) else []
+        self.dedup_output_dir = output_dir
+        print(f"🔍 Dedup index: {len(self.dedup_index)} MCQs ({len(duplicates)} existing near-duplicates) "
+              f"in {time.time() - started:.2f}s")
+
+    def accept_batch(self, batch_mcqs: List[Dict[str, Any]], subject: str, chapter: str) -> List[Dict[str, Any]]:
+        """Normalise LaTeX, then drop invalid MCQs and near-duplicates of already accepted ones.
+
+        Rejects count against the batch, so the chapter loop asks for them
+        again while the chapter's upload is still live."""
+        with self.metrics.phase('validate', subject=subject, chapter=chapter) as record:
+            for mcq in batch_mcqs:
+                if isinstance(mcq, dict):
+                    normalise_mcq(mcq)
+            batch_mcqs, invalid = validate_batch(batch_mcqs)
+            record.update(accepted=len(batch_mcqs), rejected=len(invalid), problems=problem_counts(invalid))
+        if invalid:
+            problems = ', '.join(f"{problem} {count}" for problem, count in sorted(problem_counts(invalid).items()))
+            print(f"🚫 {chapter}: rejected {len(invalid)} invalid MCQs ({problems})")
+
+        with self.metrics.phase('dedup', subject=subject, chapter=chapter) as record:
+            accepted, rejected = self.dedup_index.filter_new(batch_mcqs, self.chapter_label(subject, chapter))
+            record.update(accepted=len(accepted), rejected=len(rejected))
+        if rejected:
+            print(f"♻️ {chapter}: rejected {len(rejected)} near-duplicate MCQs")
+        return accepted
+
+    def load_completed_chapter(self, pdf_path: str, subject: str, chapter: str):
+        """MCQs of a chapter the journal marks complete, or None if it still needs work"""
+        record = self.journal.completed_chapter(subject, chapter, self.upload_registry.pdf_hash(pdf_path))
+        if not record or not os.path.exists(record['output']):
+            return None
+
+        try:
+            with open(record['output'], 'r', encoding='utf-8') as f:
+                mcqs = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        return mcqs if isinstance(mcqs, list) else None
+
+    def finish_chapter(self, pdf_path: str, subject: str, chapter: str,
+                       chapter_mcqs: List[Dict[str, Any]], output_dir: str):
+        """Save a chapter's MCQs, append them to the subject's combined log and journal the chapter as complete"""
+        mcq_data = {
+            'subject': subject,
+            'chapter': chapter,
+            'total_mcqs': len(chapter_mcqs),
+            'mcqs': chapter_mcqs
+        }
+        with self.metrics.phase('save', subject=subject, chapter=chapter, accepted=len(chapter_mcqs)) as record:
+            filepath = self.save_mcqs(mcq_data, output_dir)
+            report = mcq_data['merge']
+            record.update(added=len(report['added']), changed=len(report['changed']),
+                          removed=len(report['removed']), unchanged=report['unchanged'])
+            self.append_combined(subject, chapter, mcq_data['mcqs'], output_dir)
+        self.journal.record_chapter(subject, chapter, self.upload_registry.pdf_hash(pdf_path),
+                                    mcq_data['total_mcqs'], filepath)
+
+    def rebuild_from_cache(self, subjects_config: List[Dict[str, str]], output_dir: str) -> int:
+        """Re-parse and re-save every configured chapter from cached responses, without calling the API.
+
+        Only responses for the chapter PDF as it is now count, under the
+        same subject key generation uses, and each batch goes through
+        accept_batch as it did when it was generated"""
+        self.prepare_dedup_index(output_dir)
+        total = 0
+        for config in subjects_config:
+            subject = subject_key(config['name'], config['grade'])
+            if not os.path.exists(config['pdf_dir']):
+                continue
+
+            for file in sorted(os.listdir(config['pdf_dir'])):
+                if not file.endswith('.pdf') or is_derivative_pdf(file):
+                    continue
+                chapter = file.replace('.pdf', '')
+                pdf_hash = self.upload_registry.pdf_hash(os.path.join(config['pdf_dir'], file))
+                self.dedup_index.remove(self.chapter_label(subject, chapter))
+
+                mcqs = []
+                for response_text in self.response_cache.chapter_responses(subject, chapter, pdf_hash):
+                    try:
+                        batch_mcqs = self.parse_response(response_text, subject, chapter)
+                    except ValueError as e:
+                        print(f"⚠️ {subject}/{chapter}: skipping unparseable response - {e}")
+                        continue
+                    mcqs.extend(self.accept_batch(batch_mcqs, subject, chapter))
+
+                if mcqs:
+                    self.save_mcqs(self.format_mcq_data(mcqs, subject, chapter), output_dir)
+                    total += len(mcqs)
+
+        print(f"🏁 Rebuilt {total} MCQs from cache ({self.response_cache.stats()['entries']} responses)")
+        return total
 
     def generate_chapter_batches(self, pdf_path: str, subject: str, chapter: str):
         """Generate multiple batches of MCQs for a single chapter"""
         print(f"🔄 Generating batches for {chapter}...")
 
-        # Upload PDF once for this chapter
-        try:
-            sample_file = genai.upload_file(pdf_path)
-            while sample_file.state.name == "PROCESSING":
-                time.sleep(2)
-                sample_file = genai.get_file(sample_file.name)
-
-            if sample_file.state.name != "ACTIVE":
-                print(f"❌ PDF processing failed: {sample_file.state.name}")
-                return []
-        except Exception as e:
-            print(f"❌ PDF upload failed: {e}")
-            return []
+        if not getattr(self, 'client', None):
+            self.setup_gemini()
 
+        # The PDF is uploaded on the first batch the response cache can't answer
         chapter_mcqs = []
         batch_num = 0
 
-        try:
-            while len(chapter_mcqs) < self.target_mcqs_per_chapter and batch_num < self.max_requests_per_chapter:
-                batch_num += 1
-                remaining_needed = self.target_mcqs_per_chapter - len(chapter_mcqs)
-                request_size = min(self.max_single_request, remaining_needed)
+        # This chapter's previous output is being replaced, so it can't count as a duplicate
+        label = self.chapter_label(subject, chapter)
+        self.dedup_index.remove(label)
+
+        max_requests = self.batch_sizer.request_budget(subject, self.target_mcqs_per_chapter)
+        while len(chapter_mcqs) < self.target_mcqs_per_chapter and batch_num < max_requests:
+            batch_num += 1
+            remaining_needed = self.target_mcqs_per_chapter - len(chapter_mcqs)
+            request_size = self.batch_sizer.request_size(subject, remaining_needed)
 
-                print(f"🎯 Batch {batch_num}: Requesting {request_size} MCQs (Chapter total: {len(chapter_mcqs)})")
+            print(f"🎯 Batch {batch_num}: Requesting {request_size} MCQs (Chapter total: {len(chapter_mcqs)})")
 
+            try:
+                if not self.is_batch_cached(pdf_path, subject, chapter, request_size, len(chapter_mcqs), batch_num):
+                    self.key_pool.wait(self.current_key_index)
+                    self.limiter.acquire()
+                batch_mcqs = self.request_batch(self.client, pdf_path, subject, chapter,
+                                                request_size, len(chapter_mcqs), batch_num)
+                accepted = self.accept_batch(batch_mcqs, subject, chapter)
+                chapter_mcqs.extend(accepted)
+                print(f"✅ Batch {batch_num}: Got {len(accepted)} MCQs")
+
+            except Exception as e:
+                print(f"❌ Batch {batch_num}: Error - {e}")
+                # Try with different API key (its own upload of the PDF is reused if live)
                 try:
-                    # Create model and generate
-                    model = genai.GenerativeModel('gemini-1.5-flash')
+                    self.rotate_api_key()
+                    print("🔄 Rotated to different API key")
+                except:
+                    break
 
-                    if batch_num == 1:
-                        prompt = self.create_mcq_prompt(subject, chapter)
-                    else:
-                        prompt = self.create_additional_mcq_prompt(subject, chapter, request_size, len(chapter_mcqs))
+        print(f"🏁 Chapter {chapter} complete: {len(chapter_mcqs)} MCQs in {batch_num} batches")
+        return chapter_mcqs
 
-                    response = model.generate_content([sample_file, prompt])
+    async def generate_chapter_batches_async(self, engine: ConcurrentMCQEngine, pdf_path: str,
+                                             subject: str, chapter: str) -> List[Dict[str, Any]]:
+        """Generate a chapter's MCQs with one concurrent task per batch.
 
-                    if response and response.text:
-                        batch_mcqs = self.parse_response(response.text, subject, chapter)
-                        chapter_mcqs.extend(batch_mcqs)
-                        print(f"✅ Batch {batch_num}: Got {len(batch_mcqs)} MCQs")
+        The uploaded file belongs to the key that uploaded it, so every batch
+        of a chapter runs on that key; other chapters spread across keys.
+        The file is left registered for reuse rather than deleted, and batches
+        answered from the response cache skip the rate limiter entirely. If the
+        key gets quarantined mid-chapter, the chapter moves to another key and
+        uploads there. Uploads are awaited here, never inside a batch, so no
+        worker thread blocks on PROCESSING."""
+        key_index = engine.pick_key()
+        print(f"🔄 Generating batches for {chapter} on key {key_index + 1}...")
 
-                        # Success - add delay before next batch
-                        if batch_num < self.max_requests_per_chapter:
-                            print(f"⏳ Waiting {self.api_delay} seconds...")
-                            time.sleep(self.api_delay)
-                    else:
-                        print(f"❌ Batch {batch_num}: No response")
-                        break
+        chapter_mcqs = []
+        batch_num = 0
+        label = self.chapter_label(subject, chapter)
+        self.dedup_index.remove(label)
+
+        sample_file = None  # The chapter's ACTIVE upload on key_index
+        try:
+            max_requests = self.batch_sizer.request_budget(subject, self.target_mcqs_per_chapter)
+            while len(chapter_mcqs) < self.target_mcqs_per_chapter and batch_num < max_requests:
+                if engine.key_pool.is_quarantined(key_index):
+                    engine.release_key(key_index)
+                    key_index = None
+                    key_index = engine.pick_key()
+                    sample_file = None  # Files are only visible to the key that uploaded them
+                    print(f"🔀 {chapter}: moved to key {key_index + 1}")
 
-                except Exception as e:
-                    print(f"❌ Batch {batch_num}: Error - {e}")
-                    # Try with different API key
+                remaining_needed = self.target_mcqs_per_chapter - len(chapter_mcqs)
+                existing_count = len(chapter_mcqs)
+
+                # Each round is sized from what the previous rounds taught the controller
+                batches = []
+                while (remaining_needed > 0 and batch_num + len(batches) < max_requests
+                       and len(batches) < self.batches_per_round):
+                    number = batch_num + len(batches) + 1
+                    request_size = self.batch_sizer.request_size(subject, remaining_needed)
+                    remaining_needed -= request_size
+                    cached = self.is_batch_cached(pdf_path, subject, chapter, request_size, existing_count, number)
+                    batches.append((number, request_size, cached))
+
+                if self.ingest_mode != 'text' and sample_file is None and not all(cached for *_, cached in batches):
                     try:
-                        self.rotate_api_key()
-                        print("🔄 Rotated to different API key")
-                        time.sleep(self.api_delay)
-                    except:
-                        break
+                        await engine.key_pool.wait_async(key_index)  # Don't retry into a cooldown
+                        sample_file = await self.upload_chapter_pdf_async(engine, key_index, pdf_path)
+                    except Exception as e:
+                        print(f"⚠️ {chapter}: upload failed - {e}")
+                        if not engine.key_pool.is_quarantined(key_index):
+                            batch_num = batches[-1][0]  # Retries spend the round, so they stay within budget
+                        continue  # Retried next round, on another key if this one was quarantined
+
+                tasks = []
+                for batch_num, request_size, cached in batches:
+                    tasks.append(engine.call(key_index, self.request_batch, pdf_path, subject, chapter,
+                                             request_size, existing_count, batch_num, sample_file,
+                                             rate_limited=not cached))
+
+                print(f"🎯 {chapter}: {len(tasks)} batches in flight (Chapter total: {existing_count})")
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                received = 0
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"❌ {chapter}: Batch error - {result}")
+                        continue
+                    chapter_mcqs.extend(self.accept_batch(result, subject, chapter))
+                    received += len(result)
+
+                if received == 0 and not engine.key_pool.is_quarantined(key_index):
+                    print(f"❌ {chapter}: No MCQs in this round, stopping")
+                    break
 
         finally:
-            # Clean up
-            try:
-                sample_file.delete()
-                print("🧹 Cleaned up PDF file")
-            except:
-                pass
+            if key_index is not None:
+                engine.release_key(key_index)
 
         print(f"🏁 Chapter {chapter} complete: {len(chapter_mcqs)} MCQs in {batch_num} batches")
         return chapter_mcqs
@@ -653,10 +1138,12 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
             print(f"❌ PDF directory not found: {pdf_dir}")
             return []
 
+        self.prepare_dedup_index(output_dir)
+
         # Get available chapters
         chapters = []
-        for file in os.listdir(pdf_dir):
-            if file.endswith('.pdf'):
+        for file in sorted(os.listdir(pdf_dir)):
+            if file.endswith('.pdf') and not is_derivative_pdf(file):
                 chapter_name = file.replace('.pdf', '')
                 chapters.append(chapter_name)
 
@@ -708,27 +1195,15 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
         return boost_mcqs
 
     def show_final_inventory(self, output_dir: str):
-        """Show final inventory of all MCQs"""
+        """Show final inventory of all MCQs, from the question bank"""
         print("\\n📊 FINAL MCQ INVENTORY:")
         print("=" * 50)
 
-        subjects = {}
-        total_mcqs = 0
-
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                if file.endswith('_mcqs.json'):
-                    subject = os.path.basename(root)
-                    filepath = os.path.join(root, file)
-
-                    try:
-                        with open(filepath, 'r') as f:
-                            data = json.load(f)
-                            count = len(data) if isinstance(data, list) else 0
-                            subjects[subject] = subjects.get(subject, 0) + count
-                            total_mcqs += count
-                    except:
-                        continue
+        bank = QuestionBank(os.path.join(self.cache_dir, 'question_bank.sqlite3'))
+        bank.sync(output_dir)
+        subjects = {f"{subject} {grade}": count for subject, grade, count in bank.counts('subject', 'grade')}
+        total_mcqs = sum(subjects.values())
+        bank.close()
 
         for subject, count in sorted(subjects.items()):
             target = 500
@@ -743,26 +1218,29 @@ Generate the additional MCQs now. Return ONLY the JSON array, no additional text
             deficit = overall_target - total_mcqs
             print(f"📈 {deficit} MCQs still needed to reach all targets")
 
-    def save_combined_mcqs(self, all_mcqs: List[Dict[str, Any]], subject: str, output_dir: str):
-        """Save combined MCQs from multiple chapters"""
-        if not all_mcqs:
-            return
+    def combined_log(self, subject: str, output_dir: str) -> CombinedMCQLog:
+        """The subject's combined segment log, one per (output_dir, subject)"""
+        key = (output_dir, subject)
+        with self._combined_logs_lock:
+            if key not in self.combined_logs:
+                self.combined_logs[key] = CombinedMCQLog(os.path.join(output_dir, f"{subject}_chapters"), subject)
+            return self.combined_logs[key]
 
-        subject_dir = os.path.join(output_dir, f"{subject}_chapters")
-        os.makedirs(subject_dir, exist_ok=True)
+    def append_combined(self, subject: str, chapter: str, chapter_mcqs: List[Dict[str, Any]], output_dir: str):
+        """Append a finished chapter to the subject's combined log"""
+        if chapter_mcqs:
+            self.combined_log(subject, output_dir).append(chapter, chapter_mcqs)
 
-        combined_data = {
-            'subject': subject,
-            'total_mcqs': len(all_mcqs),
-            'chapters_included': len(set(mcq.get('source', '').replace('.pdf', '') for mcq in all_mcqs)),
-            'mcqs': all_mcqs
-        }
+    def save_combined_mcqs(self, subject: str, output_dir: str):
+        """Compact the subject's combined log into {subject}_all_mcqs.json; returns (MCQs, chapters)"""
+        log = self.combined_log(subject, output_dir)
+        with self.metrics.phase('save', subject=subject, chapter='all') as record:
+            total, chapters = log.compact()
+            record['accepted'] = total
 
-        filepath = os.path.join(subject_dir, f"{subject}_all_mcqs.json")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(combined_data, f, indent=2, ensure_ascii=False)
-
-        print(f"💾 Combined MCQs saved: {filepath}")
+        if total:
+            print(f"💾 Combined MCQs saved: {log.combined_path} ({total} MCQs from {chapters} chapters)")
+        return total, chapters
 
 
 def main():
@@ -770,6 +1248,9 @@ def main():
     print("=" * 40)
 
     generator = SimpleMCQGenerator()
+    if '--text' in sys.argv:
+        # Send extracted page ranges instead of uploading each chapter PDF
+        generator.ingest_mode = 'text'
 
     if not generator.api_keys:
         print("❌ No API keys found. Please check /home/yaseen/apikeys")
@@ -864,30 +1345,12 @@ def main():
     print(f"📁 Output Directory: {output_dir}")
     print("=" * 50)
 
-    for config in subjects_config:
-        subject = config['name']
-        pdf_dir = config['pdf_dir']
-        grade = config['grade']
-        subject_full = f"{subject} {grade}"
-
-        print(f"\n🚀 STARTING: {subject_full.upper()}")
-        print("-" * 40)
-
-        try:
-            # Generate MCQs for this subject
-            mcqs = generator.generate_subject_mcqs(subject, pdf_dir, output_dir)
-
-            if mcqs:
-                count = len(mcqs)
-                print(f"✅ {subject_full}: Generated {count} MCQs")
-            else:
-                print(f"❌ {subject_full}: No MCQs generated")
-
-        except Exception as e:
-            print(f"❌ {subject_full}: Error - {e}")
-            import traceback
-            traceback.print_exc()
-            continue
+    counts = generator.generate_corpus(subjects_config, output_dir)
+    for subject_full, count in counts.items():
+        if count:
+            print(f"✅ {subject_full}: Generated {count} MCQs")
+        else:
+            print(f"❌ {subject_full}: No MCQs generated")
 
     # Show final inventory
     print("\n" + "=" * 60)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Incremental Sitemap Generator
+Walks the site for HTML pages (skipping node_modules and build output),
+hashes each page's rendered content and keeps the hashes in a state file,
+so <lastmod> only moves when a page really changed; splits into a sitemap
+index past the per-file URL limit, and a rerun with nothing changed only
+stats the pages
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import subprocess
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+from xml.sax.saxutils import escape
+
+BASE_URL = 'https://ourbooks.example.com/'
+STATE_VERSION = 1
+MAX_URLS = 50000  # Per sitemap file, as the protocol allows
+
+# Dependencies, build output and caches; hidden directories are skipped too
+EXCLUDED_DIRS = {'node_modules', 'dist', 'mcq_output', 'search_index', '__pycache__'}
+
+NOINDEX = re.compile(r'<meta[^>]+name=["\']robots["\'][^>]*noindex', re.I)
+
+# Markup that doesn't change what a visitor sees, stripped before hashing
+COMMENT = re.compile(r'<!--.*?-->', re.S)
+WHITESPACE = re.compile(r'\s+')
+
+# (path prefix, priority), first match wins
+PRIORITIES = (
+    ('index.html', '1.0'),
+    ('search.html', '0.8'),
+    ('pages/', '0.6'),
+    ('', '0.9'),  # Chapter pages
+)
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def rendered_hash(content: bytes) -> str:
+    """SHA-256 of a page with comments removed and whitespace collapsed"""
+    text = WHITESPACE.sub(' ', COMMENT.sub('', content.decode('utf-8', errors='replace'))).strip()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def natural_key(path: str) -> List[Any]:
+    """ch2 before ch10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def git_dates(root: str) -> Dict[str, str]:
+    """{relative path: date of the last commit touching it}, or {} outside a git checkout"""
+    try:
+        log = subprocess.run(['git', 'log', '--format=%x00%cs', '--name-only', '--no-renames'],
+                             cwd=root, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return {}
+    if log.returncode != 0:
+        return {}
+
+    dates: Dict[str, str] = {}
+    date = None
+    for line in log.stdout.splitlines():
+        if line.startswith('\0'):
+            date = line[1:]
+        elif line and date:
+            dates.setdefault(line, date)  # Newest commit first
+    return dates
+
+
+class SitemapGenerator:
+    """Keeps {page: {mtime_ns, size, hash, lastmod}} in state_path.
+
+    A page whose size and mtime match its state is not read. One that
+    differs is re-hashed, and only a different hash moves its lastmod (to
+    today); a page seen for the first time takes the date of its last
+    commit, falling back to its mtime. The sitemap files are rewritten
+    only if their content changes."""
+
+    def __init__(self, root: str, base_url: str = BASE_URL, state_path: str = None,
+                 max_urls: int = MAX_URLS):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/') + '/'
+        self.state_path = state_path or os.path.join(self.root, '.mcq_cache', 'sitemap.json')
+        self.max_urls = max_urls
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self._git_dates: Optional[Dict[str, str]] = None
+
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION and state.get('base_url') == self.base_url:
+                    self.pages = state.get('pages', {})
+            except (OSError, ValueError):
+                pass
+
+    def scan(self) -> Dict[str, os.stat_result]:
+        """{relative path: stat} of every HTML page under root"""
+        found = {}
+        for directory, dirs, names in os.walk(self.root):
+            dirs[:] = [name for name in dirs if name not in EXCLUDED_DIRS and not name.startswith('.')]
+            for name in names:
+                if name.endswith('.html'):
+                    path = os.path.join(directory, name)
+                    found[os.path.relpath(path, self.root).replace(os.sep, '/')] = os.stat(path)
+        return found
+
+    def first_seen_date(self, relative: str, stat: os.stat_result) -> str:
+        if self._git_dates is None:
+            self._git_dates = git_dates(self.root)
+        return self._git_dates.get(relative) or \
+            datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%Y-%m-%d')
+
+    def update(self) -> Dict[str, List[str]]:
+        """Bring the page state up to date; returns the added, changed and removed pages"""
+        report = {'added': [], 'changed': [], 'removed': [], 'touched': []}
+        found = self.scan()
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+        for relative in sorted(set(self.pages) - set(found)):
+            del self.pages[relative]
+            report['removed'].append(relative)
+
+        for relative, stat in sorted(found.items(), key=lambda item: natural_key(item[0])):
+            page = self.pages.get(relative)
+            if page and page['mtime_ns'] == stat.st_mtime_ns and page['size'] == stat.st_size:
+                continue
+
+            with open(os.path.join(self.root, relative), 'rb') as f:
+                content = f.read()
+            digest = rendered_hash(content)
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': digest,
+                     'noindex': bool(NOINDEX.search(content.decode('utf-8', errors='replace')))}
+
+            if page is None:
+                entry['lastmod'] = self.first_seen_date(relative, stat)
+                report['added'].append(relative)
+            elif page['hash'] != digest:
+                entry['lastmod'] = today
+                report['changed'].append(relative)
+            else:
+                entry['lastmod'] = page['lastmod']
+                report['touched'].append(relative)  # Saved or checked out again, same content
+            self.pages[relative] = entry
+        return report
+
+    def url(self, relative: str) -> str:
+        if relative == 'index.html':
+            return self.base_url
+        return self.base_url + relative
+
+    def urls(self) -> List[Tuple[str, str, str]]:
+        """(loc, lastmod, priority) of every indexable page, home page first"""
+        urls = []
+        for relative in sorted(self.pages, key=lambda path: (path != 'index.html', natural_key(path))):
+            page = self.pages[relative]
+            if page.get('noindex'):
+                continue
+            priority = next(value for prefix, value in PRIORITIES if relative.startswith(prefix))
+            urls.append((self.url(relative), page['lastmod'], priority))
+        return urls
+
+    def render(self) -> Dict[str, bytes]:
+        """{file name: XML}: sitemap.xml alone, or an index of sitemap-<n>.xml parts"""
+        urls = self.urls()
+        parts = [urls[start:start + self.max_urls] for start in range(0, len(urls), self.max_urls)] or [[]]
+
+        def urlset(part: List[Tuple[str, str, str]]) -> bytes:
+            lines = ['<?xml version="1.0" encoding="UTF-8"?>', f'<urlset xmlns="{SITEMAP_NS}">']
+            for loc, lastmod, priority in part:
+                lines.append(f'  <url><loc>{escape(loc)}</loc><lastmod>{lastmod}</lastmod>'
+                             f'<priority>{priority}</priority></url>')
+            lines.append('</urlset>')
+            return ('\n'.join(lines) + '\n').encode('utf-8')
+
+        if len(parts) == 1:
+            return {'sitemap.xml': urlset(parts[0])}
+
+        files = {}
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', f'<sitemapindex xmlns="{SITEMAP_NS}">']
+        for number, part in enumerate(parts, 1):
+            name = f"sitemap-{number}.xml"
+            files[name] = urlset(part)
+            lastmod = max(lastmod for _, lastmod, _ in part)
+            lines.append(f'  <sitemap><loc>{escape(self.base_url + name)}</loc><lastmod>{lastmod}</lastmod></sitemap>')
+        lines.append('</sitemapindex>')
+        files['sitemap.xml'] = ('\n'.join(lines) + '\n').encode('utf-8')
+        return files
+
+    def write(self, files: Dict[str, bytes]) -> List[str]:
+        """Write the sitemap files whose content changed and delete stale parts; returns the names written"""
+        written = []
+        for name, data in files.items():
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    if f.read() == data:
+                        continue
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            written.append(name)
+
+        for name in os.listdir(self.root):
+            if re.fullmatch(r'sitemap-\d+\.xml', name) and name not in files:
+                os.remove(os.path.join(self.root, name))
+        return written
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'base_url': self.base_url, 'pages': self.pages}, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def generate(self) -> Dict[str, Any]:
+        """Update the state and rewrite what changed; returns the page report and files written"""
+        report = self.update()
+        stale = report['added'] or report['changed'] or report['removed']
+        if stale or not os.path.exists(os.path.join(self.root, 'sitemap.xml')):
+            report['written'] = self.write(self.render())
+        else:
+            report['written'] = []
+        if stale or report['touched']:
+            self.save()
+        return report
+
+
+def main():
+    # sitemap.py [site_root] [base_url]
+    root = sys.argv[1] if len(sys.argv) > 1 else '.'
+    base_url = sys.argv[2] if len(sys.argv) > 2 else BASE_URL
+
+    print("🗺️ Sitemap Generator")
+    print("=" * 40)
+
+    started = time.time()
+    generator = SitemapGenerator(root, base_url)
+    report = generator.generate()
+
+    for kind in ('added', 'changed', 'removed'):
+        if report[kind]:
+            print(f"• {kind}: {', '.join(report[kind][:10])}" + (" ..." if len(report[kind]) > 10 else ""))
+    print(f"📊 {len(generator.urls())} URLs; {len(report['added'])} added, {len(report['changed'])} changed, "
+          f"{len(report['removed'])} removed in {(time.time() - started) * 1000:.0f} ms")
+    if report['written']:
+        print(f"💾 Wrote {', '.join(report['written'])}")
+    else:
+        print("✅ Sitemap unchanged")
+
+
+if __name__ == "__main__":
+    main()
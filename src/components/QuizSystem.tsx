@@ -31,13 +31,74 @@ interface MCQ {
   quality_score: number;
 }
 
+interface BundleEntry {
+  file: string;
+  count: number;
+  hash: string;
+  // 'mathml' when mcq_bundle.py pre-rendered every expression, so MathJax isn't needed
+  math?: 'mathml' | 'tex';
+}
+
+interface BundleManifest {
+  version: number;
+  subjects: { [subjectDir: string]: BundleEntry & { chapters: { [chapter: string]: BundleEntry } } };
+}
+
+const BUNDLE_BASE = '/mcq_output/bundles';
+let manifestPromise: Promise<BundleManifest | null> | null = null;
+
+// Written by mcq_bundle.py; the manifest is revalidated, the hashed shards it names never change
+const loadBundleManifest = (): Promise<BundleManifest | null> => {
+  if (!manifestPromise) {
+    manifestPromise = fetch(`${BUNDLE_BASE}/manifest.json`, { cache: 'no-cache' })
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null);
+  }
+  return manifestPromise;
+};
+
+interface QuizSetEntry {
+  file: string;
+  count: number;
+  difficulty: { [level: string]: number };
+  chapters: string[];
+}
+
+interface QuizSetIndex {
+  generated: string;
+  subjects: { [subjectDir: string]: { pool: number; quizzes: QuizSetEntry[] } };
+}
+
+const QUIZ_BASE = '/mcq_output/quizzes';
+
+// Written by mcq_quiz_builder.py: balanced cross-chapter tests, served as-is; one is picked at random
+const loadQuizSet = async (subjectDir: string): Promise<MCQ[]> => {
+  const indexResponse = await fetch(`${QUIZ_BASE}/index.json`, { cache: 'no-cache' });
+  if (!indexResponse.ok) {
+    throw new Error('Quiz index not found');
+  }
+  const index: QuizSetIndex = await indexResponse.json();
+  const quizzes = index.subjects[subjectDir]?.quizzes ?? [];
+  if (quizzes.length === 0) {
+    return [];
+  }
+  const quiz = quizzes[Math.floor(Math.random() * quizzes.length)];
+  const response = await fetch(`${QUIZ_BASE}/${quiz.file}`);
+  if (!response.ok) {
+    throw new Error('Quiz file not found');
+  }
+  return response.json();
+};
+
 interface QuizSystemProps {
   subject: string;
   chapter: string;
+  // A practice test across the subject's chapters instead of the chapter's MCQs
+  practiceTest?: boolean;
   onComplete?: (score: number, total: number) => void;
 }
 
-const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete }) => {
+const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, practiceTest = false, onComplete }) => {
   const [mcqs, setMcqs] = useState<MCQ[]>([]);
   const [currentQuestion, setCurrentQuestion] = useState(0);
   const [selectedAnswer, setSelectedAnswer] = useState<string>('');
@@ -48,6 +109,8 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
   const [quizStarted, setQuizStarted] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string>('');
+  // null until the MCQs are loaded and we know whether their maths is pre-rendered
+  const [mathPrerendered, setMathPrerendered] = useState<boolean | null>(null);
 
   // Load MCQs from JSON file
   useEffect(() => {
@@ -67,14 +130,29 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
         };
 
         const subjectDir = subjectMap[subject] || subject;
-        const response = await fetch(`/mcq_output/${subjectDir}_chapters/${chapter}_mcqs.json`);
+        if (practiceTest) {
+          setMcqs(await loadQuizSet(subjectDir));
+          setMathPrerendered(false);
+          setError('');
+          return;
+        }
+
+        const manifest = await loadBundleManifest();
+        const shard = manifest?.subjects[subjectDir]?.chapters[chapter];
+        // Fall back to the pretty-printed chapter file when no bundle has been built
+        const url = shard
+          ? `${BUNDLE_BASE}/${shard.file}`
+          : `/mcq_output/${subjectDir}_chapters/${chapter}_mcqs.json`;
+        const response = await fetch(url);
         if (!response.ok) {
           throw new Error('MCQ file not found');
         }
         const data = await response.json();
         setMcqs(data);
+        setMathPrerendered(shard?.math === 'mathml');
         setError('');
       } catch (err) {
+        setMathPrerendered(false);
         setError('Failed to load MCQs. Please try again.');
         console.error('Error loading MCQs:', err);
       } finally {
@@ -82,13 +160,17 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
       }
     };
 
-    if (subject && chapter) {
+    if (subject && (chapter || practiceTest)) {
       loadMCQs();
     }
-  }, [subject, chapter]);
+  }, [subject, chapter, practiceTest]);
 
-  // Initialize MathJax for LaTeX rendering
+  // Initialize MathJax for LaTeX rendering, unless the bundle already carries MathML
   useEffect(() => {
+    if (mathPrerendered !== false) {
+      return;
+    }
+
     const initializeMathJax = () => {
       // Load MathJax if not already loaded
       if (!window.MathJax && !document.querySelector('script[src*="mathjax"]')) {
@@ -136,7 +218,7 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
     };
 
     initializeMathJax();
-  }, []);
+  }, [mathPrerendered]);
 
   // Trigger MathJax typesetting when question changes or explanation is shown
   useEffect(() => {
@@ -246,7 +328,7 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
       <Card className="w-full max-w-4xl mx-auto">
         <CardContent className="p-8 text-center">
           <BookOpen className="h-12 w-12 text-gray-400 mx-auto mb-4" />
-          <p>No MCQs available for this chapter.</p>
+          <p>No MCQs available for this {practiceTest ? 'subject' : 'chapter'}.</p>
         </CardContent>
       </Card>
     );
@@ -256,7 +338,7 @@ const QuizSystem: React.FC<QuizSystemProps> = ({ subject, chapter, onComplete })
     return (
       <Card className="w-full max-w-4xl mx-auto">
         <CardHeader>
-          <CardTitle className="text-center">Quiz: {subject} - {chapter}</CardTitle>
+          <CardTitle className="text-center">Quiz: {subject} - {practiceTest ? 'Practice Test' : chapter}</CardTitle>
         </CardHeader>
         <CardContent className="text-center space-y-4">
           <div className="grid grid-cols-2 gap-4 text-sm">
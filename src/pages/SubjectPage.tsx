@@ -12,7 +12,7 @@ const SubjectPage: React.FC = () => {
   const { subject } = useParams<{ subject: string }>();
   const navigate = useNavigate();
   const [selectedChapter, setSelectedChapter] = useState<string>('');
-  const [viewMode, setViewMode] = useState<'chapters' | 'quiz' | 'chapter'>('chapters');
+  const [viewMode, setViewMode] = useState<'chapters' | 'quiz' | 'test' | 'chapter'>('chapters');
 
   // Chapter data for each subject
   const chapterData: { [key: string]: string[] } = {
@@ -112,6 +112,15 @@ const SubjectPage: React.FC = () => {
                 <Play className="h-4 w-4 sm:mr-2" />
                 <span className="hidden sm:inline">Quiz</span>
               </Button>
+              <Button
+                variant={viewMode === 'test' ? 'secondary' : 'ghost'}
+                onClick={() => setViewMode('test')}
+                className="text-white hover:bg-white/20 flex-1 sm:flex-none"
+                size="sm"
+              >
+                <Trophy className="h-4 w-4 sm:mr-2" />
+                <span className="hidden sm:inline">Test</span>
+              </Button>
             </div>
           </div>
         </div>
@@ -169,6 +178,15 @@ const SubjectPage: React.FC = () => {
           />
         )}
 
+        {viewMode === 'test' && (
+          <QuizSystem
+            subject={subject}
+            chapter=""
+            practiceTest
+            onComplete={handleQuizComplete}
+          />
+        )}
+
         {viewMode === 'chapter' && selectedChapter && (
           <ChapterViewer
             subject={subject}